@@ -1,4 +1,6 @@
-from dataCollection import periodicTable
+from dataCollection import getElementTable
+
+import numpy as np
 
 class Bond:
     def __init__(self, atom1_idx, atom2_idx, atoms, order = 1):
@@ -21,22 +23,142 @@ class Bond:
         raise ValueError("Atom not in bond")
     
     def bondLength(self):
-        firstAtom = periodicTable[self.atoms[self.a]]
-        secondAtom = periodicTable[self.atoms[self.b]]
+        table = getElementTable()
+        firstRadius = table.radius[table.index[self.atoms[self.a]]]
+        secondRadius = table.radius[table.index[self.atoms[self.b]]]
 
-        return (firstAtom[1] + secondAtom[1]) * (1.1 - .1 * self.order)
+        return float(firstRadius + secondRadius) * (1.1 - .1 * self.order)
 
     def __repr__(self):
         return f"Bond({self.a}, {self.b}, order={self.order})"
 
-bond = Bond(0, 1, ["C", "C"], order = 1)
+def bondLengths(numbers, a, b, order):
+    # Estimated lengths (r_a + r_b) * (1.1 - .1 * order) for whole arrays of bonds, as in Bond.bondLength
+    radius = getElementTable().radius
+    numbers = np.asarray(numbers)
+    return (radius[numbers[a]] + radius[numbers[b]]) * (1.1 - .1 * np.asarray(order))
+
+class BondTable:
+    # Structure-of-arrays storage for the bonds of one structure: contiguous a, b and order
+    # arrays, an (n_bonds, 3) direction array (the angleFromCentral vectors) and lengths that
+    # are computed once for the whole table. Iterating or indexing gives BondViews, which behave
+    # like Bond objects but store nothing of their own.
+    def __init__(self, a, b, order, atoms, directions=None, lengths=None):
+        self.a = np.array(a, dtype=np.int32).reshape(-1)
+        self.b = np.array(b, dtype=np.int32).reshape(-1)
+        self.order = np.array(order, dtype=np.int32).reshape(-1)
+        self.atoms = atoms  # element symbols, shared by every bond
+        self.directions = np.zeros((len(self.a), 3)) if directions is None else np.array(directions, dtype=float).reshape(-1, 3)  # unit vectors a -> b
+        self._lengths = None if lengths is None else np.array(lengths, dtype=float).reshape(-1)
+        self.measured = lengths is not None  # measured lengths do not change with the bond order
+
+    @classmethod
+    def fromBonds(cls, bonds, atoms, directions=None, lengths=None):
+        # From (a, b, order) rows, e.g. a Lewis snapshot's bonds or a bondPerception array
+        bonds = np.asarray(bonds, dtype=np.int64).reshape(-1, 3)
+        return cls(bonds[:, 0], bonds[:, 1], bonds[:, 2], atoms, directions, lengths)
+
+    @classmethod
+    def fromCoordinates(cls, bonds, atoms, coords):
+        # Directions and lengths measured from (n_atoms, 3) coordinates instead of estimated
+        bonds = np.asarray(bonds, dtype=np.int64).reshape(-1, 3)
+        coords = np.asarray(coords, dtype=float)
+        vectors = coords[bonds[:, 1]] - coords[bonds[:, 0]]
+        lengths = np.linalg.norm(vectors, axis=1)
+        return cls.fromBonds(bonds, atoms, vectors / np.maximum(lengths, 1e-12)[:, None], lengths)
+
+    def __len__(self):
+        return len(self.a)
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"bond {i} out of range for {len(self)} bonds")
+        return BondView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield BondView(self, i)
+
+    @property
+    def lengths(self):
+        if self._lengths is None:
+            self._lengths = bondLengths(getElementTable().indices(self.atoms), self.a, self.b, self.order)
+        return self._lengths
+
+    def rows(self):
+        # ((a, b, order), ...) as plain ints
+        return tuple(zip(self.a.tolist(), self.b.tolist(), self.order.tolist()))
+
+    def freeze(self):
+        # Makes every array read-only, for tables shared through memoized snapshots
+        for array in (self.a, self.b, self.order, self.directions, self.lengths):
+            array.flags.writeable = False
+        return self
+
+    def copy(self):
+        table = BondTable(self.a, self.b, self.order, self.atoms, self.directions, self._lengths)
+        table.measured = self.measured
+        return table
+
+    def anglesAt(self, center):
+        # All angles between the bonds of atom `center`, from one matrix product of the unit directions.
+        # Returns the bond indices (k,) and a (k, k) matrix of angles in degrees.
+        involved = (self.a == center) | (self.b == center)
+        bonds = np.arange(len(self)) if involved.all() else np.flatnonzero(involved)
+        unit = self.directions[bonds] * np.where(self.a[bonds] == center, 1.0, -1.0)[:, None]  # pointing away from center
+        return bonds, np.degrees(np.arccos(np.clip(unit @ unit.T, -1.0, 1.0)))
+
+class BondView:
+    # One row of a BondTable with the Bond interface; attribute writes go to the table
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def a(self):
+        return int(self.table.a[self.index])
+
+    @property
+    def b(self):
+        return int(self.table.b[self.index])
 
-print(bond.bondLength())
+    @property
+    def order(self):
+        return int(self.table.order[self.index])
 
-bond = Bond(0, 1, ["C", "C"], order = 2)
+    @order.setter
+    def order(self, order):
+        self.table.order[self.index] = order
+        if not self.table.measured:
+            self.table._lengths = None  # estimated lengths depend on the order
 
-print(bond.bondLength())
+    @property
+    def atoms(self):
+        return self.table.atoms
 
-bond = Bond(0, 1, ["C", "C"], order = 3)
+    @property
+    def angleFromCentral(self):
+        return self.table.directions[self.index]
 
-print(bond.bondLength())
\ No newline at end of file
+    @angleFromCentral.setter
+    def angleFromCentral(self, direction):
+        self.table.directions[self.index] = direction
+
+    def involves(self, idx):
+        return self.a == idx or self.b == idx
+
+    def other(self, idx):
+        if self.a == idx:
+            return self.b
+        elif self.b == idx:
+            return self.a
+        raise ValueError("Atom not in bond")
+
+    def bondLength(self):
+        return float(self.table.lengths[self.index])
+
+    def __repr__(self):
+        return f"Bond({self.a}, {self.b}, order={self.order})"
@@ -1,15 +1,52 @@
-from dataCollection import periodicTable
+from dataCollection import getElementTable
+import instrumentation
+from types import MappingProxyType
+from functools import lru_cache
 
 class Compound:
     def __init__(self, equation):
-        self.charge = 0  # Default charge is 0 for neutral compounds
-        self.equation = equation
-        self.elements = self.parseElements(equation)
+        self.equation = equation  # parsing happens lazily, see elements/charge
 
-        self.elements.setdefault("e-", 0)
-        self.charge = - self.elements["e-"]
+    # Derived stages are memoized in self._cache and dropped whenever the formula changes
+    @property
+    def equation(self):
+        return self._equation
 
-        del self.elements["e-"]
+    @equation.setter
+    def equation(self, equation):
+        self._equation = equation
+        self.invalidate()
+
+    def invalidate(self):
+        self._cache = {}
+
+    def _stage(self, name, compute):
+        if name not in self._cache:
+            if instrumentation.enabled:
+                instrumentation.count(f"cache.{name}.misses")
+                self._cache[name] = instrumentation.call(name, compute, self.equation)
+            else:
+                self._cache[name] = compute()
+        elif instrumentation.enabled:
+            instrumentation.count(f"cache.{name}.hits")
+        return self._cache[name]
+
+    def _parse(self):
+        elements = self.parseElements(self.equation)
+
+        elements.setdefault("e-", 0)
+        charge = - elements["e-"]  # Default charge is 0 for neutral compounds
+
+        del elements["e-"]
+        return MappingProxyType(elements), charge
+
+    @property
+    def elements(self):
+        return self._stage("elements", self._parse)[0]
+
+    @property
+    def charge(self):
+        return self._stage("elements", self._parse)[1]
 
     def __str__(self):
         return f"{self.equation} - charge {self.charge}"
@@ -18,42 +55,8 @@ class Compound:
         return f"Compound(equation={self.equation}, charge={self.charge})"
     
     def parseElements(self, equation):
-        if len(equation) == 0: return {}
-        if equation[0] == "_": return self.parseElements(equation[1:])
-        if equation[0] == "+": 
-            if len(equation) == 1: return {"e-" : 1}
-            return {"e-" : -1 * int(equation[1:])}
-        if equation[0] == "-": 
-            if len(equation) == 1: return {"e-" : -1}
-            return {"e-" : int(equation[1:])}
-        if checkLast(equation): return {equation : 1}
-        if equation[-1].isnumeric() and checkLast(equation[:-1]): return {equation[:-1] : int(equation[-1])}
-        if equation[-2:].isnumeric() and checkLast(equation[:-2]): return {equation[:-2] : int(equation[-2:])}
-        if equation[:5] == "(NH4)":
-            factor = int(equation[5])
-            curr_batch = {"N" : factor, "H" : 4 * factor}
-            curr_batch.update(self.parseElements(equation[6:]))
-        if equation[0] == "(":
-            factor = int(equation[-1])
-            inside = self.parseElements(equation[1:-2])
-            for key in inside: inside[key] *= factor
-            return inside
-
-        index = int(equation[1].islower())
-        num = equation[index+1]
-        num = 1 if not num.isnumeric() else int(num)
-
-        ret = {equation[0:index + 1] : num}
-        next_batch = self.parseElements(equation[index + 2 - int(num == 1):])
-        to_delete = []
-        for key in next_batch:
-            if key in ret: 
-                to_delete.append(key)
-                ret[key] += next_batch[key]
-        for i in to_delete: del next_batch[i]
-        ret.update(next_batch)
-        return ret
-    
+        return parseFormula(equation)
+
     def totalElements(self):
         total = 0
         for value in self.elements.values():
@@ -67,6 +70,9 @@ class Compound:
         return [key for key in self.elements if key != "e-"]
     
     def getCentralAtom(self):
+        return self._stage("central", self._findCentralAtom)
+
+    def _findCentralAtom(self):
         options = self.uniqueElements()
 
         if len(options) == 1: return options[0]
@@ -85,11 +91,14 @@ class Compound:
         if len(multi_center_candidates) > 1:
             return False
 
-        sorted_by_en = sorted(options, key=lambda x: periodicTable[x][2])
-        lowest_en = periodicTable[sorted_by_en[0]][2]
+        table = getElementTable()
+        electronegativity = dict(zip(options, table.electronegativity[table.indices(options)]))
+
+        sorted_by_en = sorted(options, key=lambda x: electronegativity[x])
+        lowest_en = electronegativity[sorted_by_en[0]]
 
         # Check how many elements share this electronegativity
-        same_en = [el for el in sorted_by_en if periodicTable[el][2] == lowest_en]
+        same_en = [el for el in sorted_by_en if electronegativity[el] == lowest_en]
 
         # If multiple elements share lowest electronegativity, it is ambiguous
         if len(same_en) > 1:
@@ -97,16 +106,108 @@ class Compound:
 
         return sorted_by_en[0]
     
+    def canonicalFormula(self):
+        return self._stage("canonical", lambda: hillFormula(self.elements, self.charge))
+
     def isCovalent(self):
+        table = getElementTable()
         for element in self.uniqueElements():
-            if element not in periodicTable:
+            if element not in table:
                 return False
-            if periodicTable[element][2] < 1.6:  # EN < 1.6 means it is likely metal
+            if table.electronegativity[table.index[element]] < 1.6:  # EN < 1.6 means it is likely metal
                 return False
 
         return True
 
-
-    
-
-def checkLast(equation : str): return len(equation) == 1 or (equation[-1].islower() and len(equation) == 2)
\ No newline at end of file
+def hillFormula(elements, charge=0):
+    # Hill order: C, then H, then the rest alphabetically (all alphabetical when there is no carbon).
+    # The charge is appended the way parseFormula reads it, e.g. "H3Lu-3", "H4N+".
+    symbols = sorted(symbol for symbol in elements if symbol != "e-" and elements[symbol] > 0)
+    if "C" in symbols:
+        symbols = ["C"] + (["H"] if "H" in symbols else []) + [s for s in symbols if s not in ("C", "H")]
+
+    formula = "".join(symbol + (str(elements[symbol]) if elements[symbol] != 1 else "") for symbol in symbols)
+
+    if charge:
+        formula += ("+" if charge > 0 else "-") + (str(abs(charge)) if abs(charge) != 1 else "")
+    return formula
+
+HYDRATE_SEPARATORS = "·.*"
+GROUP_CLOSE = {"(": ")", "[": "]", "{": "}"}
+PARSE_CACHE_SIZE = 65536
+
+def parseFormula(equation):
+    # Returns {element: count}, plus an "e-" entry (extra electrons) when the formula has a charge
+    return dict(_parseFormulaCached(equation))
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parseFormulaCached(equation):
+    # Single left-to-right pass over the formula grammar:
+    #   formula   := component (separator component)*
+    #   component := coefficient? (element count? | group count? | charge | "_")*
+    #   group     := "(" component ")" | "[" component "]" | "{" component "}"
+    #   charge    := ("+" | "-") digits?
+    # Counts keep the order each element first appears in.
+    stack = [{}]           # one dict per open group
+    openers = []           # bracket characters awaiting their match
+    component = {}         # counts of the current hydrate component
+    coefficient = 1        # leading multiplier of the current component
+    electrons = None
+    i, n = 0, len(equation)
+
+    def readNumber(i):
+        j = i
+        while j < n and equation[j].isdigit(): j += 1
+        return (int(equation[i:j]) if j > i else None), j
+
+    def merge(target, counts, factor):
+        for key, value in counts.items():
+            target[key] = target.get(key, 0) + value * factor
+
+    while i < n:
+        ch = equation[i]
+
+        if "A" <= ch <= "Z":
+            j = i + 1
+            while j < n and "a" <= equation[j] <= "z": j += 1
+            symbol = equation[i:j]
+            count, i = readNumber(j)
+            counts = stack[-1]
+            counts[symbol] = counts.get(symbol, 0) + (1 if count is None else count)
+        elif ch in GROUP_CLOSE:
+            stack.append({})
+            openers.append(ch)
+            i += 1
+        elif ch in ")]}":
+            if not openers or GROUP_CLOSE[openers[-1]] != ch:
+                raise ValueError(f"Unbalanced '{ch}' at position {i} in formula: {equation}")
+            openers.pop()
+            group = stack.pop()
+            count, i = readNumber(i + 1)
+            merge(stack[-1], group, 1 if count is None else count)
+        elif ch == "+" or ch == "-":
+            count, i = readNumber(i + 1)
+            count = 1 if count is None else count
+            electrons = (electrons or 0) + (-count if ch == "+" else count)
+        elif ch in HYDRATE_SEPARATORS:
+            if openers:
+                raise ValueError(f"Unclosed '{openers[-1]}' before position {i} in formula: {equation}")
+            merge(component, stack[0], coefficient)
+            stack[0] = {}
+            coefficient, i = readNumber(i + 1)
+            coefficient = 1 if coefficient is None else coefficient
+        elif ch.isdigit() and i == 0:
+            coefficient, i = readNumber(i)
+        elif ch == "_" or ch.isspace():
+            i += 1
+        else:
+            raise ValueError(f"Unexpected '{ch}' at position {i} in formula: {equation}")
+
+    if openers:
+        raise ValueError(f"Unclosed '{openers[-1]}' in formula: {equation}")
+
+    merge(component, stack[0], coefficient)
+    if electrons is not None:
+        component["e-"] = electrons
+
+    return tuple(component.items())
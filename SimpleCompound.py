@@ -1,33 +1,23 @@
 from Compound import Compound
-from dataCollection import periodicTable, element_color_map
-from Bond import Bond
-from math import sqrt, degrees, acos
+from dataCollection import getElementTable
+from Bond import Bond, BondTable, bondLengths
+from geometryTable import relaxedDomains
+from resonance import enumerateResonance, expandForms, averageUpgrades, formalCharges
+import instrumentation
 
 import numpy as np
 
-import matplotlib.pyplot as plt
 from itertools import combinations
+from types import MappingProxyType
 
-def get_perpendicular_vector(v):
-    # Return a normalized vector perpendicular to v
-    # Choose an arbitrary vector not parallel to v
-    if np.allclose(v, [0, 0, 1]):
-        other = np.array([1, 0, 0])
-    else:
-        other = np.array([0, 0, 1])
-    perp = np.cross(v, other)
-    return perp / np.linalg.norm(perp)
-
-def angle_between(v1, v2):
-    # Make sure vectors are float arrays
-    v1 = np.array(v1, dtype=float)
-    v2 = np.array(v2, dtype=float)
-
-    # Compute angle in degrees
-    cos_theta = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
-    # Clamp to avoid NaN from rounding errors
-    cos_theta = np.clip(cos_theta, -1.0, 1.0)
-    return degrees(acos(cos_theta))
+GEOMETRIES = ("vsepr", "learned")  # rule-based VSEPR, or bondPredictor's trained lengths and angles
+
+def structureRecord(formula, geometry="vsepr", angles=True):
+    # SimpleCompound.toRecord(), or {"formula": ..., "error": ...} for formulas the pipeline rejects
+    try:
+        return SimpleCompound(formula).toRecord(geometry, angles)
+    except Exception as e:
+        return {"formula": formula, "error": f"{type(e).__name__}: {e}"}
 
 # one central atom, only nonmetals
 class SimpleCompound(Compound):
@@ -35,12 +25,39 @@ class SimpleCompound(Compound):
         super().__init__(equation)
                     
     def totalValenceElectrons(self):
-        total = 0
-        for element in self.elements: total += periodicTable[element][3] * self.elements[element]
-        
+        table = getElementTable()
+        counts = np.fromiter(self.elements.values(), dtype=float, count=len(self.elements))
+        total = np.dot(table.valence[table.indices(list(self.elements))], counts)
+
         return int(total)
     
     def generateLewisStructure(self):
+        # Mutable copy of the memoized Lewis structure, safe for callers to modify
+        snapshot = self.lewisSnapshot()
+        return self._mutableStructure(snapshot, BondTable.fromBonds(snapshot["bonds"], snapshot["atoms"]))
+
+    def _mutableStructure(self, snapshot, bondTable):
+        # "bonds" are views into bondTable, so changes to them (order, angleFromCentral) land in the table
+        atoms = list(snapshot["atoms"])
+        bondTable.atoms = atoms
+
+        return {
+            "atoms": atoms,
+            "central": snapshot["central"],
+            "bonds": list(bondTable),
+            "lonePairs": list(snapshot["lonePairs"]),
+            "electronCount": list(snapshot["electronCount"]),
+            "remainingElectrons": snapshot["remainingElectrons"],
+            "formalCharges": list(snapshot["formalCharges"]),
+            "resonanceCount": snapshot["resonanceCount"],
+            "averageBondOrders": list(snapshot["averageBondOrders"])
+        }
+
+    def lewisSnapshot(self):
+        # Read-only Lewis structure, computed once per formula
+        return self._stage("lewis", self._buildLewisStructure)
+
+    def _buildLewisStructure(self):
         # 1. Build atom list (flattened from self.elements)
         atoms = []
         for element, count in self.elements.items():
@@ -50,10 +67,13 @@ class SimpleCompound(Compound):
         central_symbol = self.getCentralAtom()
         central_idx = atoms.index(central_symbol)
 
-        # 3. Calculate total valence electrons
-        totalElectrons = self.totalValenceElectrons()
+        # 3. Calculate total valence electrons, including the ion's charge
+        totalElectrons = self.totalValenceElectrons() - self.charge
 
         # 4. Create single bonds between central atom and all other atoms
+        if instrumentation.enabled:
+            distributeStarted = instrumentation.begin("lewis.distributeElectrons")
+
         bonds = []
         electronsUsed = 0
         electronCount = [0] * len(atoms)  # Track electrons per atom
@@ -91,270 +111,198 @@ class SimpleCompound(Compound):
             electronCount[central_idx] += pairs * 2
             remainingElectrons -= pairs * 2
 
-        # 7. Add double/triple bonds if central atom lacks octet
-        attempts = 0
-        maxAttempts = 10  # Prevent infinite loops
-
-        while electronCount[central_idx] < 8 and attempts < maxAttempts:
-            madeChange = False
-            attempts += 1
-            
-            for bond in bonds:
-                if not bond.involves(central_idx): continue
-
-                terminal_idx = bond.other(central_idx)
+        if instrumentation.enabled:
+            instrumentation.end("lewis.distributeElectrons", distributeStarted)
 
-                if atoms[terminal_idx] == "H":
-                    continue  # Hydrogen can't form multiple bonds
+        # 7. Move terminal lone pairs into multiple bonds: the octet first, then the lowest formal charges
+        if instrumentation.enabled:
+            upgradeStarted = instrumentation.begin("lewis.resonance")
 
-                if lonePairs[terminal_idx] > 0 and bond.order < 3:
-                    # Upgrade bond and reduce lone pair
-                    bond.order += 1
+        terminals = [bond.other(central_idx) for bond in bonds]
+        resonance = enumerateResonance(atoms, central_idx, terminals, lonePairs, electronCount, remainingElectrons)
+        upgrades = expandForms(resonance, len(bonds), limit=1)[0]
 
-                    lonePairs[terminal_idx] -= 1
-                    electronCount[central_idx] += 2
+        for bond, terminal_idx, upgrade in zip(bonds, terminals, upgrades):
+            bond.order += upgrade
+            lonePairs[terminal_idx] -= upgrade
+            electronCount[central_idx] += 2 * upgrade
 
-                    madeChange = True
-                    break
+        bondRows = tuple((bond.a, bond.b, bond.order) for bond in bonds)
 
-            if not madeChange:
-                break
+        if instrumentation.enabled:
+            instrumentation.end("lewis.resonance", upgradeStarted)
+            instrumentation.count("lewis.resonanceForms", resonance.count)
+            instrumentation.count("lewis.resonanceNodes", resonance.nodes)
 
         # 8. Final output
-        return {
-            "atoms": atoms,              # list of element symbols
+        return MappingProxyType({
+            "atoms": tuple(atoms),       # element symbols
             "central": central_idx,      # index of central atom
-            "bonds": bonds,              # list of (a_idx, b_idx, bondOrder)
-            "lonePairs": lonePairs,      # list of lone pair counts per atom
-            "electronCount": electronCount,
-            "remainingElectrons": remainingElectrons
-        }
-    
-    def generateVSEPRStructure(self):
-        LewisStructure = self.generateLewisStructure()
+            "bonds": bondRows,           # (a_idx, b_idx, bondOrder) of the first resonance form
+            "lonePairs": tuple(lonePairs),  # lone pair counts per atom
+            "electronCount": tuple(electronCount),
+            "remainingElectrons": remainingElectrons,
+            "formalCharges": formalCharges(atoms, central_idx, bondRows, lonePairs, remainingElectrons),
+            "resonanceCount": resonance.count,  # equivalent forms with the same (lowest) formal charges
+            "averageBondOrders": tuple(1 + u for u in averageUpgrades(resonance, len(bonds))),  # per bond, over all forms
+            "resonance": resonance
+        })
+
+    def resonanceStructures(self):
+        # Every resonance form of the Lewis structure (up to resonance.MAX_FORMS) as read-only
+        # structures with their own bonds, lone pairs and formal charges
+        return list(self._stage("resonance", self._buildResonanceStructures))
+
+    def _buildResonanceStructures(self):
+        snapshot = self.lewisSnapshot()
+        resonance = snapshot["resonance"]
+        central_idx = snapshot["central"]
+        first = [order for _, _, order in snapshot["bonds"]]
+        singleLonePairs = list(snapshot["lonePairs"])
+        for (a, b, order) in snapshot["bonds"]:
+            singleLonePairs[b if a == central_idx else a] += order - 1
+
+        structures = []
+        for upgrades in expandForms(resonance, len(first)):
+            lonePairs = list(singleLonePairs)
+            bonds = []
+            for (a, b, _), upgrade in zip(snapshot["bonds"], upgrades):
+                lonePairs[b if a == central_idx else a] -= upgrade
+                bonds.append((a, b, 1 + upgrade))
+
+            electronCount = list(snapshot["electronCount"])
+            electronCount[central_idx] += 2 * (sum(upgrades) - sum(order - 1 for order in first))
+            structure = dict(snapshot)
+            structure.update({
+                "bonds": tuple(bonds),
+                "lonePairs": tuple(lonePairs),
+                "electronCount": tuple(electronCount),
+                "formalCharges": formalCharges(snapshot["atoms"], central_idx, bonds, lonePairs, snapshot["remainingElectrons"])
+            })
+            structures.append(MappingProxyType(structure))
+        return tuple(structures)
+
+    def generateVSEPRStructure(self, geometry="vsepr"):
+        # Lewis structure whose bonds carry their angleFromCentral vectors
+        snapshot = self.vseprSnapshot(geometry)
+        return self._mutableStructure(snapshot, snapshot["bondTable"].copy())
+
+    def vseprSnapshot(self, geometry="vsepr"):
+        # Read-only Lewis structure plus domain directions, computed once per formula and geometry
+        if geometry == "vsepr":
+            return self._stage("vsepr", self._buildVSEPRStructure)
+        if geometry == "learned":
+            return self._stage("vsepr.learned", self._buildLearnedStructure)
+        raise ValueError(f"Unknown geometry {geometry!r}, expected one of {GEOMETRIES}")
+
+    def _buildVSEPRStructure(self):
+        LewisStructure = self.lewisSnapshot()
+        atoms = LewisStructure["atoms"]
+        bonds = LewisStructure["bonds"]
 
         central_idx = LewisStructure["central"]
 
         lone_pairs = LewisStructure["lonePairs"][central_idx]
-        steric_number = len(LewisStructure["bonds"]) + lone_pairs
-
-        ideal_positions = self._generateIdealPositions(steric_number)
-
-        ideal_positions = [np.array(pos) for pos in ideal_positions]
-
-        actual_positions = self._adjustForLonePairs(ideal_positions, lone_pairs, bonds=LewisStructure["bonds"])
-        # updates each Bond object with the new angleFromCentral vector
-
-        return LewisStructure
-
-    def _generateIdealPositions(self, steric_number):
-        if steric_number == 2 or steric_number == 1: 
-            # Linear
-            return [
-                (1.0, 0.0, 0.0),
-                (-1.0, 0.0, 0.0)
-            ]
-
-        elif steric_number == 3:
-            # Trigonal planar
-            return [
-                (1.0, 0.0, 0.0),
-                (-0.5, sqrt(3)/2, 0.0),
-                (-0.5, -sqrt(3)/2, 0.0)
-            ]
-        
-        elif steric_number == 4:
-            # Tetrahedral
-            return [
-                (1.0 / sqrt(3), 1.0 / sqrt(3), 1.0 / sqrt(3)),
-                (-1.0 / sqrt(3), -1.0 / sqrt(3), 1.0 / sqrt(3)),
-                (-1.0 / sqrt(3), 1.0 / sqrt(3), -1.0 / sqrt(3)),
-                (1.0 / sqrt(3), -1.0 / sqrt(3), -1.0 / sqrt(3))
-            ]
-        
-        elif steric_number == 5:
-            # Trigonal bipyramidal
-            return [
-                (0.0, 0.0, 1.0),      # Axial
-                (0.0, 0.0, -1.0),     # Axial
-                (1.0, 0.0, 0.0),      # Equatorial
-                (-0.5, sqrt(3)/2, 0.0),  # Equatorial
-                (-0.5, -sqrt(3)/2, 0.0)  # Equatorial
-            ]        
-        
-        elif steric_number == 6:
-            # Octahedral
-            return [
-                (1.0, 0.0, 0.0),      # +X
-                (-1.0, 0.0, 0.0),     # -X
-                (0.0, 1.0, 0.0),      # +Y
-                (0.0, -1.0, 0.0),     # -Y
-                (0.0, 0.0, 1.0),      # +Z
-                (0.0, 0.0, -1.0)      # -Z
-            ]
-        
-        else:
-            raise ValueError(f"Unsupported steric number: {steric_number}, type: {type(steric_number)}")
-
-    def _adjustForLonePairs(self, ideal_positions, lone_pairs, bonds):
-            # returns adjusted positions for lone pairs and bonds as vectors
-            lp_vectors = ideal_positions[:lone_pairs]
-            bond_vectors = ideal_positions[lone_pairs:]
-
-            adjusted_bonds = []
-
-            bond_order_weight = {
-                1: 1.0,
-                2: 0.8,
-                3: 0.6
-            }
-
-            k = 0.1
-
-            for bond_vec, bond in zip(bond_vectors, bonds):
-                weight = bond_order_weight.get(int(bond.order), 1)  # Default weight if not found
-                repulsion = np.zeros(3)
-
-                for lp in lp_vectors:
-                    # Lone pair repels bond vector — stronger when aligned
-                    direction = bond_vec - lp
-                    if np.linalg.norm(direction) == 0:
-                        continue  # Avoid divide-by-zero
-                    direction /= np.linalg.norm(direction)
-
-                    repulsion += direction * weight * k  # 0.2 is base strength
-
-                new_vec = bond_vec + repulsion
-                new_vec /= np.linalg.norm(new_vec)  # Normalize
-                
-                bond.angleFromCentral = new_vec
-
-                adjusted_bonds.append(new_vec)
-
-            return [vec for vec in lp_vectors] + adjusted_bonds
-
-    def getBondAngles(self):
-        structure = self.generateVSEPRStructure()
+        steric_number = len(bonds) + lone_pairs
+
+        # resonance forms are averaged: relaxation and lengths use each bond's mean order over the set
+        averageOrders = LewisStructure["averageBondOrders"]
+        # equal-order bonds take their sites by terminal atomic number, so the geometry does not
+        # depend on the order the formula lists its elements in
+        terminals = [b if a == central_idx else a for a, b, _ in bonds]
+        ties = getElementTable().indices([atoms[t] for t in terminals]) if terminals else None
+        actual_positions = self._relaxDomains(steric_number, lone_pairs, averageOrders, ties)
+
+        lonePairDirections = actual_positions[:lone_pairs]
+        bondDirections = actual_positions[lone_pairs:]
+
+        lengths = None
+        if LewisStructure["resonanceCount"] > 1:
+            rows = np.asarray(bonds, dtype=np.int64).reshape(-1, 3)
+            lengths = bondLengths(getElementTable().indices(atoms), rows[:, 0], rows[:, 1], averageOrders)
+        bondTable = BondTable.fromBonds(bonds, atoms, bondDirections, lengths).freeze()
+
+        structure = dict(LewisStructure)
+        structure.update({
+            "stericNumber": steric_number,
+            "lonePairDirections": lonePairDirections,  # (lone_pairs, 3) unit vectors
+            "bondDirections": bondDirections,          # (len(bonds), 3) unit vectors, aligned with bonds
+            "bondLengths": tuple(bondTable.lengths.tolist()),
+            "bondTable": bondTable                     # read-only BondTable of the same bonds
+        })
+        return MappingProxyType(structure)
+
+    def _buildLearnedStructure(self):
+        # The VSEPR structure with bond directions and lengths from the trained bondPredictor
+        from batchVSEPR import snapshotBatch
+        from bondPredictor import getPredictor
+
+        snapshot = self.vseprSnapshot()
+        directions, lengths = getPredictor().predict(snapshotBatch(snapshot))
+        slots = slice(len(snapshot["lonePairDirections"]), snapshot["stericNumber"])
+
+        bondDirections = directions[0, slots]
+        bondDirections.flags.writeable = False
+        bondTable = BondTable.fromBonds(snapshot["bonds"], snapshot["atoms"], bondDirections, lengths[0, slots]).freeze()
+
+        structure = dict(snapshot)
+        structure.update({
+            "bondDirections": bondDirections,
+            "bondLengths": tuple(bondTable.lengths.tolist()),
+            "bondTable": bondTable
+        })
+        return MappingProxyType(structure)
+
+    @instrumentation.timed("vsepr.relax")
+    def _relaxDomains(self, steric_number, lone_pairs, bond_orders, ties=None):
+        # Lone pair vectors followed by the bond vectors, relaxed with the LP/BP repulsion model in
+        # domainMinimizer and memoized per geometry class by geometryTable (read-only, shared)
+        return relaxedDomains(steric_number, lone_pairs, bond_orders, ties)
+
+    def getBondAngles(self, geometry="vsepr"):
+        name = "angles" if geometry == "vsepr" else f"angles.{geometry}"
+        return list(self._stage(name, lambda: self._computeBondAngles(geometry)))
+
+    def _computeBondAngles(self, geometry="vsepr"):
+        # Every pair of bonds at the central atom, in combinations() order, from one matrix product
+        structure = self.vseprSnapshot(geometry)
         central_idx = structure["central"]
         atoms = structure["atoms"]
-        bonds = structure["bonds"]
-
-        angles = []
-
-        for bond1, bond2 in combinations(bonds, 2):
-            v1 = np.array(bond1.angleFromCentral)
-            if bond1.b == central_idx:
-                v1 = -v1
-            v1 = v1 * bond1.bondLength()
-
-            v2 = np.array(bond2.angleFromCentral)
-            if bond2.b == central_idx:
-                v2 = -v2
-            v2 = v2 * bond2.bondLength()
-
-            angle = angle_between(v1, v2)
-
-            a1 = atoms[bond1.a if bond1.a != central_idx else bond1.b]
-            a2 = atoms[bond2.a if bond2.a != central_idx else bond2.b]
-            central = atoms[central_idx]
-
-            angles.append((a1, central, a2, angle))
-
-        return angles
+        bondTable = structure["bondTable"]
+
+        bonds, angles = bondTable.anglesAt(central_idx)
+        angles = angles.tolist()
+        others = [b if a == central_idx else a for a, b, _ in (structure["bonds"][i] for i in bonds.tolist())]
+        central = atoms[central_idx]
+
+        return tuple(
+            (atoms[others[i]], central, atoms[others[j]], angles[i][j])
+            for i, j in combinations(range(len(others)), 2)
+        )
+
+    def toRecord(self, geometry="vsepr", angles=True):
+        # JSON-ready summary of the VSEPR structure (plain lists and numbers only)
+        snapshot = self.vseprSnapshot(geometry)
+        record = {
+            "formula": self.equation,
+            "atoms": list(snapshot["atoms"]),
+            "central": snapshot["central"],
+            "bonds": [list(bond) for bond in snapshot["bonds"]],
+            "lonePairs": list(snapshot["lonePairs"]),
+            "formalCharges": list(snapshot["formalCharges"]),
+            "resonanceCount": snapshot["resonanceCount"],
+            "averageBondOrders": list(snapshot["averageBondOrders"]),
+            "stericNumber": snapshot["stericNumber"],
+            "bondDirections": snapshot["bondDirections"].tolist(),
+            "lonePairDirections": snapshot["lonePairDirections"].tolist(),
+            "bondLengths": list(snapshot["bondLengths"])
+        }
+        if angles:
+            record["bondAngles"] = [list(angle) for angle in self.getBondAngles(geometry)]
+        return record
 
     def displayMolecule(self):
-        LewisStructure = self.generateVSEPRStructure()
-
-        bonds = LewisStructure["bonds"]
-        atoms = LewisStructure["atoms"]
-        central_idx = LewisStructure["central"]
-
-        fig = plt.figure()
-        ax = fig.add_subplot(111, projection='3d')
-
-        # Central atom at origin
-        central_pos = np.array([0, 0, 0])
-        atom_positions = [central_pos]
-        labels = [atoms[central_idx]]
-
-        for bond in bonds:
-            # Determine direction and non-central atom
-            if bond.a == central_idx:
-                direction = np.array(bond.angleFromCentral)
-                target_atom = atoms[bond.b]
-            elif bond.b == central_idx:
-                direction = -np.array(bond.angleFromCentral)
-                target_atom = atoms[bond.a]
-            else:
-                continue  # skip if not bonded to central atom
-
-            # Scale direction vector by bond length
-            end = direction * bond.bondLength()
-            atom_positions.append(end)
-            labels.append(target_atom)
-
-            # Draw single/double/triple bonds as parallel lines
-            num_lines = bond.order
-            if num_lines == 1:
-                ax.plot(
-                    [central_pos[0], end[0]],
-                    [central_pos[1], end[1]],
-                    [central_pos[2], end[2]],
-                    color='gray',
-                    linewidth=1.5
-                )
-            else:
-                offset_dir = get_perpendicular_vector(direction)
-                spacing = 0.05  # Ångstroms of separation
-
-                offsets = np.linspace(-spacing, spacing, num_lines)
-                for offset in offsets:
-                    shift = offset * offset_dir
-                    ax.plot(
-                        [central_pos[0] + shift[0], end[0] + shift[0]],
-                        [central_pos[1] + shift[1], end[1] + shift[1]],
-                        [central_pos[2] + shift[2], end[2] + shift[2]],
-                        color='gray',
-                        linewidth=1.0
-                    )
-
-        # Draw atoms as scatter points
-        atom_positions[0], atom_positions[central_idx] = atom_positions[central_idx], atom_positions[0]  # Move central atom to first position
-        labels[0], labels[central_idx] = labels[central_idx], labels[0]  # Swap labels
-
-        xs, ys, zs = zip(*atom_positions)
-
-        # Get colors and marker sizes based on covalent radius (index 1)
-        colors = [element_color_map.get(elem, element_color_map["default"]) for elem in atoms]
-        sizes = [
-            periodicTable.get(elem, [None, 0.5])[1] * 500  # scale angstroms to point size; fallback = 0.5 Å
-            for elem in atoms
-        ]
-
-        ax.scatter(xs, ys, zs, s=sizes, c=colors, alpha = 1)
-
-        # Add text labels
-        for (x, y, z), label in zip(atom_positions, labels):
-            ax.text(x, y, z, label, fontsize=10, ha='center', color = 'black')
-
-        # Formatting
-        ax.set_box_aspect([1, 1, 1])
-        ax.set_xlim(-2, 2)
-        ax.set_ylim(-2, 2)
-        ax.set_zlim(-2, 2)
-        ax.axis('off')
-
-        plt.tight_layout()
-        plt.show()
-
-
-cmpd = SimpleCompound("H2O")
-
-LewisStructure = cmpd.generateLewisStructure()
-
-print(LewisStructure)
-print()
-print(cmpd.getBondAngles())
-
-cmpd.displayMolecule()
+        # matplotlib is only imported the first time a molecule is drawn
+        from visualization import drawMolecule
 
+        drawMolecule(self.vseprSnapshot())
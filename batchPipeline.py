@@ -0,0 +1,155 @@
+from SimpleCompound import GEOMETRIES
+from structureCache import getCache
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+import argparse
+import json
+import os
+import sys
+import time
+
+# Structures for long formula lists as JSON lines, one record per input formula:
+#
+#   lewis3d batch filtered_compounds.txt -o structures.jsonl --progress
+#   cat formulas.txt | lewis3d batch --unordered > structures.jsonl
+#
+# Every line is SimpleCompound.structureRecord() plus "index", the formula's position in the
+# input, so formulas the pipeline rejects ((NH4)2SO4 has no single central atom) come out as
+# {"index": ..., "formula": ..., "error": ...} instead of stopping the run. Records go through
+# each process's structureCache, so repeated formulas are computed once per process, and once
+# overall with a shared disk tier (--cache or $LEWIS3D_CACHE).
+#
+# Formulas are read lazily and handed to a process pool in chunks, with at most 2 * processes
+# chunks in flight, and workers return the serialized lines. Memory stays bounded by the
+# chunks in flight however long the input is. Ordered output follows the input; unordered
+# output writes each chunk as soon as it finishes, so one slow chunk does not hold back the rest.
+
+def readFormulas(lines):
+    # One formula per line; blank lines and # comments are skipped
+    for line in lines:
+        formula = line.split("#", 1)[0].strip()
+        if formula:
+            yield formula
+
+def _recordLines(start, formulas, geometry, angles, cachePath=None):
+    # (lines, errors) for one chunk; runs in the worker processes
+    lines = []
+    errors = 0
+    for index, record in enumerate(getCache(cachePath).records(formulas, geometry, angles), start):
+        errors += "error" in record
+        lines.append(json.dumps({"index": index, **record}))
+    return lines, errors
+
+def _chunks(formulas, chunksize):
+    # (start index, formulas) pairs
+    formulas = iter(formulas)
+    start = 0
+    for chunk in iter(lambda: list(islice(formulas, chunksize)), []):
+        yield start, chunk
+        start += len(chunk)
+
+def batchRecords(formulas, geometry="vsepr", angles=True, processes=None, chunksize=256, ordered=True, cachePath=None):
+    # Yields (lines, errors) per chunk of formulas: the chunk's JSON lines and how many are errors
+    processes = processes or os.cpu_count() or 1
+    chunks = _chunks(formulas, chunksize)
+
+    if processes == 1:
+        for start, chunk in chunks:
+            yield _recordLines(start, chunk, geometry, angles, cachePath)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        if ordered:
+            pending = deque()
+            for start, chunk in chunks:
+                pending.append(pool.submit(_recordLines, start, chunk, geometry, angles, cachePath))
+                if len(pending) >= 2 * processes:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+            return
+
+        pending = set()
+        for start, chunk in chunks:
+            pending.add(pool.submit(_recordLines, start, chunk, geometry, angles, cachePath))
+            if len(pending) >= 2 * processes:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+class Progress:
+    # Formulas done, errors and rate on one stderr line, redrawn at most every `interval` seconds
+
+    def __init__(self, stream=sys.stderr, interval=0.5):
+        self.stream = stream
+        self.interval = interval
+        self.started = self.shown = time.perf_counter()
+        self.done = self.errors = 0
+
+    def update(self, done, errors):
+        self.done += done
+        self.errors += errors
+        now = time.perf_counter()
+        if now - self.shown >= self.interval:
+            self.shown = now
+            self.show("\r")
+
+    def show(self, start="\r", end=""):
+        seconds = time.perf_counter() - self.started
+        rate = self.done / seconds if seconds > 0 else 0.0
+        self.stream.write(f"{start}{self.done} formulas, {self.errors} errors, {rate:.0f}/s{end}")
+        self.stream.flush()
+
+    def finish(self):
+        self.show("\r", "\n")
+
+def writeRecords(formulas, output, progress=None, **options):
+    # Writes the JSON lines for formulas to the text stream output; returns (formulas, errors)
+    count = errors = 0
+    for lines, chunkErrors in batchRecords(formulas, **options):
+        output.write("\n".join(lines) + "\n")
+        count += len(lines)
+        errors += chunkErrors
+        if progress is not None:
+            progress.update(len(lines), chunkErrors)
+    if progress is not None:
+        progress.finish()
+    return count, errors
+
+def addArguments(parser):
+    parser.add_argument("formulas", nargs="?", default="-", help="file with one formula per line (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSON lines file to write (default: stdout)")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=256)
+    parser.add_argument("--unordered", action="store_true", help="write chunks as they finish instead of in input order")
+    parser.add_argument("--geometry", choices=GEOMETRIES, default="vsepr")
+    parser.add_argument("--no-angles", action="store_true", help="leave bondAngles out of the records")
+    parser.add_argument("--progress", action="store_true", help="report progress on stderr")
+    parser.add_argument("--cache", default=None, help="SQLite record cache shared by the workers and later runs (default: $LEWIS3D_CACHE)")
+
+def run(args):
+    source = sys.stdin if args.formulas == "-" else open(args.formulas, "r", encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        count, errors = writeRecords(readFormulas(source), output, Progress() if args.progress else None,
+                                     geometry=args.geometry, angles=not args.no_angles, processes=args.processes,
+                                     chunksize=args.chunksize, ordered=not args.unordered, cachePath=args.cache)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    if output is not sys.stdout:
+        print(f"wrote {count} records ({errors} errors) to {args.output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write structures for a list of formulas as JSON lines")
+    addArguments(parser)
+    run(parser.parse_args())
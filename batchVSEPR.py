@@ -0,0 +1,173 @@
+from SimpleCompound import SimpleCompound, GEOMETRIES
+from dataCollection import getElementTable
+from geometryTable import relaxedBatch, MAX_STERIC_NUMBER
+import instrumentation
+
+import numpy as np
+
+def generateVSEPRBatch(formulas, geometry="vsepr"):
+    # Runs the Lewis/VSEPR pipeline for a list of formulas and returns padded arrays.
+    # Domain slots follow SimpleCompound: lone pairs first, then bonds in Lewis order.
+    # geometry="learned" replaces the bond directions and lengths with bondPredictor's predictions.
+    if geometry not in GEOMETRIES:
+        raise ValueError(f"Unknown geometry {geometry!r}, expected one of {GEOMETRIES}")
+    formulas = list(formulas)
+    n = len(formulas)
+    D = MAX_STERIC_NUMBER
+
+    valid = np.zeros(n, dtype=bool)
+    lonePairs = np.zeros(n, dtype=np.int64)     # lone pairs on the central atom
+    numBonds = np.zeros(n, dtype=np.int64)
+    bondOrders = np.zeros((n, D), dtype=np.int64)
+    averageOrders = np.zeros((n, D))              # mean order over the resonance forms
+    bondAtoms = np.full((n, D), -1, dtype=np.int64)  # index of the bonded atom in atoms[i]
+    central = np.full(n, -1, dtype=np.int64)
+    centralZ = np.zeros(n, dtype=np.int64)        # atomic numbers, 0 for invalid/padding
+    terminalZ = np.zeros((n, D), dtype=np.int64)
+    terminalLonePairs = np.zeros((n, D), dtype=np.int64)
+    table = getElementTable()
+    resonanceCounts = np.zeros(n, dtype=np.int64)
+    atoms = [None] * n
+    atomLonePairs = [None] * n
+    formalCharges = [None] * n
+    errors = [None] * n
+
+    # 1. Lewis structures are integer bookkeeping, done per molecule
+    if instrumentation.enabled:
+        started = instrumentation.begin("batch.lewis")
+
+    for i, formula in enumerate(formulas):
+        try:
+            structure = SimpleCompound(formula).lewisSnapshot()
+        except Exception as e:
+            errors[i] = f"{type(e).__name__}: {e}"
+            continue
+
+        c = structure["central"]
+        lp = structure["lonePairs"][c]
+        bonds = structure["bonds"]
+        steric = len(bonds) + lp
+
+        if steric < 1 or steric > MAX_STERIC_NUMBER:
+            errors[i] = f"ValueError: Unsupported steric number: {steric}"
+            continue
+
+        valid[i] = True
+        atoms[i] = list(structure["atoms"])
+        atomLonePairs[i] = list(structure["lonePairs"])
+        formalCharges[i] = list(structure["formalCharges"])
+        resonanceCounts[i] = structure["resonanceCount"]
+        central[i] = c
+        lonePairs[i] = lp
+        numBonds[i] = len(bonds)
+        centralZ[i] = table.index[structure["atoms"][c]]
+        averageOrders[i, lp:lp + len(bonds)] = structure["averageBondOrders"]
+        for k, (a, b, order) in enumerate(bonds):
+            other = b if a == c else a
+            bondOrders[i, lp + k] = order
+            bondAtoms[i, lp + k] = other
+            terminalZ[i, lp + k] = table.index[structure["atoms"][other]]
+            terminalLonePairs[i, lp + k] = structure["lonePairs"][other]
+
+    if instrumentation.enabled:
+        instrumentation.end("batch.lewis", started)
+        instrumentation.count("batch.invalid", int(n - valid.sum()))
+
+    # 2. Steric numbers and slot masks for the whole batch
+    stericNumbers = np.where(valid, numBonds + lonePairs, 0)
+    slots = np.arange(D)
+    lonePairMask = slots[None, :] < lonePairs[:, None]
+    bondMask = (slots[None, :] >= lonePairs[:, None]) & (slots[None, :] < stericNumbers[:, None])
+    domainMask = lonePairMask | bondMask
+
+    # 3. Relaxed domains from geometryTable, shared with SimpleCompound; geometry classes not
+    # seen before are relaxed together
+    if instrumentation.enabled:
+        started = instrumentation.begin("batch.relax")
+
+    directions = relaxedBatch(stericNumbers, lonePairs, averageOrders, terminalZ)
+
+    if instrumentation.enabled:
+        instrumentation.end("batch.relax", started)
+
+    # 4. Bond lengths: (r_central + r_terminal) * (1.1 - .1 * order), as in Bond.bondLength,
+    # with the order averaged over the resonance forms
+    bondLengths = np.where(
+        bondMask,
+        (table.radius[centralZ][:, None] + table.radius[terminalZ]) * (1.1 - .1 * averageOrders),
+        0.0
+    )
+
+    batch = {
+        "formulas": formulas,
+        "valid": valid,                  # (N,) False where the Lewis/VSEPR step failed
+        "errors": errors,                # reason per invalid formula, None otherwise
+        "atoms": atoms,                  # list of element symbol lists (None if invalid)
+        "atomLonePairs": atomLonePairs,  # lone pairs of every atom in atoms[i] (None if invalid)
+        "formalCharges": formalCharges,  # formal charge of every atom in atoms[i] (None if invalid)
+        "resonanceCounts": resonanceCounts,  # (N,) number of resonance forms, 0 if invalid
+        "central": central,              # (N,) index of the central atom in atoms[i]
+        "stericNumbers": stericNumbers,  # (N,)
+        "lonePairs": lonePairs,          # (N,) lone pairs on the central atom
+        "directions": directions,        # (N, max_domains, 3) unit vectors, zero padded
+        "domainMask": domainMask,        # (N, max_domains) slot holds a lone pair or bond
+        "lonePairMask": lonePairMask,    # (N, max_domains)
+        "bondOrders": bondOrders,        # (N, max_domains) 0 for lone pairs and padding, first resonance form
+        "averageBondOrders": averageOrders,  # (N, max_domains) mean over all resonance forms
+        "bondAtoms": bondAtoms,          # (N, max_domains) bonded atom index, -1 otherwise
+        "bondLengths": bondLengths,      # (N, max_domains) 0 for lone pairs and padding
+        "centralNumbers": centralZ,      # (N,) atomic number of the central atom, 0 if invalid
+        "terminalNumbers": terminalZ,    # (N, max_domains) atomic number of the bonded atom, 0 otherwise
+        "terminalLonePairs": terminalLonePairs  # (N, max_domains) lone pairs on the bonded atom
+    }
+
+    if geometry == "learned":
+        from bondPredictor import getPredictor
+        batch["directions"], batch["bondLengths"] = getPredictor().predict(batch)
+    return batch
+
+def snapshotBatch(snapshot):
+    # One SimpleCompound.vseprSnapshot() in generateVSEPRBatch's padded layout (without "formulas")
+    D = MAX_STERIC_NUMBER
+    table = getElementTable()
+    c = snapshot["central"]
+    lp = snapshot["lonePairs"][c]
+    bonds = snapshot["bonds"]
+    steric = snapshot["stericNumber"]
+    if steric > D:
+        raise ValueError(f"Unsupported steric number: {steric}")
+
+    slots = np.arange(D)
+    bondSlots = slice(lp, lp + len(bonds))
+    others = [b if a == c else a for a, b, _ in bonds]
+
+    batch = {
+        "valid": np.ones(1, dtype=bool),
+        "errors": [None],
+        "atoms": [list(snapshot["atoms"])],
+        "atomLonePairs": [list(snapshot["lonePairs"])],
+        "formalCharges": [list(snapshot["formalCharges"])],
+        "resonanceCounts": np.array([snapshot["resonanceCount"]]),
+        "central": np.array([c]),
+        "stericNumbers": np.array([steric]),
+        "lonePairs": np.array([lp]),
+        "directions": np.zeros((1, D, 3)),
+        "domainMask": (slots < steric)[None],
+        "lonePairMask": (slots < lp)[None],
+        "bondOrders": np.zeros((1, D), dtype=np.int64),
+        "averageBondOrders": np.zeros((1, D)),
+        "bondAtoms": np.full((1, D), -1, dtype=np.int64),
+        "bondLengths": np.zeros((1, D)),
+        "centralNumbers": np.array([table.index[snapshot["atoms"][c]]]),
+        "terminalNumbers": np.zeros((1, D), dtype=np.int64),
+        "terminalLonePairs": np.zeros((1, D), dtype=np.int64),
+    }
+    batch["directions"][0, :lp] = snapshot["lonePairDirections"]
+    batch["directions"][0, bondSlots] = snapshot["bondDirections"]
+    batch["bondOrders"][0, bondSlots] = [order for _, _, order in bonds]
+    batch["averageBondOrders"][0, bondSlots] = snapshot["averageBondOrders"]
+    batch["bondAtoms"][0, bondSlots] = others
+    batch["bondLengths"][0, bondSlots] = snapshot["bondLengths"]
+    batch["terminalNumbers"][0, bondSlots] = table.indices([snapshot["atoms"][k] for k in others])
+    batch["terminalLonePairs"][0, bondSlots] = [snapshot["lonePairs"][k] for k in others]
+    return batch
@@ -0,0 +1,53 @@
+# Formula parsing throughput over a PubChem text listing (default: testCompounds.txt)
+# Usage: python benchmarks/parseThroughput.py [listing] [--repeat N]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Compound
+
+def readFormulas(path):
+    formulas = []
+    with open(path, "r") as file:
+        for line in file:
+            if "MF:" in line:
+                formulas.append(line[line.find("MF:") + len("MF:"):].strip())
+    return formulas
+
+def timeParse(formulas):
+    start = time.perf_counter()
+    for formula in formulas:
+        Compound.parseFormula(formula)
+    return time.perf_counter() - start
+
+def main(argv=None):
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    parser = argparse.ArgumentParser(description="Benchmark Compound.parseFormula")
+    parser.add_argument("listing", nargs="?", default=os.path.join(root, "testCompounds.txt"))
+    parser.add_argument("--repeat", type=int, default=100, help="passes over the listing")
+    args = parser.parse_args(argv)
+
+    formulas = readFormulas(args.listing)
+    unique = len(set(formulas))
+    total = len(formulas) * args.repeat
+
+    # cold: cache cleared before every pass, so each unique formula is tokenized once per pass
+    Compound._parseFormulaCached.cache_clear()
+    cold = 0.0
+    for _ in range(args.repeat):
+        cold += timeParse(formulas)
+        Compound._parseFormulaCached.cache_clear()
+
+    # warm: repeats are served from the memo cache
+    warm = sum(timeParse(formulas) for _ in range(args.repeat))
+
+    print(f"{len(formulas)} formulas ({unique} unique) x {args.repeat} passes")
+    print(f"cold: {total / cold:,.0f} formulas/s ({cold:.3f} s)")
+    print(f"warm: {total / warm:,.0f} formulas/s ({warm:.3f} s)")
+    print(Compound._parseFormulaCached.cache_info())
+
+if __name__ == "__main__":
+    main()
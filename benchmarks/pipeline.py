@@ -0,0 +1,301 @@
+# Per-stage timing and memory benchmarks for the structure pipeline, with a regression check.
+#
+#   python benchmarks/pipeline.py run [--scale N] [--repeat R] [--output results.json]
+#   python benchmarks/pipeline.py compare baseline.json results.json [--threshold 0.1]
+#
+# Every stage is timed on its own: whatever it depends on (parsed elements, the central atom,
+# the Lewis structure, ...) is prepared untimed before each repeat, on fresh Compound objects so
+# memoized results from an earlier stage or repeat are never measured. Peak memory comes from a
+# separate tracemalloc pass, so tracing does not distort the timings.
+#
+# Corpora: filtered_compounds.txt, the MF lines of testCompounds.txt, and random synthetic formulas
+# (1000 * scale of them); formula corpora are repeated `scale` times. XYZ stages use 1000118.xyz
+# and 1008071.xyz, plus a synthetic trajectory of 1000118.xyz tiled into a (4 * scale)^3 supercell.
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+import Compound
+from SimpleCompound import SimpleCompound
+from bondPerception import perceiveBonds
+from dataCollection import getElementTable
+from pubchemListing import readListing
+from xyzReader import XYZTrajectory, readFirstFrame, readFrames
+
+RESULTS_VERSION = 1
+
+# prepare(data) does untimed setup and returns the argument for run(prepared), which does the
+# timed work and returns how many items it processed
+Stage = namedtuple("Stage", ["name", "corpus", "prepare", "run"])
+
+def _each(function, items):
+    # Calls function on every item; failures (unsupported formulas) still count as processed
+    for item in items:
+        try:
+            function(item)
+        except Exception:
+            pass
+    return len(items)
+
+def _compounds(formulas, upTo=None):
+    # Fresh SimpleCompounds with the stages before `upTo` already computed
+    compounds = [SimpleCompound(formula) for formula in formulas]
+    steps = {"elements": lambda c: c.elements, "central": lambda c: c.getCentralAtom(),
+             "lewis": lambda c: c.lewisSnapshot(), "vsepr": lambda c: c.vseprSnapshot()}
+    for name in steps:
+        if name == upTo:
+            break
+        _each(steps[name], compounds)
+    return compounds
+
+def _parse(formulas):
+    Compound._parseFormulaCached.cache_clear()  # cold parse every repeat
+    return [SimpleCompound(formula) for formula in formulas]
+
+def _bonds(formulas):
+    bonds = []
+    for compound in _compounds(formulas, upTo="lewis"):
+        try:
+            bonds.extend(compound.generateLewisStructure()["bonds"])
+        except Exception:
+            pass
+    return bonds
+
+def _render(formulas):
+    snapshots = []
+    for compound in _compounds(formulas, upTo="vsepr"):
+        try:
+            snapshots.append(compound.vseprSnapshot())
+        except Exception:
+            pass
+    directory = tempfile.mkdtemp()
+    return snapshots, directory
+
+def _runRender(prepared):
+    from visualization import renderMolecule
+
+    snapshots, directory = prepared
+    try:
+        for i, snapshot in enumerate(snapshots):
+            renderMolecule(snapshot, os.path.join(directory, f"{i}.png"))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return len(snapshots)
+
+def _streamFrames(paths):
+    return sum(1 for path in paths for _ in readFrames(path))
+
+def _indexFrames(paths):
+    count = 0
+    for path in paths:
+        with XYZTrajectory(path) as trajectory:
+            for i in np.random.default_rng(0).permutation(len(trajectory)):
+                trajectory[int(i)]
+                count += 1
+    return count
+
+def _perceive(structures):
+    for symbols, coords in structures:
+        perceiveBonds(symbols, coords)
+    return sum(len(coords) for _, coords in structures)
+
+FORMULA_STAGES = [
+    Stage("parseElements", None, _parse, lambda compounds: _each(lambda c: c.elements, compounds)),
+    Stage("getCentralAtom", None, lambda f: _compounds(f, upTo="central"), lambda compounds: _each(SimpleCompound.getCentralAtom, compounds)),
+    Stage("generateLewisStructure", None, lambda f: _compounds(f, upTo="lewis"), lambda compounds: _each(SimpleCompound.generateLewisStructure, compounds)),
+    Stage("generateVSEPRStructure", None, lambda f: _compounds(f, upTo="vsepr"), lambda compounds: _each(SimpleCompound.generateVSEPRStructure, compounds)),
+    Stage("getBondAngles", None, lambda f: _compounds(f), lambda compounds: _each(SimpleCompound.getBondAngles, compounds)),
+    Stage("Bond.bondLength", None, _bonds, lambda bonds: _each(lambda b: b.bondLength(), bonds)),
+]
+
+def readFormulaFile(path):
+    with open(path, "r") as file:
+        return [line.strip() for line in file if line.strip()]
+
+def syntheticFormulas(count, seed=0):
+    # Single-center formulas such as "SF4", "H3Lu-3" or "ClO3+" from random element combinations
+    table = getElementTable()
+    rng = np.random.default_rng(seed)
+    centers = [symbol for symbol in table.index if table.valence[table.index[symbol]] > 0]
+    ligands = ["H", "F", "Cl", "Br", "O", "S", "N"]
+    charges = ["", "", "", "-", "+", "-2", "-3"]
+
+    formulas = []
+    for _ in range(count):
+        center, ligand = rng.choice(centers), rng.choice(ligands)
+        n = int(rng.integers(1, 7))
+        formulas.append(f"{center}{ligand}{n if n > 1 else ''}{rng.choice(charges)}")
+    return formulas
+
+def writeSupercellTrajectory(path, repeats, frames=10, seed=0):
+    # 1000118.xyz tiled repeats^3 times along its bounding box, written as a jittered multi-frame trajectory
+    frame = readFirstFrame(os.path.join(ROOT, "1000118.xyz"))
+    span = frame.coords.max(axis=0) - frame.coords.min(axis=0) + 2.0
+    shifts = np.stack(np.meshgrid(*[np.arange(repeats)] * 3, indexing="ij"), axis=-1).reshape(-1, 1, 3) * span
+    coords = (frame.coords[None] + shifts).reshape(-1, 3)
+    symbols = np.tile(getElementTable().symbols[frame.numbers], len(shifts))
+
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as file:
+        for k in range(frames):
+            jittered = coords + rng.normal(scale=0.01, size=coords.shape)
+            file.write(f"{len(coords)}\nsupercell {repeats}^3 frame {k}\n")
+            file.writelines(f"{s} {x:.6f} {y:.6f} {z:.6f}\n" for s, (x, y, z) in zip(symbols, jittered))
+    return symbols, coords
+
+def buildCorpora(scale, directory):
+    listing = [record.mf for record in readListing(os.path.join(ROOT, "testCompounds.txt"))]
+    formulas = {
+        "filtered": readFormulaFile(os.path.join(ROOT, "filtered_compounds.txt")) * scale,
+        "listing": listing * scale,
+        "synthetic": syntheticFormulas(1000 * scale),
+    }
+
+    xyzFiles = [os.path.join(ROOT, "1000118.xyz"), os.path.join(ROOT, "1008071.xyz")]
+    trajectory = os.path.join(directory, "supercell.xyz")
+    symbols, coords = writeSupercellTrajectory(trajectory, 4 * scale)
+
+    structures = {
+        "examples": [(list(map(str, getElementTable().symbols[f.numbers])), f.coords) for f in map(readFirstFrame, xyzFiles)],
+        "supercell": [(list(map(str, symbols)), coords)],
+    }
+    return formulas, {"examples": xyzFiles, "supercell": [trajectory]}, structures
+
+def allStages(formulas, xyzPaths, structures, renderCount):
+    stages = [stage._replace(name=f"{stage.name}[{corpus}]", corpus=items)
+              for corpus, items in formulas.items() for stage in FORMULA_STAGES]
+
+    for corpus, paths in xyzPaths.items():
+        stages.append(Stage(f"xyzStream[{corpus}]", paths, lambda paths: paths, _streamFrames))
+        stages.append(Stage(f"xyzIndex[{corpus}]", paths, lambda paths: paths, _indexFrames))
+    for corpus, items in structures.items():
+        stages.append(Stage(f"perceiveBonds[{corpus}]", items, lambda items: items, _perceive))
+
+    try:
+        import matplotlib  # noqa: F401  (rendering is optional, like the plot extra)
+        stages.append(Stage("renderMolecule[filtered]", formulas["filtered"][:renderCount], _render, _runRender))
+    except ImportError:
+        pass
+    return stages
+
+def measure(stage, repeat):
+    stage.run(stage.prepare(stage.corpus))  # warm-up: lazy imports, element table, font caches
+
+    times = []
+    for _ in range(repeat):
+        prepared = stage.prepare(stage.corpus)
+        start = time.perf_counter()
+        items = stage.run(prepared)
+        times.append(time.perf_counter() - start)
+
+    prepared = stage.prepare(stage.corpus)
+    tracemalloc.start()
+    try:
+        stage.run(prepared)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best, median = min(times), float(np.median(times))
+    return {"items": items, "repeat": repeat, "best": best, "median": median,
+            "perItem": best / max(items, 1), "peakBytes": peak}
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"version": RESULTS_VERSION, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit,
+            "python": platform.python_version(), "numpy": np.__version__, "machine": platform.platform()}
+
+def run(args):
+    directory = tempfile.mkdtemp()
+    try:
+        stages = allStages(*buildCorpora(args.scale, directory), args.render_count)
+        results = {"meta": dict(metadata(), scale=args.scale), "stages": {}}
+
+        for stage in stages:
+            if args.stage and not any(pattern in stage.name for pattern in args.stage):
+                continue
+            result = measure(stage, args.repeat)
+            results["stages"][stage.name] = result
+            print(f"{stage.name:40} {result['items']:>8} items  best {result['best'] * 1e3:9.2f} ms"
+                  f"  {result['perItem'] * 1e6:9.2f} us/item  peak {result['peakBytes'] / 2 ** 20:7.2f} MiB")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"results written to {args.output}")
+    return results
+
+def compare(baseline, current, threshold=0.1, memoryThreshold=0.25, minDelta=0.001):
+    # Returns [(stage, metric, baseline, current, ratio)] for every stage that got slower than
+    # 1 + threshold times its baseline best time (and by at least minDelta seconds, so timer noise
+    # on sub-millisecond stages is not reported), or grew its peak memory by more than memoryThreshold
+    regressions = []
+    for name, now in current["stages"].items():
+        before = baseline["stages"].get(name)
+        if before is None or before["items"] != now["items"]:
+            continue  # new stage or a different corpus size, nothing comparable
+
+        for metric, limit, delta in (("best", threshold, minDelta), ("peakBytes", memoryThreshold, 0)):
+            if before[metric] > 0:
+                ratio = now[metric] / before[metric]
+                if ratio > 1 + limit and now[metric] - before[metric] > delta:
+                    regressions.append((name, metric, before[metric], now[metric], ratio))
+    return regressions
+
+def runCompare(args):
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+
+    regressions = compare(baseline, current, args.threshold, args.memory_threshold, args.min_delta)
+    for name, metric, before, now, ratio in regressions:
+        print(f"REGRESSION {name} {metric}: {before:.6g} -> {now:.6g} ({ratio:.2f}x)")
+
+    print(f"{len(regressions)} regressions in {len(current['stages'])} stages")
+    return 1 if regressions else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the structure pipeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    runParser = commands.add_parser("run", help="time and memory-profile every stage")
+    runParser.add_argument("--scale", type=int, default=1, help="corpus multiplier for the scaled-up runs")
+    runParser.add_argument("--repeat", type=int, default=5)
+    runParser.add_argument("--render-count", type=int, default=20, help="molecules rendered in the rendering stage")
+    runParser.add_argument("--stage", action="append", default=[], help="only run stages whose name contains this")
+    runParser.add_argument("--output", help="JSON file for the results")
+
+    compareParser = commands.add_parser("compare", help="flag regressions against a saved baseline")
+    compareParser.add_argument("baseline")
+    compareParser.add_argument("current")
+    compareParser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown of the best time (0.1 = 10%%)")
+    compareParser.add_argument("--memory-threshold", type=float, default=0.25, help="allowed growth of peak memory")
+    compareParser.add_argument("--min-delta", type=float, default=0.001, help="smallest slowdown in seconds that counts")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(runCompare(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+from dataCollection import getElementTable
+
+import numpy as np
+
+# Bonds from Cartesian coordinates. Two atoms are bonded when their distance is at most
+# r_a + r_b + tolerance, with r the single bond covalent radii from bonddata.csv.
+#
+# Neighbor search uses a cell list: atoms are binned into cubes at least as wide as the
+# largest possible cutoff, so bonded partners are always in the same or an adjacent cell.
+# Every pair of neighboring cells is visited once (the cell itself plus 13 "forward"
+# neighbors), which makes the whole search O(N) for the bounded densities of real structures.
+
+BOND_DTYPE = np.dtype("<i4")   # (n_bonds, 3) rows of (atom a, atom b, order), as in structureStore
+DEFAULT_TOLERANCE = 0.45       # angstroms added to the sum of covalent radii
+MIN_DISTANCE = 0.1             # closer atoms are treated as overlapping duplicates, not bonds
+DENSE_CELLS_PER_ATOM = 64      # largest grid (in cells per atom) indexed with a dense table
+
+# (0, 0, 0) plus the 13 neighbor offsets that come after it in lexicographic order
+_OFFSETS = np.array([(0, 0, 0)] + [
+    (dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+    if (dx, dy, dz) > (0, 0, 0)
+], dtype=np.int64)
+
+def bondRadii(numbers):
+    # (single, triple) covalent radii in angstroms for an array of atomic numbers.
+    # Elements with no single bond radius fall back to the atomic radius; no triple radius means no triple bonds.
+    table = getElementTable()
+    single = np.where(table.singleBondRadius[numbers] > 0, table.singleBondRadius[numbers], table.radius[numbers])
+    return single, table.tripleBondRadius[numbers]
+
+def bondCapacity(numbers):
+    # Most bonds (counting multiple bonds) an atom can form: its valence electrons, or the
+    # electrons missing from its octet for atoms up to neon, which cannot expand it. Atoms with
+    # no valence in the table (transition metals, lanthanides) are not limited.
+    valence = getElementTable().valence[numbers]
+    capacity = np.where(np.asarray(numbers) <= 10, np.minimum(valence, 8 - valence), valence)
+    return np.where(valence > 0, capacity, 8)
+
+def neighborPairs(coords, cellSize, cutoffs):
+    # Yields (i, j, squared distance) arrays for every pair of atoms closer than cutoffs(i, j),
+    # which must never exceed cellSize. Each pair appears once; pairs come out one cell offset
+    # at a time to bound memory.
+    coords = np.asarray(coords, dtype=float)
+    n = len(coords)
+    if n < 2:
+        return
+
+    cells = np.floor((coords - coords.min(axis=0)) / cellSize).astype(np.int64) + 1   # +1 keeps neighbor cells non-negative
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    order = np.argsort(keys, kind="stable")
+    sortedKeys = keys[order]
+
+    # first atom and atom count per cell, as a dense table when the grid is not much larger
+    # than the structure; very sparse grids (a few far-apart atoms) binary search instead
+    numCells = int(np.prod(dims))
+    if numCells <= DENSE_CELLS_PER_ATOM * n:
+        cellCounts = np.bincount(keys, minlength=numCells)
+        cellStarts = np.cumsum(cellCounts) - cellCounts
+        locate = lambda k: (cellStarts[k], cellCounts[k])
+    else:
+        def locate(k):
+            start = np.searchsorted(sortedKeys, k, side="left")
+            return start, np.searchsorted(sortedKeys, k, side="right") - start
+
+    for offset in _OFFSETS:
+        start, counts = locate(keys + (offset[0] * dims[1] + offset[1]) * dims[2] + offset[2])
+        total = int(counts.sum())
+        if total == 0:
+            continue
+
+        # expand (atom, range of atoms in the neighbor cell) into flat candidate pairs
+        i = np.repeat(np.arange(n), counts)
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(start, counts) + within]
+
+        if not offset.any():
+            keep = i < j
+            i, j = i[keep], j[keep]
+
+        delta = coords[i] - coords[j]
+        squared = np.einsum("ij,ij->i", delta, delta)
+        keep = squared <= cutoffs(i, j) ** 2
+        yield i[keep], j[keep], squared[keep]
+
+def perceiveBonds(symbols, coords, tolerance=DEFAULT_TOLERANCE, orders=True):
+    # symbols: element symbols or atomic numbers, coords: (n_atoms, 3) in angstroms.
+    # Returns a (n_bonds, 3) BOND_DTYPE array of (a, b, order) with a < b, sorted by a then b.
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    numbers = np.asarray(symbols) if np.issubdtype(np.asarray(symbols).dtype, np.integer) else getElementTable().indices(list(symbols))
+    if len(numbers) != len(coords):
+        raise ValueError(f"{len(numbers)} atoms but {len(coords)} coordinates")
+
+    single, triple = bondRadii(numbers)
+    cutoffs = lambda i, j: single[i] + single[j] + tolerance
+    cellSize = 2 * float(single.max(initial=0)) + tolerance
+
+    found = [
+        (np.minimum(i, j), np.maximum(i, j), squared)
+        for i, j, squared in neighborPairs(coords, cellSize, cutoffs)
+    ]
+    if not found:
+        return np.empty((0, 3), dtype=BOND_DTYPE)
+
+    a, b, squared = (np.concatenate(parts) for parts in zip(*found))
+    keep = squared >= MIN_DISTANCE ** 2
+    a, b, distance = a[keep], b[keep], np.sqrt(squared[keep])
+
+    bonds = np.empty((len(a), 3), dtype=BOND_DTYPE)
+    bonds[:, 0], bonds[:, 1] = a, b
+    if orders:
+        # each bond gets at most the valence its atoms have left over after their other bonds
+        spare = bondCapacity(numbers) - np.bincount(np.concatenate((a, b)), minlength=len(numbers))
+        maxOrder = 1 + np.maximum(0, np.minimum(spare[a], spare[b]))
+        bonds[:, 2] = estimateOrders(distance, single[a] + single[b], triple[a] + triple[b],
+                                     hasTriple=(triple[a] > 0) & (triple[b] > 0), maxOrder=maxOrder)
+    else:
+        bonds[:, 2] = 1
+
+    return bonds[np.lexsort((bonds[:, 1], bonds[:, 0]))]
+
+def estimateOrders(distance, singleLength, tripleLength, hasTriple, maxOrder=3):
+    # Bond order from length: the double bond length is taken halfway between the single and
+    # triple lengths, and each distance gets the order whose length it is closest to, capped by
+    # maxOrder (per bond, from bondCapacity). Without the cap, short polar bonds such as P-O
+    # and V=O land in the triple range. Pairs without triple bond radii are always single bonds.
+    doubleLength = 0.5 * (singleLength + tripleLength)
+    order = np.where(distance < 0.5 * (singleLength + doubleLength), 2, 1)
+    order = np.where(distance < 0.5 * (doubleLength + tripleLength), 3, order)
+    return np.where(hasTriple, np.minimum(order, maxOrder), 1)
@@ -0,0 +1,297 @@
+from dataCollection import getElementTable, dataDirectory
+from geometryTable import MAX_STERIC_NUMBER
+
+from collections import namedtuple
+import argparse
+import os
+
+import numpy as np
+
+# Learned bond lengths and bond angles for single-center molecules.
+#
+# Two ridge regressions (closed form, CPU only) correct the rule-based geometry of
+# generateVSEPRBatch: one predicts each bond's length, the other the angle between each pair
+# of bonds at the central atom. Both learn the residual on top of the rule-based value, so a
+# heavily regularized model falls back to the rules. Features come from the element table
+# (radii, electronegativity, valence), lone pairs, bond orders and the (steric number,
+# lone pairs) class, and are built for whole padded batches at once.
+#
+# Predicted angles are turned back into directions through the Gram matrix of the bond
+# vectors (its top three eigenvectors), then rotated onto the VSEPR directions so the
+# molecule keeps its orientation and lone pair directions.
+#
+# Training data are reference structures in a structureStore, matched to the predictions by
+# geometryEvaluation.alignReferences. The extracted features are cached in
+# <database>.features.npz, so retraining with another alpha skips the extraction.
+#
+#   lewis3d train structures.db            # writes bondModel.npz
+#   generateVSEPRBatch(formulas, "learned")
+#   SimpleCompound("NH3").generateVSEPRStructure("learned")
+
+MODEL_FILE = "bondModel.npz"
+FEATURE_SUFFIX = ".features.npz"
+FEATURE_VERSION = 6
+MAX_DOMAINS = MAX_STERIC_NUMBER
+CLASSES = (MAX_DOMAINS + 1) ** 2   # one-hot (steric number, lone pairs) classes
+
+RidgeModel = namedtuple("RidgeModel", ["weights", "mean", "scale", "intercept"])
+
+def _domainClass(stericNumbers, lonePairs):
+    onehot = np.zeros(stericNumbers.shape + (CLASSES,))
+    np.put_along_axis(onehot, (stericNumbers * (MAX_DOMAINS + 1) + lonePairs)[..., None], 1.0, axis=-1)
+    return onehot
+
+def bondFeatures(batch):
+    # (N, D, F) features for every domain slot of a batch; only bond slots are meaningful.
+    # Returns (features, baseline) with baseline the rule-based lengths.
+    table = getElementTable()
+    c, t = batch["centralNumbers"][:, None], batch["terminalNumbers"]
+    c = np.broadcast_to(c, t.shape)
+    orders = batch["bondOrders"]
+
+    columns = [
+        table.radius[c], table.radius[t],
+        table.singleBondRadius[c] + table.singleBondRadius[t],
+        table.tripleBondRadius[c] + table.tripleBondRadius[t],
+        table.electronegativity[c], table.electronegativity[t],
+        np.abs(table.electronegativity[c] - table.electronegativity[t]),
+        table.valence[c], table.valence[t],
+        np.broadcast_to(batch["lonePairs"][:, None], t.shape), batch["terminalLonePairs"],
+        orders == 1, orders == 2, orders == 3, batch["averageBondOrders"],
+        t == 1,
+    ]
+    features = np.concatenate([np.stack(columns, axis=-1).astype(float), batch["bondLengths"][..., None],
+                               np.broadcast_to(_domainClass(batch["stericNumbers"], batch["lonePairs"])[:, None], t.shape + (CLASSES,))], axis=-1)
+    return features, batch["bondLengths"]
+
+def bondPairs(batch):
+    # (molecule, slot i, slot j) of every pair of bond slots with i < j
+    bonded = batch["bondAtoms"] >= 0
+    D = bonded.shape[1]
+    return np.nonzero(bonded[:, :, None] & bonded[:, None, :] & np.triu(np.ones((D, D), dtype=bool), 1))
+
+def pairFeatures(batch, pairs):
+    # (P, F) features for the bond pairs returned by bondPairs, and their rule-based angles in degrees
+    table = getElementTable()
+    m, i, j = pairs
+    directions = batch["directions"]
+    cosines = np.clip(np.einsum("pd,pd->p", directions[m, i], directions[m, j]), -1.0, 1.0)
+    baseline = np.degrees(np.arccos(cosines))
+
+    c = batch["centralNumbers"][m]
+    ti, tj = batch["terminalNumbers"][m, i], batch["terminalNumbers"][m, j]
+    oi, oj = batch["averageBondOrders"][m, i], batch["averageBondOrders"][m, j]
+    lpi, lpj = batch["terminalLonePairs"][m, i], batch["terminalLonePairs"][m, j]
+    en, radius = table.electronegativity, table.radius
+
+    columns = [
+        baseline, cosines,
+        en[c], radius[c], table.valence[c], batch["lonePairs"][m],
+        en[ti] + en[tj], np.abs(en[ti] - en[tj]),
+        radius[ti] + radius[tj], np.abs(radius[ti] - radius[tj]),
+        oi + oj, oi * oj, lpi + lpj,
+        (ti == 1).astype(int) + (tj == 1),
+    ]
+    features = np.concatenate([np.stack(columns, axis=-1).astype(float),
+                               _domainClass(batch["stericNumbers"][m], batch["lonePairs"][m])], axis=-1)
+    return features, baseline
+
+def fitRidge(X, y, alpha=1.0):
+    # Closed-form ridge regression on standardized features, intercept unregularized
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    Z = (X - mean) / scale
+    intercept = y.mean()
+    weights = np.linalg.solve(Z.T @ Z + alpha * np.eye(Z.shape[1]), Z.T @ (y - intercept))
+    return RidgeModel(weights, mean, scale, float(intercept))
+
+def predictRidge(model, X):
+    return ((X - model.mean) / model.scale) @ model.weights + model.intercept
+
+def directionsFromAngles(angles, bondMask, reference):
+    # Unit bond vectors (N, D, 3) whose pairwise angles best match angles (N, D, D, degrees),
+    # rotated (or reflected) onto the reference directions. Slots outside bondMask are zero.
+    gram = np.where(bondMask[:, :, None] & bondMask[:, None, :], np.cos(np.radians(angles)), 0.0)
+    values, vectors = np.linalg.eigh(gram)
+    X = vectors[..., -3:] * np.sqrt(np.maximum(values[..., None, -3:], 0))
+    X /= np.maximum(np.linalg.norm(X, axis=-1, keepdims=True), 1e-12)
+    X *= bondMask[..., None]
+
+    Y = reference * bondMask[..., None]
+    U, _, Vt = np.linalg.svd(np.einsum("nki,nkj->nij", X, Y))
+    return X @ (U @ Vt)
+
+class BondPredictor:
+    def __init__(self, lengthModel, angleModel):
+        self.lengthModel = lengthModel
+        self.angleModel = angleModel
+
+    def predictLengths(self, batch):
+        features, baseline = bondFeatures(batch)
+        bondMask = batch["bondAtoms"] >= 0
+        lengths = baseline + predictRidge(self.lengthModel, features.reshape(-1, features.shape[-1])).reshape(bondMask.shape)
+        return np.where(bondMask, np.maximum(lengths, 0.1), 0.0)
+
+    def predictAngles(self, batch):
+        # (N, D, D) angles in degrees between bond slots, from the rule-based directions elsewhere
+        angles = np.degrees(np.arccos(np.clip(np.einsum("nid,njd->nij", batch["directions"], batch["directions"]), -1.0, 1.0)))
+        pairs = bondPairs(batch)
+        if len(pairs[0]):
+            features, baseline = pairFeatures(batch, pairs)
+            predicted = np.clip(baseline + predictRidge(self.angleModel, features), 0.0, 180.0)
+            m, i, j = pairs
+            angles[m, i, j] = angles[m, j, i] = predicted
+        return angles
+
+    def predict(self, batch):
+        # (directions, bondLengths) for a generateVSEPRBatch result; lone pair slots and
+        # molecules with fewer than two bonds keep their rule-based directions
+        bondMask = batch["bondAtoms"] >= 0
+        directions = batch["directions"].copy()
+        reshaped = bondMask.sum(axis=1) >= 2
+        if reshaped.any():
+            sub = {key: value[reshaped] for key, value in batch.items() if isinstance(value, np.ndarray)}
+            learned = directionsFromAngles(self.predictAngles(sub), bondMask[reshaped], sub["directions"])
+            directions[reshaped] = np.where(bondMask[reshaped][..., None], learned, sub["directions"])
+        return directions, self.predictLengths(batch)
+
+    def save(self, path):
+        np.savez(path, featureVersion=FEATURE_VERSION,
+                 **{f"length_{name}": value for name, value in self.lengthModel._asdict().items()},
+                 **{f"angle_{name}": value for name, value in self.angleModel._asdict().items()})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["featureVersion"]) != FEATURE_VERSION:
+                raise ValueError(f"{path} was trained with other features, retrain it with 'lewis3d train'")
+            models = [RidgeModel(*(data[f"{prefix}_{name}"] for name in RidgeModel._fields)) for prefix in ("length", "angle")]
+        return cls(*models)
+
+def modelPath():
+    # $LEWIS3D_MODEL, else bondModel.npz in the data directory
+    return os.environ.get("LEWIS3D_MODEL") or os.path.join(dataDirectory(), MODEL_FILE)
+
+_predictor = None
+_predictorStamp = None   # (path, size, mtime_ns) of the file _predictor was loaded from
+
+def getPredictor():
+    # The trained model, reloaded when the file is retrained or $LEWIS3D_MODEL points elsewhere
+    global _predictor, _predictorStamp
+    path = modelPath()
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise FileNotFoundError(f"no trained bond model at {path}; train one with 'lewis3d train structures.db'")
+    stamp = (path, stat.st_size, stat.st_mtime_ns)
+    if _predictor is None or stamp != _predictorStamp:
+        _predictor = BondPredictor.load(path)
+        _predictorStamp = stamp
+    return _predictor
+
+def extractTrainingData(formulas, references):
+    # Rows for both models from matched reference structures: bond features and reference
+    # lengths, pair features and reference angles, plus the molecule index of every row
+    from batchVSEPR import generateVSEPRBatch
+    from geometryEvaluation import alignReferences
+
+    batch = generateVSEPRBatch(formulas)
+    matched, rmsd, _ = alignReferences(batch, references)
+    batch["bondAtoms"] = np.where(np.isnan(rmsd)[:, None], -1, batch["bondAtoms"])  # unmatched molecules give no rows
+
+    features, baseline = bondFeatures(batch)
+    bonded = np.nonzero(batch["bondAtoms"] >= 0)
+    pairs = bondPairs(batch)
+    pairX, pairBaseline = pairFeatures(batch, pairs)
+    m, i, j = pairs
+    cosines = np.einsum("pd,pd->p", matched[m, i], matched[m, j]) / (
+        np.linalg.norm(matched[m, i], axis=1) * np.linalg.norm(matched[m, j], axis=1))
+
+    return {
+        "bondX": features[bonded], "bondBaseline": baseline[bonded],
+        "bondY": np.linalg.norm(matched[bonded], axis=-1), "bondMolecule": bonded[0],
+        "pairX": pairX, "pairBaseline": pairBaseline,
+        "pairY": np.degrees(np.arccos(np.clip(cosines, -1.0, 1.0))), "pairMolecule": m,
+        "rmsd": rmsd,
+    }
+
+def storeTrainingData(database, useCache=True):
+    # extractTrainingData for every structure of a structureStore file, cached next to it
+    # until the database changes
+    from geometryEvaluation import storeReferences
+    from structureStore import StructureStore
+
+    stat = os.stat(database)
+    fingerprint = np.array([FEATURE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    cachePath = database + FEATURE_SUFFIX
+
+    if useCache:
+        try:
+            with np.load(cachePath) as cached:
+                if np.array_equal(cached["fingerprint"], fingerprint):
+                    return {name: cached[name] for name in cached.files if name != "fingerprint"}
+        except (OSError, KeyError, ValueError):
+            pass  # missing or unreadable cache, extract below
+
+    with StructureStore(database) as store:
+        data = extractTrainingData(*storeReferences(store))
+
+    if useCache:
+        try:
+            np.savez(cachePath, fingerprint=fingerprint, **data)
+        except OSError:
+            pass  # read-only directory, keep the in-memory features
+    return data
+
+def train(data, alpha=1.0, maxRMSD=0.5, validation=0.2, seed=0):
+    # Fits both models on the rows of molecules matched within maxRMSD angstroms.
+    # A random `validation` fraction of the molecules is held out; returns (predictor, report)
+    # with the mean absolute errors of the rules and of the model on the held-out rows.
+    good = data["rmsd"] <= maxRMSD  # NaN (unmatched) compares False
+    held = np.random.default_rng(seed).random(len(good)) < validation
+    report = {"molecules": int(good.sum()), "heldOut": int((good & held).sum())}
+    models = []
+
+    for name in ("bond", "pair"):
+        molecule = data[f"{name}Molecule"]
+        X, baseline, y = data[f"{name}X"], data[f"{name}Baseline"], data[f"{name}Y"]
+        fit, test = good[molecule] & ~held[molecule], good[molecule] & held[molecule]
+        if not fit.any():
+            raise ValueError("no matched reference structures to train on")
+
+        model = fitRidge(X[fit], y[fit] - baseline[fit], alpha)
+        models.append(model)
+        if test.any():
+            report[name] = {"rows": int(test.sum()),
+                            "baselineMAE": float(np.abs(baseline[test] - y[test]).mean()),
+                            "modelMAE": float(np.abs(baseline[test] + predictRidge(model, X[test]) - y[test]).mean())}
+
+    return BondPredictor(*models), report
+
+def addArguments(parser):
+    parser.add_argument("database", help="structureStore SQLite file with the reference structures")
+    parser.add_argument("--model", default=None, help=f"output file (default {MODEL_FILE} in the data directory or $LEWIS3D_MODEL)")
+    parser.add_argument("--alpha", type=float, default=1.0, help="ridge regularization")
+    parser.add_argument("--max-rmsd", type=float, default=0.5, help="skip references that match worse than this (angstroms)")
+    parser.add_argument("--validation", type=float, default=0.2, help="fraction of molecules held out for the report")
+    parser.add_argument("--no-cache", action="store_true", help=f"re-extract features instead of using <database>{FEATURE_SUFFIX}")
+
+def run(args):
+    data = storeTrainingData(args.database, useCache=not args.no_cache)
+    predictor, report = train(data, args.alpha, args.max_rmsd, args.validation)
+
+    print(f"{report['molecules']} matched molecules, {report['heldOut']} held out")
+    for name, label, unit in (("bond", "bond lengths", "A"), ("pair", "bond angles", "deg")):
+        if name in report:
+            stats = report[name]
+            print(f"{label:>12}: MAE {stats['baselineMAE']:.4f} -> {stats['modelMAE']:.4f} {unit} over {stats['rows']} held-out rows")
+
+    path = args.model or modelPath()
+    predictor.save(path)
+    print(f"model written to {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the bond length and angle predictor")
+    addArguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,344 @@
+from Compound import hillFormula
+from dataCollection import getElementTable
+
+from collections import namedtuple
+from fractions import Fraction
+from itertools import product
+import argparse
+import re
+
+import numpy as np
+
+# Crystal structures from CIF files, without ASE.
+#
+# readCIF tokenizes a CIF 1.1 file into data blocks: quoted strings, ;-delimited text fields,
+# comments and loop_ tables are handled, and every tag maps to its value or, inside a loop, to
+# its column. crystalFromBlock reads the cell parameters, the fractional coordinates of the
+# asymmetric unit (numbers such as 0.152(2) give the value and its standard uncertainty,
+# 0.002) and the symmetry operators ("1/2-x,y,-z") as (m, 3, 3) rotations and (m, 3)
+# translations.
+#
+# expandSymmetry applies all m operators to all n sites as one (n, m) batched product and
+# wraps the images into the cell. Special positions produce the same site several times, so
+# the images are put in a periodic spatial hash, a fractional grid with about one site per
+# cell, and an image is dropped when an earlier image of the same element lies within the
+# tolerance (in angstroms) in one of the 8 cells around it, across cell faces too.
+# supercell repeats a crystal N x M x K times by broadcasting the lattice translations over
+# the sites. There are no loops over atoms, so cells with hundreds of thousands of atoms are
+# ready for bondPerception and rendering in well under a second.
+#
+#   crystal = readCrystal("1008071.cif", repeats=(2, 2, 2))
+#   coords = cartesian(crystal)
+#   lewis3d cif 1008071.cif -o 1008071.xyz --supercell 2 2 2
+
+DEDUP_TOLERANCE = 0.01  # angstroms between symmetry images counted as one site
+
+CIFBlock = namedtuple("CIFBlock", ["name", "items"])  # items: lowercase tag -> value, or list of values in a loop
+
+Crystal = namedtuple("Crystal", [
+    "name",
+    "cell",           # (a, b, c, alpha, beta, gamma), angstroms and degrees
+    "lattice",        # (3, 3) cell vectors a, b, c as rows, angstroms; a along x, b in the xy plane
+    "numbers",        # (n,) atomic numbers
+    "fractional",     # (n, 3) fractional coordinates
+    "uncertainty",    # (n, 3) standard uncertainties of the fractional coordinates, 0 when not given
+    "labels",         # (n,) site labels of the asymmetric unit
+    "occupancy"       # (n,)
+])
+
+SymmetryOperations = namedtuple("SymmetryOperations", ["rotations", "translations"])  # (m, 3, 3), (m, 3)
+
+_TOKEN = re.compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(#.*)|(\S+)""")
+_NUMBER = re.compile(r"^([+-]?(?:\d+\.?\d*|\.\d+))(?:[eE]([+-]?\d+))?(?:\((\d+)\))?$")
+
+def _tokens(text):
+    # (text, quoted) pairs; ;-delimited text fields count as quoted values
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith(";"):
+            field = [line[1:]]
+            i += 1
+            while i < len(lines) and not lines[i].startswith(";"):
+                field.append(lines[i])
+                i += 1
+            i += 1
+            yield "\n".join(field).strip(), True
+            continue
+        for single, double, comment, bare in _TOKEN.findall(line):
+            if comment:
+                break
+            if bare:
+                yield bare, False
+            else:
+                yield single or double, True
+        i += 1
+
+def _isKeyword(token, quoted):
+    lower = token.lower()
+    return not quoted and (token.startswith("_") or lower == "loop_" or lower.startswith(("data_", "save_", "global_")))
+
+def parseCIF(text):
+    # List of CIFBlocks in file order
+    tokens = list(_tokens(text))
+    blocks = []
+    items = None
+    i = 0
+    while i < len(tokens):
+        token, quoted = tokens[i]
+        lower = token.lower()
+        i += 1
+        if quoted:
+            continue
+        if lower.startswith("data_"):
+            items = {}
+            blocks.append(CIFBlock(token[5:], items))
+        elif items is None:
+            continue
+        elif lower == "loop_":
+            tags = []
+            while i < len(tokens) and not tokens[i][1] and tokens[i][0].startswith("_"):
+                tags.append(tokens[i][0].lower())
+                i += 1
+            start = i
+            while i < len(tokens) and not _isKeyword(*tokens[i]):
+                i += 1
+            values = [value for value, _ in tokens[start:i]]
+            if tags and len(values) % len(tags):
+                raise ValueError(f"loop of {tags[0]} has {len(values)} values for {len(tags)} columns")
+            for k, tag in enumerate(tags):
+                items[tag] = values[k::len(tags)]
+        elif token.startswith("_") and i < len(tokens):
+            items[lower] = tokens[i][0]
+            i += 1
+    return blocks
+
+def readCIF(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        return parseCIF(file.read())
+
+def parseNumbers(values):
+    # (values, uncertainties) float arrays for CIF numbers such as "0.152(2)" -> (0.152, 0.002);
+    # "." and "?" are nan
+    values = [values] if isinstance(values, str) else values
+    numbers = np.full(len(values), np.nan)
+    uncertainties = np.zeros(len(values))
+    for k, text in enumerate(values):
+        match = _NUMBER.match(text.strip())
+        if match is None:
+            if text.strip() in (".", "?"):
+                continue
+            raise ValueError(f"not a CIF number: {text!r}")
+        mantissa, exponent, esd = match.groups()
+        scale = 10.0 ** int(exponent or 0)
+        numbers[k] = float(mantissa) * scale
+        if esd:
+            decimals = len(mantissa.split(".")[1]) if "." in mantissa else 0
+            uncertainties[k] = int(esd) * 10.0 ** -decimals * scale
+    return numbers, uncertainties
+
+def parseOperation(text):
+    # (rotation, translation) of one symmetry operator such as "1/2-x, y+1/2, -z"
+    parts = text.replace(" ", "").lower().split(",")
+    if len(parts) != 3:
+        raise ValueError(f"not a symmetry operator: {text!r}")
+    rotation = np.zeros((3, 3))
+    translation = np.zeros(3)
+    for row, part in enumerate(parts):
+        for term in re.findall(r"[+-]?[^+-]+", part):
+            sign = -1.0 if term.startswith("-") else 1.0
+            term = term.lstrip("+-")
+            axis = "xyz".find(term[-1])
+            if axis >= 0:
+                coefficient = term[:-1].rstrip("*")
+                rotation[row, axis] += sign * (float(Fraction(coefficient)) if coefficient else 1.0)
+            else:
+                translation[row] += sign * float(Fraction(term))
+    return rotation, translation
+
+def symmetryOperations(block):
+    # Operators of a block, the identity alone when it lists none
+    for tag in ("_space_group_symop_operation_xyz", "_symmetry_equiv_pos_as_xyz"):
+        operators = block.items.get(tag)
+        if operators:
+            operators = [operators] if isinstance(operators, str) else operators
+            rotations, translations = zip(*(parseOperation(text) for text in operators))
+            return SymmetryOperations(np.array(rotations), np.array(translations))
+    return SymmetryOperations(np.eye(3)[None], np.zeros((1, 3)))
+
+def latticeVectors(a, b, c, alpha, beta, gamma):
+    # (3, 3) rows a, b, c from the cell parameters
+    alpha, beta, gamma = np.radians([alpha, beta, gamma])
+    cx = c * np.cos(beta)
+    cy = c * (np.cos(alpha) - np.cos(beta) * np.cos(gamma)) / np.sin(gamma)
+    return np.array([
+        [a, 0.0, 0.0],
+        [b * np.cos(gamma), b * np.sin(gamma), 0.0],
+        [cx, cy, np.sqrt(max(c * c - cx * cx - cy * cy, 0.0))]
+    ])
+
+def _elementSymbols(types):
+    # "U4+", "O2-", "Fe3" -> element symbols known to the element table
+    table = getElementTable()
+    symbols = []
+    for text in types:
+        match = re.match(r"([A-Za-z])([a-z]?)", text)
+        if match is None:
+            raise ValueError(f"no element in atom site {text!r}")
+        one, two = match.group(1).upper(), match.group(1).upper() + match.group(2)
+        symbols.append(two if two in table.index else one)
+    return symbols
+
+def crystalFromBlock(block, keepDummies=False):
+    # (asymmetric unit Crystal, SymmetryOperations). Dummy sites (_atom_site_calc_flag "dum")
+    # are left out unless keepDummies.
+    items = block.items
+    cell, _ = parseNumbers([items.get(f"_cell_{name}", "?") for name in
+                            ("length_a", "length_b", "length_c", "angle_alpha", "angle_beta", "angle_gamma")])
+    if np.isnan(cell[:3]).any():
+        raise ValueError(f"data_{block.name} has no cell lengths")
+    cell[3:] = np.where(np.isnan(cell[3:]), 90.0, cell[3:])
+
+    if "_atom_site_fract_x" not in items:
+        raise ValueError(f"data_{block.name} has no fractional atom sites")
+    columns = [items[f"_atom_site_fract_{axis}"] for axis in "xyz"]
+    columns = [[column] if isinstance(column, str) else column for column in columns]
+    n = len(columns[0])
+    fractional, uncertainty = (np.stack(arrays, axis=1) for arrays in zip(*(parseNumbers(column) for column in columns)))
+
+    def column(tag, default):
+        values = items.get(tag, default)
+        return [values] * n if isinstance(values, str) else values
+
+    labels = column("_atom_site_label", "?")
+    types = column("_atom_site_type_symbol", None) if "_atom_site_type_symbol" in items else labels
+    occupancy, _ = parseNumbers(column("_atom_site_occupancy", "1"))
+    occupancy = np.where(np.isnan(occupancy), 1.0, occupancy)
+
+    keep = ~np.isnan(fractional).any(axis=1)
+    if not keepDummies:
+        keep &= np.array([flag.lower() != "dum" for flag in column("_atom_site_calc_flag", "?")])
+    rows = np.flatnonzero(keep)
+    numbers = getElementTable().indices(_elementSymbols([types[k] for k in rows.tolist()]))
+
+    crystal = Crystal(block.name, tuple(cell.tolist()), latticeVectors(*cell), numbers, fractional[rows],
+                      uncertainty[rows], np.array(labels, dtype=object)[rows], occupancy[rows])
+    return crystal, symmetryOperations(block)
+
+def uniqueSites(fractional, numbers, lattice, tolerance=DEDUP_TOLERANCE):
+    # Indices of the sites to keep: the first of every group of same-element sites closer than
+    # tolerance (angstroms) under periodic boundaries, found with a spatial hash
+    n = len(fractional)
+    wrapped = fractional % 1.0
+    # grid cells at least 2 * tolerance thick across the lattice planes and holding about one
+    # site each, so a cell's sites are found by indexing a dense table, and a site's partners
+    # can only be in its own cell or the next one on the side of the cell it sits in: 8 cells
+    spacing = 1.0 / np.linalg.norm(np.linalg.inv(lattice).T, axis=1)
+    thickness = max(2 * tolerance, (abs(np.linalg.det(lattice)) / max(n, 1)) ** (1 / 3))
+    grid = np.maximum(np.floor(spacing / thickness).astype(np.int64), 1)
+    scaled = wrapped * grid
+    cells = np.minimum(scaled.astype(np.int64), grid - 1)
+    side = np.where(scaled - cells >= 0.5, 1, -1)
+
+    # each axis's share of the cell key, for the site's own cell and the one beside it
+    stride = (grid[1] * grid[2], grid[2], 1)
+    parts = [(cells[:, axis] * stride[axis], (cells[:, axis] + side[:, axis]) % grid[axis] * stride[axis]) for axis in range(3)]
+    key = parts[0][0] + parts[1][0] + parts[2][0]
+    order = np.argsort(key, kind="stable")
+    cellCount = np.bincount(key, minlength=int(grid.prod()))
+    cellStart = np.cumsum(cellCount) - cellCount
+    duplicate = np.zeros(n, dtype=bool)
+    for i, j, k in product(range(2), repeat=3):
+        neighbor = parts[0][i] + parts[1][j] + parts[2][k]
+        counts = cellCount[neighbor]
+        p = np.repeat(np.arange(n), counts)
+        q = order[np.repeat(cellStart[neighbor] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        candidate = (q < p) & (numbers[q] == numbers[p])
+        p, q = p[candidate], q[candidate]
+        delta = wrapped[p] - wrapped[q]
+        delta = (delta - np.rint(delta)) @ lattice
+        duplicate[p[np.einsum("ki,ki->k", delta, delta) < tolerance * tolerance]] = True
+    return np.flatnonzero(~duplicate)
+
+def expandSymmetry(crystal, operations, tolerance=DEDUP_TOLERANCE):
+    # The full unit cell: every operator applied to every site, wrapped into [0, 1), duplicates removed.
+    # Images of one site stay together, its own position first when the identity is listed first.
+    rotations, translations = operations
+    n, m = len(crystal.numbers), len(rotations)
+    fractional = (np.einsum("mij,nj->nmi", rotations, crystal.fractional) + translations[None]).reshape(-1, 3) % 1.0
+    uncertainty = np.einsum("mij,nj->nmi", np.abs(rotations), crystal.uncertainty).reshape(-1, 3)
+    numbers = np.repeat(crystal.numbers, m)
+    keep = uniqueSites(fractional, numbers, crystal.lattice, tolerance)
+    return crystal._replace(numbers=numbers[keep], fractional=fractional[keep], uncertainty=uncertainty[keep],
+                            labels=np.repeat(crystal.labels, m)[keep], occupancy=np.repeat(crystal.occupancy, m)[keep])
+
+def supercell(crystal, repeats):
+    # The crystal repeated (N, M, K) times along a, b and c; fractional coordinates refer to the new cell
+    repeats = np.asarray(repeats, dtype=np.int64)
+    if repeats.shape != (3,) or (repeats < 1).any():
+        raise ValueError(f"supercell repeats must be three positive integers, got {repeats.tolist()}")
+    shifts = np.stack(np.meshgrid(*(np.arange(r) for r in repeats.tolist()), indexing="ij"), axis=-1).reshape(-1, 3)
+    copies = len(shifts)
+    fractional = ((crystal.fractional[None] + shifts[:, None]) / repeats).reshape(-1, 3)
+    a, b, c, alpha, beta, gamma = crystal.cell
+    return crystal._replace(cell=(a * repeats[0], b * repeats[1], c * repeats[2], alpha, beta, gamma),
+                            lattice=crystal.lattice * repeats[:, None], numbers=np.tile(crystal.numbers, copies),
+                            fractional=fractional, uncertainty=np.tile(crystal.uncertainty / repeats, (copies, 1)),
+                            labels=np.tile(crystal.labels, copies), occupancy=np.tile(crystal.occupancy, copies))
+
+def cartesian(crystal):
+    # (n, 3) angstroms
+    return crystal.fractional @ crystal.lattice
+
+def structureBlock(path, block=None):
+    # The named data block, or the first one with fractional atom sites
+    blocks = [b for b in readCIF(path) if "_atom_site_fract_x" in b.items]
+    if block is not None:
+        blocks = [b for b in blocks if b.name == block]
+    if not blocks:
+        raise ValueError(f"{path} has no data block {block or 'with fractional atom sites'}")
+    return blocks[0]
+
+def readCrystal(path, block=None, repeats=(1, 1, 1), tolerance=DEDUP_TOLERANCE, keepDummies=False):
+    # Unit cell (or supercell) of one data block
+    crystal = expandSymmetry(*crystalFromBlock(structureBlock(path, block), keepDummies), tolerance)
+    return crystal if tuple(repeats) == (1, 1, 1) else supercell(crystal, repeats)
+
+def crystalFormula(crystal):
+    symbols = getElementTable().symbols
+    elements, counts = np.unique(crystal.numbers, return_counts=True)
+    return hillFormula({str(symbols[e]): int(count) for e, count in zip(elements, counts)})
+
+def writeCrystalXYZ(file, crystal):
+    # Extended XYZ: the lattice goes in the comment line
+    symbols = getElementTable().symbols[crystal.numbers]
+    lattice = " ".join(f"{value:.8f}" for value in crystal.lattice.reshape(-1).tolist())
+    lines = [f"{len(symbols)}", f'Lattice="{lattice}" Properties=species:S:1:pos:R:3 pbc="T T T" name={crystal.name}']
+    lines.extend(f"{symbol:<2} {x:20.15f} {y:20.15f} {z:20.15f}" for symbol, (x, y, z) in zip(symbols, cartesian(crystal).tolist()))
+    file.write("\n".join(lines) + "\n")
+
+def addArguments(parser):
+    parser.add_argument("cif", help="CIF file")
+    parser.add_argument("-o", "--output", default=None, help="extended XYZ file for the expanded cell")
+    parser.add_argument("--block", default=None, help="data block name (default: the first with atom sites)")
+    parser.add_argument("--supercell", type=int, nargs=3, default=(1, 1, 1), metavar=("N", "M", "K"))
+    parser.add_argument("--tolerance", type=float, default=DEDUP_TOLERANCE, help="angstroms between images merged into one site")
+    parser.add_argument("--keep-dummies", action="store_true", help="keep sites flagged 'dum'")
+
+def run(args):
+    asymmetric, operations = crystalFromBlock(structureBlock(args.cif, args.block), args.keep_dummies)
+    crystal = supercell(expandSymmetry(asymmetric, operations, args.tolerance), args.supercell)
+    a, b, c, alpha, beta, gamma = crystal.cell
+    print(f"data_{crystal.name}: {len(operations.rotations)} operators, {len(asymmetric.numbers)} sites -> "
+          f"{len(crystal.numbers)} atoms ({crystalFormula(crystal)}), "
+          f"cell {a:.4f} {b:.4f} {c:.4f} {alpha:.2f} {beta:.2f} {gamma:.2f}")
+    if args.output:
+        with open(args.output, "w") as file:
+            writeCrystalXYZ(file, crystal)
+        print(f"wrote {args.output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expand a CIF file into a unit cell or supercell")
+    addArguments(parser)
+    run(parser.parse_args())
@@ -1,31 +1,148 @@
 import csv
+import os
+import sys
 
-# All data is formatted as a dictionary with the element symbol as the key
-# Values are lists containing the atomic number, atomic radius, electronegativity, and valence electrons
+import numpy as np
 
-with open("Nonmetals.csv", "r") as file:
-    reader = csv.reader(file)
-    next(reader)  # Skip the header row
+# Element data is stored column-wise in an ElementTable, indexed by atomic number (row 0 is unused).
+# The CSVs are parsed on first use and then cached in a binary .npz file next to them;
+# the cache is rebuilt whenever one of the CSVs changes.
 
-    nonmetalsData = dict((row[0], [float(r) if r != "" else 0 for r in row[1:]]) for row in reader)
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+TABLE_FILE = "TrimmedTable.csv"
+CATEGORY_FILES = {"Nonmetals.csv": 1, "Metals.csv": 2, "Metaloids.csv": 3}  # category codes, 0 = unclassified
+RADII_FILE = "bonddata.csv"   # covalent radii in pm, single bond column 6 and triple bond column 7
+CACHE_FILE = ".elementTable.npz"
+CACHE_VERSION = 2
 
-with open("Metals.csv", "r") as file:
-    reader = csv.reader(file)
-    next(reader)  # Skip the header row
+class ElementTable:
+    COLUMNS = ["atomicNumber", "radius", "electronegativity", "valence", "category", "singleBondRadius", "tripleBondRadius"]
 
-    metalsData = dict((row[0], [float(r) if r != "" else 0 for r in row[1:]]) for row in reader)
+    def __init__(self, symbols, atomicNumber, radius, electronegativity, valence, category, singleBondRadius, tripleBondRadius):
+        self.symbols = symbols                      # element symbol per row
+        self.atomicNumber = atomicNumber
+        self.radius = radius                        # atomic radius in angstroms
+        self.electronegativity = electronegativity  # Pauling, 0 where unknown
+        self.valence = valence                      # valence electrons, 0 where unknown
+        self.category = category                    # 1 nonmetal, 2 metal, 3 metalloid
+        self.singleBondRadius = singleBondRadius    # covalent radii in angstroms, 0 where unknown
+        self.tripleBondRadius = tripleBondRadius
 
-with open("Metaloids.csv", "r") as file:
-    reader = csv.reader(file)
-    next(reader)  # Skip the header row
+        self.index = {str(symbol): i for i, symbol in enumerate(symbols) if symbol}
 
-    metaloidsData = dict((row[0], [float(r) if r != "" else 0 for r in row[1:]]) for row in reader)
+    def __contains__(self, symbol):
+        return symbol in self.index
 
-with open("TrimmedTable.csv", "r") as file:
-    reader = csv.reader(file)
-    next(reader)  # Skip the header row
+    def __len__(self):
+        return len(self.index)
 
-    periodicTable = dict((row[0], [float(r) if r != "" else 0 for r in row[1:]]) for row in reader)
+    def indices(self, symbols):
+        # Row (atomic number) for each symbol; raises KeyError for unknown elements
+        return np.fromiter((self.index[s] for s in symbols), dtype=np.int64, count=len(symbols))
+
+    def row(self, symbol):
+        # Legacy [atomic number, radius, electronegativity, valence] list
+        i = self.index[symbol]
+        return [float(self.atomicNumber[i]), float(self.radius[i]), float(self.electronegativity[i]), float(self.valence[i])]
+
+def dataDirectory():
+    # $LEWIS3D_DATA, then the source checkout, then the share/lewis3d directory of an installed copy
+    candidates = [os.environ.get("LEWIS3D_DATA"), MODULE_DIR, os.path.join(sys.prefix, "share", "lewis3d")]
+    for directory in candidates:
+        if directory and os.path.exists(os.path.join(directory, TABLE_FILE)):
+            return directory
+    return MODULE_DIR
+
+def _readRows(path):
+    with open(path, "r") as file:
+        reader = csv.reader(file)
+        next(reader)  # Skip the header row
+
+        return [row for row in reader if row]
+
+def _fingerprint(directory):
+    stats = [os.stat(os.path.join(directory, name)) for name in [TABLE_FILE, RADII_FILE] + list(CATEGORY_FILES)]
+    return np.array([CACHE_VERSION] + [value for st in stats for value in (st.st_mtime_ns, st.st_size)], dtype=np.int64)
+
+def _buildTable(directory):
+    rows = _readRows(os.path.join(directory, TABLE_FILE))
+    size = max(int(row[1]) for row in rows) + 1
+
+    symbols = np.full(size, "", dtype="<U3")
+    columns = {name: np.zeros(size) for name in ElementTable.COLUMNS[:4]}
+    category = np.zeros(size, dtype=np.int8)
+    singleBondRadius, tripleBondRadius = np.zeros(size), np.zeros(size)
+
+    for row in rows:
+        i = int(row[1])
+        symbols[i] = row[0]
+        for name, value in zip(ElementTable.COLUMNS[:4], row[1:]):
+            columns[name][i] = float(value) if value != "" else 0
+
+    for row in _readRows(os.path.join(directory, RADII_FILE)):
+        i = int(row[0])
+        if i < size:
+            singleBondRadius[i] = float(row[6]) / 100 if row[6] != "" else 0
+            tripleBondRadius[i] = float(row[7]) / 100 if row[7] != "" else 0
+
+    index = {str(symbol): i for i, symbol in enumerate(symbols) if symbol}
+    for name, code in CATEGORY_FILES.items():
+        for row in _readRows(os.path.join(directory, name)):
+            if row[0] in index: category[index[row[0]]] = code
+
+    return ElementTable(symbols, category=category, singleBondRadius=singleBondRadius, tripleBondRadius=tripleBondRadius, **columns)
+
+def loadElementTable(directory=None, useCache=True):
+    directory = directory or dataDirectory()
+    fingerprint = _fingerprint(directory)
+    cachePath = os.path.join(directory, CACHE_FILE)
+
+    if useCache:
+        try:
+            with np.load(cachePath) as cached:
+                if np.array_equal(cached["fingerprint"], fingerprint):
+                    return ElementTable(cached["symbols"], *(cached[name] for name in ElementTable.COLUMNS))
+        except (OSError, KeyError, ValueError):
+            pass  # missing or unreadable cache, rebuild below
+
+    table = _buildTable(directory)
+
+    if useCache:
+        try:
+            np.savez(cachePath, fingerprint=fingerprint, symbols=table.symbols,
+                     **{name: getattr(table, name) for name in ElementTable.COLUMNS})
+        except OSError:
+            pass  # read-only data directory, keep the in-memory table only
+
+    return table
+
+_elementTable = None
+
+def getElementTable():
+    global _elementTable
+    if _elementTable is None:
+        _elementTable = loadElementTable()
+    return _elementTable
+
+# Legacy dictionaries: symbol -> [atomic number, atomic radius, electronegativity, valence electrons].
+# They are built on first access (e.g. "from dataCollection import periodicTable").
+def _legacyCategory(name):
+    return dict((row[0], [float(r) if r != "" else 0 for r in row[1:]]) for row in _readRows(os.path.join(dataDirectory(), name)))
+
+_legacy = {}
+_legacyBuilders = {
+    "periodicTable": lambda: {symbol: getElementTable().row(symbol) for symbol in getElementTable().index},
+    "nonmetalsData": lambda: _legacyCategory("Nonmetals.csv"),
+    "metalsData": lambda: _legacyCategory("Metals.csv"),
+    "metaloidsData": lambda: _legacyCategory("Metaloids.csv")
+}
+
+def __getattr__(name):
+    if name in _legacyBuilders:
+        if name not in _legacy:
+            _legacy[name] = _legacyBuilders[name]()
+        return _legacy[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 element_color_map = {
     # Nonmetals
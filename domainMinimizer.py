@@ -0,0 +1,119 @@
+import numpy as np
+
+# Electron domains as points on the unit sphere around the central atom.
+# The energy of a set of directions r_i is
+#
+#   E = sum_{i<j} w_ij / |r_i - r_j|^p_ij,   w_ij = PAIR_WEIGHTS[kind_i, kind_j] * m_i * m_j,
+#                                          p_ij = PAIR_EXPONENTS[kind_i, kind_j]
+#
+# kind is 0 for bonding pairs and 1 for lone pairs, so LP-LP > LP-BP > BP-BP repulsion.
+# Lone pairs also repel with a softer exponent: a diffuse lone pair keeps pushing on bonds
+# well past 90 degrees, which is what closes the equatorial angle of see-saw SF4 (~102) and
+# the bent and pyramidal angles of H2O and NH3. With one exponent for every pair, any lone
+# pair weight large enough to do that collapses SF4 into a square pyramid.
+# m_i is 1 for lone pairs and BOND_ORDER_WEIGHT[order] for bonds: multiple bonds take up more room.
+# Fractional orders (averages over resonance forms) interpolate between the integer weights.
+# Minimization is projected gradient descent on the sphere with an analytic gradient,
+# done for a whole (N, max_domains, 3) batch at once.
+
+PAIR_WEIGHTS = np.array([
+    [1.0, 1.3],    # BP-BP, BP-LP
+    [1.3, 2.0]     # LP-BP, LP-LP
+])
+PAIR_EXPONENTS = np.array([
+    [3.0, 2.0],    # BP-BP, BP-LP
+    [2.0, 1.5]     # LP-BP, LP-LP
+])
+BOND_ORDER_WEIGHT = np.array([1.0, 1.0, 1.4, 1.5])  # indexed by bond order
+
+# optional symmetry-breaking offsets per slot (see relaxDomains' jitter), identical for every molecule
+# so results never depend on how molecules are batched
+_JITTER = np.random.default_rng(20240611).normal(size=(16, 3))
+
+def domainWeights(lonePairMask, bondOrders, domainMask):
+    # (N, D, D) pair weights, zero for padding and on the diagonal
+    kind = lonePairMask.astype(np.int64)
+    size = np.where(lonePairMask, 1.0, np.interp(bondOrders, np.arange(len(BOND_ORDER_WEIGHT)), BOND_ORDER_WEIGHT))
+    weights = PAIR_WEIGHTS[kind[:, :, None], kind[:, None, :]] * size[:, :, None] * size[:, None, :]
+
+    pairMask = domainMask[:, :, None] & domainMask[:, None, :]
+    pairMask &= ~np.eye(domainMask.shape[1], dtype=bool)
+    return np.where(pairMask, weights, 0.0)
+
+def domainExponents(lonePairMask):
+    # (N, D, D) pair exponents
+    kind = lonePairMask.astype(np.int64)
+    return PAIR_EXPONENTS[kind[:, :, None], kind[:, None, :]]
+
+def energyAndGradient(directions, weights, exponents):
+    # exponents: (N, D, D) from domainExponents, or one number for every pair.
+    # Returns per-molecule energies (N,) and dE/dr (N, D, 3)
+    diff = directions[:, :, None, :] - directions[:, None, :, :]   # r_i - r_j
+    squared = np.einsum("nijk,nijk->nij", diff, diff)
+    squared = np.where(weights > 0, np.maximum(squared, 1e-18), 1.0)
+
+    pair = weights / squared ** (0.5 * exponents)                  # w_ij / |r_i - r_j|^p_ij
+    energy = 0.5 * pair.sum(axis=(1, 2))
+    gradient = -np.einsum("nij,nijk->nik", exponents * pair / squared, diff)
+    return energy, gradient
+
+def relaxDomains(directions, lonePairMask, bondOrders, domainMask=None, tolerance=1e-7, maxIterations=2000, step=0.05, jitter=0.0, exponent=None):
+    # directions: (N, D, 3) or (D, 3) starting unit vectors; lonePairMask, bondOrders: matching (N, D) or (D,)
+    # exponent: one exponent for every pair instead of PAIR_EXPONENTS
+    # Returns (relaxed directions, iterations used per molecule). Padding slots come back as zeros.
+    single = np.ndim(directions) == 2
+    directions = np.array(directions, dtype=float, ndmin=3)
+    lonePairMask = np.array(lonePairMask, dtype=bool, ndmin=2)
+    bondOrders = np.array(bondOrders, dtype=float, ndmin=2)
+    domainMask = (np.linalg.norm(directions, axis=-1) > 0) if domainMask is None else np.array(domainMask, dtype=bool, ndmin=2)
+
+    n, D, _ = directions.shape
+    weights = domainWeights(lonePairMask, bondOrders, domainMask)
+    exponents = domainExponents(lonePairMask) if exponent is None else np.full(weights.shape, float(exponent))
+
+    r = directions + jitter * _JITTER[:D]
+    r = np.where(domainMask[..., None], r, 0.0)
+    r /= np.maximum(np.linalg.norm(r, axis=-1, keepdims=True), 1e-12)
+
+    energy, gradient = energyAndGradient(r, weights, exponents)
+    steps = np.full(n, step)
+    iterations = np.zeros(n, dtype=np.int64)
+
+    # molecules are dropped from the working set as they converge, so each iteration
+    # only costs as much as the molecules that are still moving
+    active = np.flatnonzero(domainMask.sum(axis=1) > 1)
+
+    for _ in range(maxIterations):
+        if not len(active):
+            break
+        ra, ga, mask = r[active], gradient[active], domainMask[active, :, None]
+
+        # tangential component of the gradient on the sphere
+        tangent = ga - (ga * ra).sum(axis=-1, keepdims=True) * ra
+        tangent = np.where(mask, tangent, 0.0)
+        moving = np.sqrt((tangent * tangent).sum(axis=-1).max(axis=1)) > tolerance
+        active, ra, ga, tangent, mask = active[moving], ra[moving], ga[moving], tangent[moving], mask[moving]
+        if not len(active):
+            break
+
+        trial = ra - steps[active, None, None] * tangent
+        trial /= np.maximum(np.linalg.norm(trial, axis=-1, keepdims=True), 1e-12)
+        trial = np.where(mask, trial, 0.0)
+
+        trialEnergy, trialGradient = energyAndGradient(trial, weights[active], exponents[active])
+
+        # accept downhill steps and grow the step; otherwise shrink it and retry.
+        # a step that no longer changes the energy beyond rounding also ends the search
+        current = energy[active]
+        accept = trialEnergy <= current
+        stalled = accept & (current - trialEnergy <= 1e-14 * np.abs(current))
+        taken = active[accept]
+        r[taken] = trial[accept]
+        energy[taken] = trialEnergy[accept]
+        gradient[taken] = trialGradient[accept]
+        steps[active] = np.where(accept, steps[active] * 1.2, steps[active] * 0.5)
+        iterations[active] += 1
+
+        active = active[(steps[active] > 1e-12) & ~stalled]
+
+    return (r[0], iterations[0]) if single else (r, iterations)
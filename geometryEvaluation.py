@@ -0,0 +1,254 @@
+from batchVSEPR import generateVSEPRBatch
+from dataCollection import getElementTable
+
+from itertools import permutations, product
+import argparse
+import json
+import math
+
+import numpy as np
+
+# Accuracy of predicted single-center geometries against reference 3D structures
+# (e.g. PubChem SDFs imported into a structureStore).
+#
+# Predictions come from generateVSEPRBatch. For each molecule the reference atom of the
+# predicted central element that sits closest to every other atom is taken as its center.
+# Terminal atoms are matched by element; same-element terminals are interchangeable, so
+# every permutation within an element is tried and the one with the lowest RMSD is kept.
+# Molecules with the same terminal pattern are evaluated together: all of their
+# permutations go through one batched Kabsch alignment, and the bond-angle and bond-length
+# errors under the best permutation are array operations over the whole group.
+
+MAX_PERMUTATIONS = 720      # 6 identical terminals; larger patterns are reported as errors
+MAX_ALIGNMENTS = 200000     # (molecules x permutations) aligned per batch, bounds memory
+
+METRICS = ["rmsd", "angleError", "maxAngleError", "lengthError"]
+
+def kabschRMSD(X, Y):
+    # RMSD after the optimal rotation and translation of X onto Y, for (..., n, 3) stacks of point sets.
+    # Uses the singular values of the covariance matrix, so the rotation itself is never built.
+    X = X - X.mean(axis=-2, keepdims=True)
+    Y = Y - Y.mean(axis=-2, keepdims=True)
+
+    covariance = np.einsum("...ni,...nj->...ij", X, Y)
+    U, S, Vt = np.linalg.svd(covariance)
+    reflection = np.sign(np.linalg.det(U @ Vt))  # -1 where the best orthogonal map is a reflection
+
+    residual = (X * X).sum(axis=(-2, -1)) + (Y * Y).sum(axis=(-2, -1)) - 2 * (S[..., 0] + S[..., 1] + reflection * S[..., 2])
+    return np.sqrt(np.maximum(residual, 0) / X.shape[-2])
+
+def blockPermutations(sizes):
+    # (P, sum(sizes)) permutations of terminal slots that only swap slots within each block
+    offsets = np.cumsum([0] + list(sizes))
+    blocks = [[tuple(offsets[k] + np.array(p)) for p in permutations(range(size))] for k, size in enumerate(sizes)]
+    return np.array([sum(combination, ()) for combination in product(*blocks)], dtype=np.int64).reshape(-1, offsets[-1])
+
+def angleMatrix(vectors):
+    # (..., n, 3) vectors -> (..., n, n) angles in degrees between every pair; zero vectors give 90
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+    return np.degrees(np.arccos(np.clip(np.einsum("...id,...jd->...ij", unit, unit), -1.0, 1.0)))
+
+def _predictedPositions(batch, i):
+    # (n_atoms, 3) predicted coordinates, central atom at the origin
+    positions = np.zeros((len(batch["atoms"][i]), 3))
+    slots = batch["bondAtoms"][i] >= 0
+    positions[batch["bondAtoms"][i][slots]] = batch["directions"][i][slots] * batch["bondLengths"][i][slots, None]
+    return positions
+
+def _referenceCenter(symbols, coords, element):
+    # Index of the `element` atom with the smallest distance to the farthest other atom
+    candidates = [k for k, symbol in enumerate(symbols) if symbol == element]
+    spread = [np.linalg.norm(coords - coords[k], axis=1).max() for k in candidates]
+    return candidates[int(np.argmin(spread))]
+
+def _alignGroup(predicted, reference, sizes):
+    # predicted (G, n, 3), reference (G, n, 3): terminal vectors from the center, sorted by element.
+    # Returns the per-molecule rmsd and the reference vectors reordered by the best permutation.
+    perms = blockPermutations(sizes)
+    G = len(predicted)
+    rmsd = np.empty(G)
+    best = np.empty(G, dtype=np.int64)
+    center = np.zeros((1, 1, 3))
+
+    step = max(1, MAX_ALIGNMENTS // len(perms))
+    for start in range(0, G, step):
+        block = slice(start, start + step)
+        candidates = reference[block][:, perms]                                   # (g, P, n, 3)
+        X = np.concatenate([np.broadcast_to(center, (len(candidates), 1, 3)), predicted[block]], axis=1)
+        Y = np.concatenate([np.zeros(candidates.shape[:2] + (1, 3)), candidates], axis=2)
+        scores = kabschRMSD(X[:, None], Y)                                         # (g, P)
+        best[block] = scores.argmin(axis=1)
+        rmsd[block] = scores.min(axis=1)
+
+    return rmsd, reference[np.arange(G)[:, None], perms[best]]                     # (G,), (G, n, 3)
+
+def alignReferences(batch, references):
+    # Matches reference structures to a generateVSEPRBatch result.
+    # references: N (atomic numbers, (n_atoms, 3) coords) pairs, one per formula of the batch.
+    # Returns (matched, rmsd, errors): matched (N, max_domains, 3) holds the reference vector from
+    # the central atom to the atom matched with each bond slot (zero for lone pairs, padding and
+    # failures), rmsd (N,) is NaN where a molecule could not be matched and errors says why.
+    n, D = batch["directions"].shape[:2]
+    table = getElementTable()
+    matched = np.zeros((n, D, 3))
+    rmsd = np.full(n, np.nan)
+    errors = list(batch["errors"])
+
+    # per molecule: match atoms and sort terminals by element; then group by terminal pattern
+    groups = {}
+    for i, (numbers, coords) in enumerate(references):
+        if not batch["valid"][i]:
+            continue
+
+        atoms, central = batch["atoms"][i], int(batch["central"][i])
+        symbols = [str(symbol) for symbol in table.symbols[np.asarray(numbers)]]
+        coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+
+        if sorted(symbols) != sorted(atoms):
+            errors[i] = f"ValueError: reference atoms {''.join(sorted(symbols))} do not match {''.join(sorted(atoms))}"
+            continue
+
+        predicted = _predictedPositions(batch, i)
+        slotOf = {int(atom): slot for slot, atom in enumerate(batch["bondAtoms"][i]) if atom >= 0}
+        predictedTerminals = sorted((k for k in range(len(atoms)) if k != central), key=lambda k: atoms[k])
+        referenceCentral = _referenceCenter(symbols, coords, atoms[central])
+        referenceTerminals = sorted((k for k in range(len(symbols)) if k != referenceCentral), key=lambda k: symbols[k])
+
+        elements = [atoms[k] for k in predictedTerminals]
+        sizes = tuple(sum(1 for _ in run) for run in _runs(elements))
+        if not sizes:
+            errors[i] = "ValueError: a single atom has no geometry to compare"
+            continue
+        if math.prod(math.factorial(size) for size in sizes) > MAX_PERMUTATIONS:
+            errors[i] = f"ValueError: too many interchangeable terminal atoms ({max(sizes)})"
+            continue
+
+        group = groups.setdefault(sizes, ([], [], [], []))
+        group[0].append(i)
+        group[1].append([slotOf[k] for k in predictedTerminals])
+        group[2].append(predicted[predictedTerminals] - predicted[central])
+        group[3].append(coords[referenceTerminals] - coords[referenceCentral])
+
+    for sizes, (indices, slots, predicted, reference) in groups.items():
+        rmsd[indices], vectors = _alignGroup(np.array(predicted), np.array(reference), sizes)
+        matched[np.array(indices)[:, None], np.array(slots)] = vectors
+
+    return matched, rmsd, errors
+
+def slotErrors(predicted, reference, bondMask):
+    # Per-molecule mean and max bond-angle error (degrees) and mean bond-length error (angstroms)
+    # between (N, D, 3) predicted and reference bond vectors, over the slots in bondMask (N, D).
+    # NaN where a molecule has no bond pair (angles) or no bond (lengths).
+    D = bondMask.shape[1]
+    pairs = bondMask[:, :, None] & bondMask[:, None, :] & np.triu(np.ones((D, D), dtype=bool), 1)
+    angleErrors = np.abs(angleMatrix(predicted) - angleMatrix(reference))
+    pairCounts = pairs.sum(axis=(1, 2))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        angleError = np.where(pairs, angleErrors, 0).sum(axis=(1, 2)) / pairCounts
+        maxAngleError = np.where(pairCounts > 0, np.where(pairs, angleErrors, -np.inf).max(axis=(1, 2)), np.nan)
+        lengthErrors = np.abs(np.linalg.norm(predicted, axis=-1) - np.linalg.norm(reference, axis=-1))
+        lengthError = np.where(bondMask, lengthErrors, 0).sum(axis=1) / bondMask.sum(axis=1)
+
+    return angleError, maxAngleError, lengthError
+
+def evaluate(formulas, references, geometry="vsepr"):
+    # formulas: N formulas to predict; references: N (atomic numbers, (n_atoms, 3) coords) pairs.
+    # geometry selects the predictor, as in generateVSEPRBatch.
+    # Returns a dict of per-molecule arrays (NaN where a molecule could not be evaluated) plus errors.
+    formulas = list(formulas)
+    batch = generateVSEPRBatch(formulas, geometry)
+    matched, rmsd, errors = alignReferences(batch, list(references))
+
+    valid = ~np.isnan(rmsd)
+    bondMask = (batch["bondAtoms"] >= 0) & valid[:, None]
+    predicted = batch["directions"] * batch["bondLengths"][..., None]
+    angleError, maxAngleError, lengthError = slotErrors(predicted, matched, bondMask)
+
+    return {
+        "formulas": formulas,
+        "valid": valid,
+        "errors": errors,
+        "stericNumbers": batch["stericNumbers"],
+        "centralElements": [atoms[batch["central"][i]] if atoms else None for i, atoms in enumerate(batch["atoms"])],
+        "rmsd": rmsd,
+        "angleError": angleError,
+        "maxAngleError": maxAngleError,
+        "lengthError": lengthError,
+    }
+
+def _runs(sequence):
+    # Consecutive runs of equal items, e.g. [F, F, O] -> [[F, F], [O]]
+    runs = []
+    for item in sequence:
+        if runs and runs[-1][0] == item:
+            runs[-1].append(item)
+        else:
+            runs.append([item])
+    return runs
+
+def storeReferences(store, formulas=None):
+    # (formulas, references) for every structure in a structureStore.StructureStore, or only those of the given formulas
+    structures = list(store) if formulas is None else [s for formula in formulas for s in store.byFormula(formula)]
+    return [s.formula for s in structures], [(s.atomicNumbers, s.coords) for s in structures]
+
+def evaluateStore(store, formulas=None, geometry="vsepr"):
+    return evaluate(*storeReferences(store, formulas), geometry)
+
+def summarize(results, by=("stericNumbers", "centralElements")):
+    # Aggregate statistics overall and per value of each grouping key:
+    # {"overall": stats, "stericNumbers": {4: stats, ...}, "centralElements": {"N": stats, ...}}
+    valid = results["valid"]
+
+    def statistics(mask):
+        stats = {"count": int(mask.sum())}
+        for name in METRICS:
+            values = results[name][mask]
+            values = values[~np.isnan(values)]
+            stats[name] = {"mean": float(values.mean()), "median": float(np.median(values)),
+                           "p90": float(np.percentile(values, 90)), "max": float(values.max())} if len(values) else None
+        return stats
+
+    summary = {"overall": statistics(valid), "failed": int((~valid).sum())}
+    for key in by:
+        values = np.array([value if value is not None else "" for value in results[key]], dtype=object)
+        summary[key] = {
+            (int(value) if isinstance(value, (int, np.integer)) else value): statistics(valid & (values == value))
+            for value in sorted(set(values[valid].tolist()), key=str)
+        }
+    return summary
+
+def addArguments(parser):
+    parser.add_argument("database", help="structureStore SQLite file with the reference structures")
+    parser.add_argument("--formula", action="append", default=None, help="only evaluate these formulas")
+    parser.add_argument("--geometry", choices=["vsepr", "learned"], default="vsepr", help="predictor to evaluate")
+    parser.add_argument("--json", default=None, help="write the summary as JSON")
+
+def run(args):
+    from structureStore import StructureStore
+
+    with StructureStore(args.database) as store:
+        results = evaluateStore(store, args.formula, args.geometry)
+    summary = summarize(results)
+
+    def line(label, stats):
+        if not stats["count"]:
+            return f"{label:>12}  {0:>6}"
+        cells = "".join(f"  {stats[name]['mean']:>10.3f}" if stats[name] else f"  {'-':>10}" for name in METRICS)
+        return f"{label:>12}  {stats['count']:>6}{cells}"
+
+    print(f"{'':>12}  {'count':>6}" + "".join(f"  {name:>10}" for name in METRICS) + "   (means; rmsd/lengths in A, angles in degrees)")
+    print(line("overall", summary["overall"]))
+    for key, label in (("stericNumbers", "SN"), ("centralElements", "")):
+        for value, stats in summary[key].items():
+            print(line(f"{label} {value}".strip(), stats))
+    print(f"{summary['failed']} structures could not be evaluated")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(summary, file, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare predicted geometries with reference structures")
+    addArguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,199 @@
+from domainMinimizer import relaxDomains, domainWeights, domainExponents, energyAndGradient
+import instrumentation
+
+from itertools import combinations
+from math import sqrt, cos, sin, pi
+
+import numpy as np
+
+# Precomputed VSEPR domain geometries up to steric number 8.
+#
+# IDEAL_POSITIONS holds the ideal polyhedron for every steric number: linear, trigonal planar,
+# tetrahedral, trigonal bipyramidal, octahedral, pentagonal bipyramidal and square antiprism.
+# The lone pairs of a (steric number, lone pairs) class go on the sites with the lowest
+# domainMinimizer energy on that polyhedron, which is the usual VSEPR choice: equatorial sites
+# of a trigonal bipyramid (SF4 see-saw, ClF3 T-shaped, XeF2 linear), opposite sites of an
+# octahedron (XeF4 square planar) and the axial sites of a pentagonal bipyramid (XeF5- planar).
+# DOMAIN_POSITIONS[steric, lonePairs] lists those sites first and the bond sites after them, the
+# slot order used everywhere else (lone pairs first, then bonds in Lewis order).
+#
+# Relaxed geometries depend on the bond orders as well, so relaxedDomains() memoizes them by
+# (steric number, lone pairs, bond orders): after the first molecule of a class, VSEPR is a
+# dictionary lookup. Orders are rounded to 6 decimals, so averaged resonance orders share entries.
+# The key holds the orders sorted from highest to lowest, so the geometry never depends on the
+# order bonds are listed in (XeOF4 and F4OXe share one entry). Multiple bonds go on the bond
+# sites with the lowest energy, highest order first, like the lone pairs before them (the Xe=O
+# of XeOF4 opposite the lone pair, the S=O of SOF4 equatorial), and results come back permuted
+# to the caller's bond order. Bonds of equal order keep the caller's order unless ties (such as
+# the terminal atomic numbers) rank them, which makes CHBrClF and FClBrCH the same enantiomer.
+
+MAX_STERIC_NUMBER = 8
+MAX_CACHED = 65536  # relaxed geometries kept before the cache starts over
+
+def _polyhedron(steric_number):
+    if steric_number <= 2:
+        return [(1.0, 0.0, 0.0), (-1.0, 0.0, 0.0)][:steric_number]
+    if steric_number == 3:
+        return [(1.0, 0.0, 0.0), (-0.5, sqrt(3) / 2, 0.0), (-0.5, -sqrt(3) / 2, 0.0)]
+    if steric_number == 4:
+        s = 1.0 / sqrt(3)
+        return [(s, s, s), (-s, -s, s), (-s, s, -s), (s, -s, -s)]
+    if steric_number == 5:
+        # two axial sites, then three equatorial
+        return [(0.0, 0.0, 1.0), (0.0, 0.0, -1.0), (1.0, 0.0, 0.0), (-0.5, sqrt(3) / 2, 0.0), (-0.5, -sqrt(3) / 2, 0.0)]
+    if steric_number == 6:
+        return [(1.0, 0.0, 0.0), (-1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, -1.0, 0.0), (0.0, 0.0, 1.0), (0.0, 0.0, -1.0)]
+    if steric_number == 7:
+        # two axial sites, then a pentagon
+        return [(0.0, 0.0, 1.0), (0.0, 0.0, -1.0)] + [(cos(2 * pi * k / 5), sin(2 * pi * k / 5), 0.0) for k in range(5)]
+    if steric_number == 8:
+        # square antiprism with all edges equal: tan(polar angle)^2 = 2 sqrt(2)
+        z = 1.0 / sqrt(1.0 + 2.0 * sqrt(2.0))
+        r = sqrt(1.0 - z * z)
+        return ([(r * cos(pi / 2 * k), r * sin(pi / 2 * k), z) for k in range(4)]
+                + [(r * cos(pi / 2 * k + pi / 4), r * sin(pi / 2 * k + pi / 4), -z) for k in range(4)])
+    raise ValueError(f"Unsupported steric number: {steric_number}")
+
+def _lonePairSites(positions, lone_pairs):
+    # Lone pair sites with the lowest repulsion energy on the unrelaxed polyhedron (all bonds
+    # single); the first such set in combinations() order wins ties
+    n = len(positions)
+    candidates = list(combinations(range(n), lone_pairs))
+    orders = np.array([[k for k in sites] + [k for k in range(n) if k not in sites] for sites in candidates])
+    lonePairMask = np.broadcast_to(np.arange(n) < lone_pairs, orders.shape)
+    weights = domainWeights(lonePairMask, np.where(lonePairMask, 0.0, 1.0), np.ones(orders.shape, dtype=bool))
+    energy, _ = energyAndGradient(positions[orders], weights, domainExponents(lonePairMask))
+    return orders[np.argmin(np.round(energy, 9))]
+
+def _buildTables():
+    D = MAX_STERIC_NUMBER
+    ideal = np.zeros((D + 1, D, 3))
+    domains = np.zeros((D + 1, D + 1, D, 3))
+    for steric in range(1, D + 1):
+        positions = np.array(_polyhedron(steric))
+        ideal[steric, :steric] = positions
+        for lone_pairs in range(steric + 1):
+            domains[steric, lone_pairs, :steric] = positions[_lonePairSites(positions, lone_pairs)]
+    ideal.flags.writeable = False
+    domains.flags.writeable = False
+    return ideal, domains
+
+# (9, 8, 3): ideal polyhedron per steric number, zero padded; row 0 is unused
+# (9, 9, 8, 3): [steric, lonePairs] -> lone pair sites first, then bond sites
+IDEAL_POSITIONS, DOMAIN_POSITIONS = _buildTables()
+
+_relaxed = {}  # (steric, lone pairs, rounded bond orders, highest first) -> read-only (steric, 3) directions
+
+def _key(steric_number, lone_pairs, bond_orders, ties=None):
+    # (canonical key, slot of each caller domain in the cached directions)
+    rounded = [round(float(order), 6) for order in bond_orders]
+    ties = [0] * len(rounded) if ties is None else list(ties)
+    ranked = sorted(range(len(rounded)), key=lambda k: (-rounded[k], ties[k]))
+    slots = [0] * len(rounded)
+    for slot, k in enumerate(ranked):
+        slots[k] = lone_pairs + slot
+    key = (int(steric_number), int(lone_pairs), tuple(rounded[k] for k in ranked))
+    return key, list(range(lone_pairs)) + slots
+
+def _bondSites(steric_number, lone_pairs, orders):
+    # DOMAIN_POSITIONS rows for the lone pairs and then the (highest first) bond orders: each
+    # group of equal orders takes the remaining bond sites with the lowest energy on the
+    # unrelaxed polyhedron, with the sites still free counted as the lowest order
+    positions = DOMAIN_POSITIONS[steric_number, lone_pairs, :steric_number]
+    lonePairMask = np.arange(steric_number) < lone_pairs
+    sites = list(range(lone_pairs))
+    free = list(range(lone_pairs, steric_number))
+    start = 0
+    while start < len(orders) and orders[start] != orders[-1]:
+        count = orders[start:].count(orders[start])
+        candidates = list(combinations(free, count))
+        layout = np.array([sites + list(chosen) + [k for k in free if k not in chosen] for chosen in candidates])
+        values = np.concatenate([np.zeros(lone_pairs), orders[:start + count], np.full(len(free) - count, orders[-1])])
+        weights = domainWeights(np.broadcast_to(lonePairMask, layout.shape), np.broadcast_to(values, layout.shape),
+                                np.ones(layout.shape, dtype=bool))
+        energy, _ = energyAndGradient(positions[layout], weights, domainExponents(np.broadcast_to(lonePairMask, layout.shape)))
+        chosen = candidates[int(np.argmin(np.round(energy, 9)))]
+        sites += chosen
+        free = [k for k in free if k not in chosen]
+        start += count
+    return positions[sites + free]
+
+def _store(key, directions):
+    if len(_relaxed) >= MAX_CACHED:
+        _relaxed.clear()
+    directions = np.array(directions[:key[0]])
+    directions.flags.writeable = False
+    _relaxed[key] = directions
+    return directions
+
+def _reordered(directions, slots):
+    # cached directions in the caller's bond order, read-only like the cache entries
+    if slots == sorted(slots):
+        return directions
+    directions = directions[slots]
+    directions.flags.writeable = False
+    return directions
+
+def relaxedDomains(steric_number, lone_pairs, bond_orders, ties=None):
+    # Relaxed (steric_number, 3) unit vectors, lone pairs first and then one per bond order.
+    # ties: optional per-bond values that decide which of several equal-order bonds gets which
+    # site (lowest first). The array is read-only and may be shared.
+    if not 1 <= steric_number <= MAX_STERIC_NUMBER:
+        raise ValueError(f"Unsupported steric number: {steric_number}")
+    key, slots = _key(steric_number, lone_pairs, bond_orders, ties)
+    directions = _relaxed.get(key)
+    if directions is not None:
+        if instrumentation.enabled:
+            instrumentation.count("cache.geometryTable.hits")
+        return _reordered(directions, slots)
+
+    if instrumentation.enabled:
+        instrumentation.count("cache.geometryTable.misses")
+    orders = np.concatenate([np.zeros(lone_pairs), key[2]])
+    relaxed, iterations = relaxDomains(_bondSites(steric_number, lone_pairs, list(key[2])),
+                                       np.arange(steric_number) < lone_pairs, orders)
+    if instrumentation.enabled:
+        instrumentation.count("vsepr.relaxIterations", int(iterations))
+    return _reordered(_store(key, relaxed), slots)
+
+def relaxedBatch(stericNumbers, lonePairs, bondOrders, ties=None):
+    # (N, MAX_STERIC_NUMBER, 3) relaxed directions for padded (N, MAX_STERIC_NUMBER) bond orders
+    # (lone pair slots first, as in generateVSEPRBatch), and optional ties of the same shape as
+    # in relaxedDomains. Molecules with steric number 0 stay zero.
+    # Classes missing from the cache are relaxed together in one relaxDomains call.
+    n, D = len(stericNumbers), MAX_STERIC_NUMBER
+    ties = np.zeros((n, D), dtype=np.int64) if ties is None else np.asarray(ties)
+    canonical = [_key(s, lp, orders[lp:s], tie[lp:s]) if s else (None, None)
+                 for s, lp, orders, tie in zip(stericNumbers.tolist(), lonePairs.tolist(), bondOrders.tolist(), ties.tolist())]
+    keys = [key for key, _ in canonical]
+
+    found = {key: _relaxed[key] for key in set(keys) if key in _relaxed}
+    missing = sorted({key for key in keys if key is not None and key not in found})
+    if instrumentation.enabled:
+        instrumentation.count("cache.geometryTable.misses", len(missing))
+        instrumentation.count("cache.geometryTable.hits", sum(key is not None for key in keys) - len(missing))
+
+    if missing:
+        steric = np.array([key[0] for key in missing])
+        lone = np.array([key[1] for key in missing])
+        slots = np.arange(D)
+        orders = np.zeros((len(missing), D))
+        start = np.zeros((len(missing), D, 3))
+        for row, (s, lp, values) in enumerate(missing):
+            orders[row, lp:s] = values
+            start[row, :s] = _bondSites(s, lp, list(values))
+        relaxed, iterations = relaxDomains(start, slots[None, :] < lone[:, None],
+                                           orders, slots[None, :] < steric[:, None])
+        if instrumentation.enabled:
+            instrumentation.count("vsepr.relaxIterations", int(iterations.max(initial=0)))
+        for key, directions in zip(missing, relaxed):
+            found[key] = _store(key, directions)
+
+    directions = np.zeros((n, D, 3))
+    for i, (key, order) in enumerate(canonical):
+        if key is not None:
+            directions[i, :key[0]] = found[key][order]
+    return directions
+
+def clearCache():
+    _relaxed.clear()
@@ -0,0 +1,139 @@
+import heapq
+import json
+import time
+
+# Per-stage wall time, call counts and counters for the structure pipeline.
+#
+# Off by default. Instrumented code guards every call with `if instrumentation.enabled:`,
+# so a disabled run costs one attribute lookup per stage and nothing else.
+#
+#   instrumentation.enable()
+#   ... run formulas ...
+#   print(instrumentation.toJSON())
+#
+# Stage times are recorded both inclusive ("total") and exclusive of nested stages ("self"),
+# e.g. "lewis" minus the "central" and "elements" stages it triggers. The slowest keys
+# (formulas) per stage are kept so the expensive inputs can be found.
+#
+# Hooks are callables hook(event, name, value) for an external profiler or tracer:
+# ("begin", stage, key) when a stage starts, ("end", stage, seconds) when it finishes and
+# ("count", counter, n) for counters.
+
+enabled = False
+SLOWEST = 10  # slowest keys kept per stage
+
+_timings = {}    # stage -> [calls, total seconds, self seconds, max seconds]
+_counters = {}   # counter -> int
+_slowest = {}    # stage -> min-heap of (seconds, key)
+_stack = []      # [seconds spent in nested stages] per running stage
+_hooks = []
+
+def enable(*hooks):
+    global enabled
+    _hooks.extend(hooks)
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+    del _hooks[:]
+
+def reset():
+    _timings.clear()
+    _counters.clear()
+    _slowest.clear()
+    del _stack[:]
+
+def begin(name, key=None):
+    # Starts timing a stage; pass the returned token to end()
+    for hook in _hooks:
+        hook("begin", name, key)
+    _stack.append(0.0)
+    return time.perf_counter()
+
+def end(name, started, key=None):
+    seconds = time.perf_counter() - started
+    nested = _stack.pop()
+    if _stack:
+        _stack[-1] += seconds
+
+    timing = _timings.get(name)
+    if timing is None:
+        timing = _timings[name] = [0, 0.0, 0.0, 0.0]
+    timing[0] += 1
+    timing[1] += seconds
+    timing[2] += seconds - nested
+    timing[3] = max(timing[3], seconds)
+
+    if key is not None:
+        slowest = _slowest.setdefault(name, [])
+        if len(slowest) < SLOWEST:
+            heapq.heappush(slowest, (seconds, key))
+        elif seconds > slowest[0][0]:
+            heapq.heapreplace(slowest, (seconds, key))
+
+    for hook in _hooks:
+        hook("end", name, seconds)
+    return seconds
+
+def call(name, function, key=None):
+    started = begin(name, key)
+    try:
+        return function()
+    finally:
+        end(name, started, key)
+
+def count(name, n=1):
+    _counters[name] = _counters.get(name, 0) + n
+    for hook in _hooks:
+        hook("count", name, n)
+
+def timed(name):
+    # Decorator timing every call of a function as stage `name` while instrumentation is enabled
+    def decorate(function):
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            started = begin(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                end(name, started)
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__wrapped__ = function
+        return wrapper
+    return decorate
+
+def stats():
+    # Snapshot of everything recorded so far as plain dicts
+    from Compound import _parseFormulaCached
+
+    stages = {
+        name: {"calls": calls, "total": total, "self": own, "mean": total / calls, "max": longest,
+               "slowest": [{"key": key, "seconds": seconds} for seconds, key in sorted(_slowest.get(name, []), reverse=True)]}
+        for name, (calls, total, own, longest) in sorted(_timings.items())
+    }
+
+    # Compound._stage counts "cache.<stage>.hits" and "cache.<stage>.misses"
+    caches = {}
+    for counter in _counters:
+        if counter.startswith("cache.") and counter.endswith(".misses"):
+            stage = counter[len("cache."):-len(".misses")]
+            hits, misses = _counters.get(f"cache.{stage}.hits", 0), _counters[counter]
+            caches[stage] = {"hits": hits, "misses": misses, "hitRate": hits / (hits + misses)}
+
+    info = _parseFormulaCached.cache_info()
+    caches["parseFormula"] = {"hits": info.hits, "misses": info.misses, "size": info.currsize,
+                              "hitRate": info.hits / (info.hits + info.misses) if info.hits + info.misses else 0.0}
+
+    counters = {name: value for name, value in sorted(_counters.items()) if not name.startswith("cache.")}
+    return {"enabled": enabled, "stages": stages, "counters": counters, "caches": dict(sorted(caches.items()))}
+
+def toJSON(path=None, indent=2):
+    text = json.dumps(stats(), indent=indent)
+    if path is not None:
+        with open(path, "w") as file:
+            file.write(text + "\n")
+    return text
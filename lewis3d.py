@@ -0,0 +1,84 @@
+# Command line entry point, installed as the `lewis3d` console script.
+# Each subcommand's module is imported only when that subcommand runs, so startup stays cheap.
+import argparse
+import importlib
+import os
+import sys
+
+def addDemoArguments(parser):
+    parser.add_argument("formula", nargs="?", default="H2O")
+    parser.add_argument("--no-display", action="store_true", help="skip the matplotlib window")
+
+def demo(args):
+    from SimpleCompound import SimpleCompound
+    from Bond import Bond
+
+    for order in (1, 2, 3):
+        print(f"C-C bond length, order {order}: {Bond(0, 1, ['C', 'C'], order=order).bondLength()}")
+    print()
+
+    cmpd = SimpleCompound(args.formula)
+
+    print(cmpd.generateLewisStructure())
+    print()
+    print(cmpd.getBondAngles())
+
+    if not args.no_display:
+        cmpd.displayMolecule()
+
+# name -> (module providing addArguments(parser) and run(args), help); None means this module's demo
+COMMANDS = {
+    "demo": (None, "print and display the structure of one formula"),
+    "filter": ("pubchemListing", "filter a PubChem text listing by formula"),
+    "fetch": ("pubchemFetcher", "download 3D SDFs from PubChem for a list of formulas"),
+    "store": ("structureStore", "import and query reference structures in a SQLite store"),
+    "render": ("visualization", "render PNG/SVG images for a list of formulas without a display"),
+    "evaluate": ("geometryEvaluation", "compare predicted geometries with the reference structures in a store"),
+    "train": ("bondPredictor", "train the bond length and angle predictor on the reference structures in a store"),
+    "serve": ("structureServer", "serve structures as JSON over HTTP or a Unix socket, keeping data and caches warm"),
+    "batch": ("batchPipeline", "write structures for a list of formulas as JSON lines, in parallel"),
+    "export": ("resultColumns", "write batch results as memory-mappable columns (optionally Parquet)"),
+    "embed": ("moleculeEmbedding", "embed multi-center molecules in 3D from their connectivity (SDF, XYZ or a store)"),
+    "cif": ("cifReader", "expand a CIF file into its unit cell or a supercell (extended XYZ)")
+}
+
+def loadCommand(name):
+    moduleName = COMMANDS[name][0]
+    if moduleName is None:
+        return addDemoArguments, demo
+
+    module = importlib.import_module(moduleName)
+    return module.addArguments, module.run
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    if not argv or argv[0] not in COMMANDS:
+        parser = argparse.ArgumentParser(prog="lewis3d", description="3D Lewis structure and VSEPR tools")
+        commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+        for name, (_, description) in COMMANDS.items():
+            commands.add_parser(name, help=description, add_help=False)
+        parser.parse_args(argv)  # prints usage and exits
+        return
+
+    name = argv[0]
+    addArguments, run = loadCommand(name)
+
+    parser = argparse.ArgumentParser(prog=f"lewis3d {name}", description=COMMANDS[name][1])
+    addArguments(parser)
+    args = parser.parse_args(argv[1:])
+
+    # LEWIS3D_STATS=stats.json records per-stage timings and counters for the run (see instrumentation.py)
+    statsPath = os.environ.get("LEWIS3D_STATS")
+    if not statsPath:
+        return run(args)
+
+    import instrumentation
+    instrumentation.enable()
+    try:
+        return run(args)
+    finally:
+        instrumentation.toJSON(statsPath)
+
+if __name__ == "__main__":
+    main()
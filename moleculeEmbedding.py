@@ -0,0 +1,523 @@
+from Bond import bondLengths
+from bondPerception import neighborPairs
+from dataCollection import getElementTable
+from geometryTable import relaxedDomains, MAX_STERIC_NUMBER
+
+from collections import namedtuple
+import argparse
+import os
+
+import numpy as np
+
+# 3D coordinates for molecules with any number of centers, from their connectivity.
+#
+# A formula does not say how the atoms are connected, so the input is atoms plus (a, b, order)
+# bond rows: from an SDF, from the reference store, or perceived from coordinates with
+# bondPerception. Every atom gets its own VSEPR geometry: its neighbors plus the lone pairs
+# left by its valence give a steric number, and geometryTable supplies the relaxed bond
+# directions for that (steric number, lone pairs, bond orders) class.
+#
+# Coordinates are then assembled along a depth-first spanning tree, a z-matrix walk: each
+# atom sits along its parent's bond direction at the Bond.bondLength distance, its local frame
+# turned so its bond to the parent points back along that bond, and rotated about the bond so
+# the reference substituents of the two atoms are anti (staggered chains, trans double bonds),
+# or on ring bonds cis (planar rings) or alternating gauche (chairs). Every tree edge fixes the
+# child relative to its parent, so all edges are computed at once and pointer doubling
+# composes them down to the roots in log2(depth) array steps.
+#
+# Rings the walk leaves open, fused and bridged systems mostly, are closed by minimizing
+# harmonic restraints on bond lengths and on the 1-3 distances given by each atom's local
+# angles, first in four dimensions and then squeezed back to three, as in distance geometry
+# embedding. A short L-BFGS relaxation follows with a repulsion between nonbonded atoms that
+# come too close, found with bondPerception's cell list. Every step works on flat arrays of
+# edges, angle pairs and neighbor pairs, so time and memory grow linearly with the atom count.
+#
+#   embedMolecule(["C", "C", "H", ...], [(0, 1, 1), (0, 2, 1), ...]).coords
+#   lewis3d embed molecules.sdf -o embedded.xyz
+
+AROMATIC_ORDER = 1.5            # SDF bond order 4
+ANGLE_WEIGHT = 0.5              # 1-3 restraints relative to bond restraints
+REPULSION_WEIGHT = 1.0
+NONBONDED_SCALE = 1.6           # nonbonded atoms repel when closer than this times r_a + r_b
+COMPONENT_SPACING = 4.0         # angstroms between disconnected fragments
+RELAX_ITERATIONS = 500
+PAIR_REFRESH = 10               # iterations between nonbonded pair searches
+LBFGS_MEMORY = 8
+MAX_MOVE = 0.3                  # largest coordinate change per step, angstroms
+SQUEEZE_PENALTIES = (0.1, 1.0, 10.0, 100.0)
+CLOSURE_TOLERANCE = 0.05        # angstroms; rings the walk closes worse than this go through four dimensions
+
+Connectivity = namedtuple("Connectivity", [
+    "indptr",      # (n + 1,) each atom's edges are indptr[i]:indptr[i + 1]
+    "neighbors",   # (2 * n_bonds,) atom at the other end of every edge; ring bonds first, then heaviest first
+    "orders",      # (2 * n_bonds,) bond order of every edge (aromatic bonds 1.5)
+    "bond",        # (2 * n_bonds,) row of the edge in the bond array
+    "reverse",     # (2 * n_bonds,) the same bond seen from the neighbor
+    "ring",        # (2 * n_bonds,) whether the bond lies on a cycle
+    "parentEdge"   # (n,) edge from each atom's parent in the spanning forest the walk follows, -1 for roots
+])
+
+Embedding = namedtuple("Embedding", [
+    "coords",          # (n, 3) angstroms
+    "stericNumbers",   # (n,) neighbors + lone pairs per atom
+    "lonePairs",       # (n,)
+    "iterations",      # relaxation steps taken
+    "rmsBondError"     # root mean square deviation from the target bond lengths, angstroms
+])
+
+def _numbers(symbols):
+    symbols = np.asarray(symbols)
+    return symbols.astype(np.int64) if np.issubdtype(symbols.dtype, np.integer) else getElementTable().indices([str(s) for s in symbols])
+
+def ringBonds(n, bonds):
+    # (ring, parentBond): whether each bond row lies on a cycle, and the bond row joining each
+    # atom to its parent in a depth-first spanning forest (-1 for roots). Roots are taken in
+    # order of decreasing degree. Iterative Tarjan low links, linear in atoms plus bonds.
+    m = len(bonds)
+    source = np.concatenate((bonds[:, 0], bonds[:, 1]))
+    order = np.argsort(source, kind="stable")
+    neighbors = np.concatenate((bonds[:, 1], bonds[:, 0]))[order].tolist()
+    bondOf = np.concatenate((np.arange(m), np.arange(m)))[order].tolist()
+    degree = np.bincount(source, minlength=n)
+    indptr = np.concatenate(([0], np.cumsum(degree))).tolist()
+
+    discovered = [-1] * n
+    low = [0] * n
+    parentBond = [-1] * n
+    ring = [False] * m
+    time = 0
+    for root in np.argsort(-degree, kind="stable").tolist():
+        if discovered[root] >= 0:
+            continue
+        discovered[root] = low[root] = time
+        time += 1
+        stack = [[root, indptr[root]]]
+        while stack:
+            top = stack[-1]
+            v, e = top
+            if e < indptr[v + 1]:
+                top[1] = e + 1
+                k = bondOf[e]
+                if k == parentBond[v]:
+                    continue
+                w = neighbors[e]
+                if discovered[w] < 0:
+                    discovered[w] = low[w] = time
+                    time += 1
+                    parentBond[w] = k
+                    stack.append([w, indptr[w]])
+                elif discovered[w] < discovered[v]:
+                    # a back edge closes a cycle
+                    ring[k] = True
+                    low[v] = min(low[v], discovered[w])
+            else:
+                stack.pop()
+                if stack:
+                    u = stack[-1][0]
+                    low[u] = min(low[u], low[v])
+                    if low[v] <= discovered[u]:
+                        ring[parentBond[v]] = True
+    return np.array(ring, dtype=bool), np.array(parentBond, dtype=np.int64)
+
+def buildConnectivity(numbers, bonds):
+    # Both directions of every bond as CSR edge arrays
+    n = len(numbers)
+    bonds = np.asarray(bonds, dtype=np.int64).reshape(-1, 3)
+    m = len(bonds)
+    if ((bonds[:, :2] < 0) | (bonds[:, :2] >= n)).any():
+        raise ValueError(f"bond atom indices must be between 0 and {n - 1}")
+    ring, parentBond = ringBonds(n, bonds)
+
+    source = np.concatenate((bonds[:, 0], bonds[:, 1]))
+    target = np.concatenate((bonds[:, 1], bonds[:, 0]))
+    bond = np.concatenate((np.arange(m), np.arange(m)))
+    order = np.lexsort((target, -numbers[target], ~ring[bond], source))
+
+    source, target, bond = source[order], target[order], bond[order]
+    orders = np.where(bonds[bond, 2] == 4, AROMATIC_ORDER, bonds[bond, 2]).astype(float)
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(source, minlength=n))))
+
+    # the two edges of each bond point at each other
+    positions = np.arange(2 * m)
+    low, high = np.full(m, 2 * m), np.full(m, -1)
+    np.minimum.at(low, bond, positions)
+    np.maximum.at(high, bond, positions)
+    reverse = np.where(positions == low[bond], high[bond], low[bond])
+
+    parentEdge = np.full(n, -1)
+    child = np.flatnonzero(parentBond >= 0)
+    k = parentBond[child]
+    parentEdge[child] = np.where(target[low[k]] == child, low[k], high[k])
+    return Connectivity(indptr, target, orders, bond, reverse, ring[bond], parentEdge)
+
+def localGeometry(numbers, connectivity, charges=None):
+    # (stericNumbers, lonePairs, directions): one local unit vector per edge, in the atom's own frame
+    table = getElementTable()
+    n = len(numbers)
+    indptr, orders = connectivity.indptr, connectivity.orders
+    degree = np.diff(indptr)
+
+    source = np.repeat(np.arange(n), degree)
+    bonded = np.bincount(source, weights=orders, minlength=n)
+    charges = np.zeros(n) if charges is None else np.asarray(charges, dtype=float)
+    lonePairs = np.maximum(np.floor((table.valence[numbers] - bonded - charges) / 2), 0).astype(np.int64)
+    lonePairs = np.minimum(lonePairs, np.maximum(MAX_STERIC_NUMBER - degree, 0))
+    stericNumbers = degree + lonePairs
+
+    # one geometryTable lookup per (steric number, lone pairs, bond orders) class; orders are
+    # multiples of 1/2, so a class packs into one integer with four bits per slot
+    directions = np.zeros((len(orders), 3))
+    listed = (degree > 0) & (stericNumbers <= MAX_STERIC_NUMBER)
+    atoms = np.flatnonzero(listed)
+    slots = np.arange(MAX_STERIC_NUMBER)
+    filled = slots[None, :] < degree[atoms, None]
+    halves = np.zeros((len(atoms), MAX_STERIC_NUMBER), dtype=np.int64)
+    halves[filled] = np.clip(np.rint(2 * orders[(indptr[atoms, None] + slots[None, :])[filled]]), 0, 14) + 1
+    keys = (stericNumbers[atoms] * 16 + lonePairs[atoms]) << (4 * MAX_STERIC_NUMBER)
+    keys = keys + (halves << (4 * slots)).sum(axis=1)
+    classes, first, members = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(members, kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(members, minlength=len(classes)))))
+    for c, atom in enumerate(atoms[first].tolist()):
+        group = atoms[order[bounds[c]:bounds[c + 1]]]
+        lone, d = int(lonePairs[atom]), int(degree[atom])
+        edges = indptr[group, None] + np.arange(d)[None, :]
+        directions[edges] = relaxedDomains(int(stericNumbers[atom]), lone, orders[indptr[atom]:indptr[atom] + d])[lone:]
+    for i in np.flatnonzero((degree > 0) & ~listed).tolist():
+        directions[indptr[i]:indptr[i + 1]] = _spherePoints(degree[i])
+    return stericNumbers, lonePairs, directions
+
+def _spherePoints(count):
+    # evenly spread directions for coordination numbers beyond the geometry table
+    k = np.arange(count) + 0.5
+    z = 1 - 2 * k / count
+    phi = np.pi * (1 + 5 ** 0.5) * k
+    r = np.sqrt(1 - z * z)
+    return np.stack((r * np.cos(phi), r * np.sin(phi), z), axis=1)
+
+def _cross(u):
+    # (k, 3, 3) cross product matrices
+    zero = np.zeros(len(u))
+    return np.stack((np.stack((zero, -u[:, 2], u[:, 1]), -1),
+                     np.stack((u[:, 2], zero, -u[:, 0]), -1),
+                     np.stack((-u[:, 1], u[:, 0], zero), -1)), axis=1)
+
+def axisRotations(axis, angle):
+    # (k, 3, 3) rotations by angle (radians) about unit axes
+    K = _cross(axis)
+    return (np.eye(3) + np.sin(angle)[:, None, None] * K + (1 - np.cos(angle))[:, None, None] * (K @ K))
+
+def alignRotations(v, t):
+    # (k, 3, 3) rotations taking unit vectors v onto unit vectors t
+    axis = np.cross(v, t)
+    s = np.linalg.norm(axis, axis=1)
+    c = np.einsum("ki,ki->k", v, t)
+
+    # opposite vectors: a half turn about any axis perpendicular to v
+    other = np.where(np.abs(v[:, :1]) < 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+    perpendicular = np.cross(v, other)
+    perpendicular /= np.linalg.norm(perpendicular, axis=1, keepdims=True)
+    opposite = s < 1e-9
+    axis = np.where(opposite[:, None], perpendicular, axis / np.maximum(s, 1e-300)[:, None])
+    return axisRotations(axis, np.arctan2(np.where(opposite, 0.0, s), c))
+
+def _firstOther(indptr, atoms, exclude):
+    # each atom's first edge other than `exclude` (a ring bond if it has one, else its heaviest
+    # other neighbor), -1 if it has none
+    first = indptr[atoms]
+    other = np.where(first == exclude, first + 1, first)
+    return np.where(other < indptr[atoms + 1], other, -1)
+
+def _dihedralTargets(connectivity, stericNumbers, edges, parents):
+    # Torsion wanted about each tree edge: anti (pi) for chain bonds; on ring bonds, cis for
+    # planar atoms and alternating gauche (a chair for six-membered rings) otherwise
+    target = np.full(len(edges), np.pi)
+    ring = connectivity.ring[edges]
+    if ring.any():
+        children = connectivity.neighbors[edges]
+        planar = (stericNumbers[parents] <= 3) & (stericNumbers[children] <= 3)
+        depth = _treeDepth(connectivity.parentEdge, connectivity.neighbors, connectivity.reverse)
+        gauche = np.where(depth[parents] % 2 == 0, np.pi / 3, -np.pi / 3)
+        target = np.where(ring, np.where(planar, 0.0, gauche), target)
+    return target
+
+def _treeDepth(parentEdge, neighbors, reverse):
+    # depth of every atom in the spanning forest, by pointer doubling
+    n = len(parentEdge)
+    ancestor = np.where(parentEdge >= 0, neighbors[reverse[np.maximum(parentEdge, 0)]], np.arange(n))
+    depth = (parentEdge >= 0).astype(np.int64)
+    while (ancestor[ancestor] != ancestor).any():
+        depth = depth + depth[ancestor]
+        ancestor = ancestor[ancestor]
+    return depth
+
+def walkCoordinates(connectivity, directions, lengths, stericNumbers):
+    # Places every atom of the spanning forest. Each tree edge gives the child's frame and
+    # position relative to its parent's, independent of where the parent ends up, so all edges
+    # are handled at once; pointer doubling then composes them down to the roots in
+    # log2(depth) steps. lengths are per bond row.
+    indptr, neighbors, reverse, parentEdge = connectivity.indptr, connectivity.neighbors, connectivity.reverse, connectivity.parentEdge
+    n = len(indptr) - 1
+    rotations = np.tile(np.eye(3), (n, 1, 1))
+    offsets = np.zeros((n, 3))
+    ancestor = np.arange(n)
+
+    children = np.flatnonzero(parentEdge >= 0)
+    if len(children):
+        edges = parentEdge[children]
+        back = reverse[edges]
+        parents = neighbors[back]
+        u = directions[edges]
+        rotation = alignRotations(directions[back], -u)
+
+        # turn the child about its bond to the wanted torsion between the two reference substituents:
+        # the parent's own parent (or first other neighbor) and the child's first other neighbor
+        toGrandparent = reverse[np.maximum(parentEdge[parents], 0)]
+        parentRef = np.where(parentEdge[parents] >= 0, toGrandparent, _firstOther(indptr, parents, edges))
+        ringEdge = connectivity.ring[edges]
+        parentRef = np.where(ringEdge & ~connectivity.ring[parentRef], _firstOther(indptr, parents, edges), parentRef)
+        childRef = _firstOther(indptr, children, back)
+        r = directions[parentRef]
+        w = np.einsum("kij,kj->ki", rotation, directions[childRef])
+        r -= np.einsum("ki,ki->k", r, u)[:, None] * u
+        w -= np.einsum("ki,ki->k", w, u)[:, None] * u
+        torsion = _dihedralTargets(connectivity, stericNumbers, edges, parents)
+        goal = np.cos(torsion)[:, None] * r + np.sin(torsion)[:, None] * np.cross(u, r)
+        angle = np.arctan2(np.einsum("ki,ki->k", u, np.cross(w, goal)), np.einsum("ki,ki->k", w, goal))
+        valid = (parentRef >= 0) & (childRef >= 0) & (np.linalg.norm(r, axis=1) > 1e-6) & (np.linalg.norm(w, axis=1) > 1e-6)
+        rotations[children] = axisRotations(u, np.where(valid, angle, 0.0)) @ rotation
+        offsets[children] = lengths[connectivity.bond[edges], None] * u
+        ancestor[children] = parents
+
+    # compose frames and positions relative to each ancestor until every ancestor is a root
+    while (ancestor[ancestor] != ancestor).any():
+        offsets = offsets[ancestor] + np.einsum("kij,kj->ki", rotations[ancestor], offsets)
+        rotations = rotations[ancestor] @ rotations
+        ancestor = ancestor[ancestor]
+    coords = offsets
+
+    # connected components side by side along x
+    roots, component = np.unique(ancestor, return_inverse=True)
+    if len(roots) > 1:
+        low, high = np.full(len(roots), np.inf), np.full(len(roots), -np.inf)
+        np.minimum.at(low, component, coords[:, 0])
+        np.maximum.at(high, component, coords[:, 0])
+        starts = np.concatenate(([0.0], np.cumsum(high - low + COMPONENT_SPACING)[:-1]))
+        coords[:, 0] += (starts - low)[component]
+    return coords
+
+def _angleRestraints(connectivity, directions, lengths):
+    # (i, k, target distance) for the two neighbors of every angle, from the local bond angles
+    indptr = connectivity.indptr
+    degree = np.diff(indptr)
+    parts = []
+    for d in np.unique(degree[degree >= 2]).tolist():
+        atoms = np.flatnonzero(degree == d)
+        a, b = np.triu_indices(d, 1)
+        e1 = (indptr[atoms][:, None] + a[None, :]).reshape(-1)
+        e2 = (indptr[atoms][:, None] + b[None, :]).reshape(-1)
+        parts.append((e1, e2))
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+
+    e1, e2 = (np.concatenate(p) for p in zip(*parts))
+    l1, l2 = lengths[connectivity.bond[e1]], lengths[connectivity.bond[e2]]
+    cosine = np.einsum("ki,ki->k", directions[e1], directions[e2])
+    target = np.sqrt(np.maximum(l1 * l1 + l2 * l2 - 2 * l1 * l2 * cosine, 0.0))
+    return connectivity.neighbors[e1], connectivity.neighbors[e2], target
+
+def _pairTerms(coords, i, j, target, weight, repulsive=False):
+    # energy and gradient of sum weight * (|r_i - r_j| - target)^2 (only below target when repulsive)
+    delta = coords[i] - coords[j]
+    distance = np.maximum(np.sqrt(np.einsum("ki,ki->k", delta, delta)), 1e-9)
+    stretch = distance - target
+    if repulsive:
+        stretch = np.minimum(stretch, 0.0)
+    force = (2 * weight * stretch / distance)[:, None] * delta
+    gradient = np.zeros_like(coords)
+    for axis in range(coords.shape[1]):
+        gradient[:, axis] = np.bincount(i, weights=force[:, axis], minlength=len(coords)) - np.bincount(j, weights=force[:, axis], minlength=len(coords))
+    return float((weight * stretch * stretch).sum()), gradient
+
+def _lbfgsDirection(gradient, history):
+    # two-loop recursion over the stored (s, y, 1 / s.y) triples
+    q = gradient.ravel().copy()
+    alphas = []
+    for s, y, rho in reversed(history):
+        alpha = rho * (s @ q)
+        q -= alpha * y
+        alphas.append(alpha)
+    if history:
+        s, y, _ = history[-1]
+        q *= (s @ y) / (y @ y)
+    for (s, y, rho), alpha in zip(history, reversed(alphas)):
+        q += (alpha - rho * (y @ q)) * s
+    return q.reshape(gradient.shape)
+
+def minimize(coords, function, maxIterations, tolerance=1e-3, step=1.0):
+    # L-BFGS with domainMinimizer's adaptive step: downhill steps are taken and grow it, uphill
+    # ones halve it and drop the history. function(coords) -> (energy, gradient).
+    # Returns (coords, iterations, converged).
+    current, gradient = function(coords)
+    history = []
+    for iteration in range(maxIterations):
+        if np.abs(gradient).max(initial=0.0) < tolerance:
+            return coords, iteration, True
+        direction = _lbfgsDirection(gradient, history)
+        if np.einsum("ij,ij->", direction, gradient) <= 0:
+            direction, history = gradient, []
+        move = step * direction
+        largest = np.abs(move).max()
+        if largest > MAX_MOVE:
+            move *= MAX_MOVE / largest
+
+        trial = coords - move
+        trialEnergy, trialGradient = function(trial)
+        if trialEnergy <= current:
+            s, y = -move.ravel(), (trialGradient - gradient).ravel()
+            if s @ y > 1e-12:
+                history = history[-(LBFGS_MEMORY - 1):] + [(s, y, 1.0 / (s @ y))]
+            coords, current, gradient = trial, trialEnergy, trialGradient
+            step = min(step * 1.2, 1.0)
+        else:
+            step *= 0.5
+            history = []
+            if step < 1e-12:
+                return coords, iteration + 1, True
+    return coords, maxIterations, np.abs(gradient).max(initial=0.0) < tolerance
+
+def squeezeFourthDimension(coords, restraints, maxIterations=RELAX_ITERATIONS):
+    # Closes the rings the walk left open. Restraints alone are minimized with a fourth
+    # coordinate free, where ring atoms can pass each other instead of locking into a folded
+    # minimum, and a growing penalty then pushes that coordinate back to zero.
+    # Returns (coords, iterations).
+    i, j, target, weight = restraints
+    extra = np.random.default_rng(0).normal(0.0, 0.3, (len(coords), 1))
+    x, iterations, _ = minimize(np.concatenate((coords, extra), axis=1), lambda x: _pairTerms(x, i, j, target, weight), maxIterations)
+
+    for penalty in SQUEEZE_PENALTIES:
+        def function(x):
+            energy, gradient = _pairTerms(x, i, j, target, weight)
+            gradient[:, 3] += 2 * penalty * x[:, 3]
+            return energy + penalty * float(x[:, 3] @ x[:, 3]), gradient
+        x, steps, _ = minimize(x, function, maxIterations)
+        iterations += steps
+    return x[:, :3].copy(), iterations
+
+def relaxCoordinates(coords, numbers, restraints, maxIterations=RELAX_ITERATIONS, tolerance=1e-3):
+    # Minimizes the restraint energy plus a repulsion between nonbonded atoms closer than
+    # NONBONDED_SCALE times their radii; the repelling pairs are searched again every
+    # PAIR_REFRESH steps. restraints: (i, j, target, weight) arrays. Returns (coords, iterations).
+    coords = np.array(coords, dtype=float)
+    n = len(coords)
+    i, j, target, weight = restraints
+    radius = getElementTable().radius[numbers]
+    cellSize = 2 * NONBONDED_SCALE * float(radius.max(initial=0.5))
+    excluded = np.unique(np.concatenate((np.minimum(i, j) * n + np.maximum(i, j), [-1])))
+
+    def nonbonded(coords):
+        found = [(p, q) for p, q, _ in neighborPairs(coords, cellSize, lambda p, q: NONBONDED_SCALE * (radius[p] + radius[q]))]
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        p, q = (np.concatenate(parts) for parts in zip(*found))
+        keys = np.minimum(p, q) * n + np.maximum(p, q)
+        keep = excluded[np.searchsorted(excluded, keys).clip(max=len(excluded) - 1)] != keys
+        return p[keep], q[keep]
+
+    def energy(coords, p, q):
+        e, g = _pairTerms(coords, i, j, target, weight)
+        if len(p):
+            e2, g2 = _pairTerms(coords, p, q, NONBONDED_SCALE * (radius[p] + radius[q]), REPULSION_WEIGHT, repulsive=True)
+            e, g = e + e2, g + g2
+        return e, g
+
+    iterations = 0
+    while iterations < maxIterations:
+        p, q = nonbonded(coords)
+        coords, steps, converged = minimize(coords, lambda x: energy(x, p, q), min(PAIR_REFRESH, maxIterations - iterations), tolerance)
+        iterations += steps
+        if converged:
+            break
+    return coords, iterations
+
+def _bondErrors(coords, bonds, lengths):
+    delta = coords[bonds[:, 0]] - coords[bonds[:, 1]]
+    return np.sqrt(np.einsum("ki,ki->k", delta, delta)) - lengths
+
+def embedMolecule(symbols, bonds, charges=None, relax=True, maxIterations=RELAX_ITERATIONS):
+    # symbols: element symbols or atomic numbers; bonds: (a, b, order) rows, 0-based, order 4 aromatic.
+    # charges: optional formal charge per atom (changes the lone pair counts). Returns an Embedding.
+    numbers = _numbers(symbols)
+    bonds = np.asarray(bonds, dtype=np.int64).reshape(-1, 3)
+    connectivity = buildConnectivity(numbers, bonds)
+    stericNumbers, lonePairs, directions = localGeometry(numbers, connectivity, charges)
+
+    orders = np.where(bonds[:, 2] == 4, AROMATIC_ORDER, bonds[:, 2]).astype(float)
+    lengths = bondLengths(numbers, bonds[:, 0], bonds[:, 1], orders)
+    coords = walkCoordinates(connectivity, directions, lengths, stericNumbers)
+
+    iterations = 0
+    if relax and len(numbers) > 1:
+        p, q, angleTargets = _angleRestraints(connectivity, directions, lengths)
+        restraints = (np.concatenate((bonds[:, 0], p)), np.concatenate((bonds[:, 1], q)),
+                      np.concatenate((lengths, angleTargets)),
+                      np.concatenate((np.ones(len(bonds)), np.full(len(p), ANGLE_WEIGHT))))
+        if np.abs(_bondErrors(coords, bonds, lengths)).max(initial=0.0) > CLOSURE_TOLERANCE:
+            coords, iterations = squeezeFourthDimension(coords, restraints, maxIterations)
+        coords, steps = relaxCoordinates(coords, numbers, restraints, maxIterations)
+        iterations += steps
+
+    error = _bondErrors(coords, bonds, lengths)
+    rms = float(np.sqrt(np.mean(error * error))) if len(error) else 0.0
+    return Embedding(coords, stericNumbers, lonePairs, iterations, rms)
+
+def readMolecules(path):
+    # (name, symbols, bonds, reference coords) from an .sdf file, an .xyz file (bonds perceived
+    # from its coordinates) or a structure store (.db)
+    from structureStore import readSDF, readXYZFile, StructureStore
+    from bondPerception import perceiveBonds
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".sdf":
+        for cid, name, symbols, coords, bonds, charge in readSDF(path):
+            yield name or str(cid), symbols, bonds, coords
+    elif extension == ".xyz":
+        symbols, coords = readXYZFile(path)
+        yield os.path.basename(path), symbols, perceiveBonds(symbols, coords), coords
+    else:
+        symbols = getElementTable().symbols
+        with StructureStore(path) as store:
+            for structure in store:
+                yield (structure.name or structure.formula, [str(s) for s in symbols[structure.atomicNumbers]],
+                       structure.bonds, structure.coords)
+
+def writeXYZ(file, symbols, coords, comment=""):
+    file.write(f"{len(symbols)}\n{comment}\n")
+    for symbol, (x, y, z) in zip(symbols, coords.tolist()):
+        file.write(f"{symbol:<2} {x:14.8f} {y:14.8f} {z:14.8f}\n")
+
+def addArguments(parser):
+    parser.add_argument("input", help=".sdf or .xyz file, or a structure store (.db)")
+    parser.add_argument("-o", "--output", default=None, help="multi-frame XYZ file for the embedded structures")
+    parser.add_argument("--no-relax", action="store_true", help="skip the relaxation after the walk")
+
+def run(args):
+    from geometryEvaluation import kabschRMSD
+
+    output = open(args.output, "w") if args.output else None
+    try:
+        for name, symbols, bonds, reference in readMolecules(args.input):
+            embedding = embedMolecule(symbols, bonds, relax=not args.no_relax)
+            rmsd = float(kabschRMSD(embedding.coords, np.asarray(reference))) if len(symbols) > 2 else 0.0
+            print(f"{name}: {len(symbols)} atoms, {len(bonds)} bonds, bond rms {embedding.rmsBondError:.3f} A, "
+                  f"RMSD to input {rmsd:.3f} A, {embedding.iterations} iterations")
+            if output is not None:
+                writeXYZ(output, symbols, embedding.coords, name)
+    finally:
+        if output is not None:
+            output.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed molecules in 3D from their connectivity")
+    addArguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,264 @@
+from Compound import Compound
+from pubchemListing import isSingleCenterCovalent
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+DEFAULT_BASE_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# journal statuses that mean a formula is finished and is skipped on the next run
+FINISHED = {"downloaded", "notFound", "skipped"}
+
+class RateLimiter:
+    # Token bucket shared by every request of a fetcher: at most `rate` requests per second
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class Journal:
+    # Append-only JSON lines file recording the outcome for each formula, so interrupted runs can resume
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+
+        if path and os.path.exists(path):
+            with open(path, "r") as file:
+                for line in file:
+                    line = line.strip()
+                    if not line: continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # partially written last line of an interrupted run
+                    self.entries[entry["formula"]] = entry
+
+    def finished(self, formula):
+        return self.entries.get(formula, {}).get("status") in FINISHED
+
+    def downloadedCIDs(self):
+        return {entry["cid"] for entry in self.entries.values() if entry.get("status") == "downloaded"}
+
+    def record(self, formula, status, **fields):
+        entry = dict(formula=formula, status=status, **fields)
+        self.entries[formula] = entry
+
+        if self.path:
+            with open(self.path, "a") as file:
+                file.write(json.dumps(entry) + "\n")
+
+class PubChemFetcher:
+    def __init__(self, baseUrl=DEFAULT_BASE_URL, outDir="sdf_single_center", journalPath=None,
+                 concurrency=4, requestsPerSecond=5, retries=5, backoff=0.5, timeout=30, batchSize=10):
+        self.baseUrl = baseUrl.rstrip("/")
+        self.outDir = outDir
+        self.journal = Journal(journalPath if journalPath is not None else os.path.join(outDir, "journal.jsonl"))
+        self.concurrency = concurrency
+        self.requestsPerSecond = requestsPerSecond
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.batchSize = batchSize
+
+        self.semaphore = None  # created on first use, inside the running event loop
+        self.limiter = None
+
+    def _request(self, url, data):
+        # Blocking HTTP call, run on an executor thread. Returns (status, body or None, retryAfter)
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(url, data=body)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read(), None
+        except urllib.error.HTTPError as e:
+            return e.code, None, e.headers.get("Retry-After") if e.headers else None
+        except (urllib.error.URLError, socket.timeout, ConnectionError):
+            return None, None, None
+
+    async def _get(self, path, data=None):
+        # GET (or POST when data is given) with rate limiting and exponential backoff.
+        # Returns the body, or None when PubChem has no record (404/400).
+        url = f"{self.baseUrl}/{path}"
+        loop = asyncio.get_running_loop()
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.limiter = RateLimiter(self.requestsPerSecond)
+
+        for attempt in range(self.retries + 1):
+            async with self.semaphore:
+                await self.limiter.acquire()
+                status, body, retryAfter = await loop.run_in_executor(None, self._request, url, data)
+
+            if status is not None and 200 <= status < 300:
+                return body
+            if status in (400, 404):
+                return None
+            if status is not None and status not in RETRY_STATUSES:
+                raise RuntimeError(f"PubChem returned HTTP {status} for {url}")
+            if attempt == self.retries:
+                break
+
+            delay = self.backoff * 2 ** attempt * (1 + random.random())
+            if retryAfter and retryAfter.isdigit():
+                delay = max(delay, int(retryAfter))
+            await asyncio.sleep(delay)
+
+        raise RuntimeError(f"giving up on {url} after {self.retries + 1} attempts")
+
+    async def lookupCID(self, formula):
+        # One request per formula: PUG REST takes a single identifier per request in the name
+        # namespace (names may contain commas, so there is no list form); only numeric inputs
+        # such as CIDs can be batched, which downloadSDFs does. Lookups run concurrently instead,
+        # bounded by the semaphore and the rate limiter.
+        body = await self._get(f"compound/name/{urllib.parse.quote(formula, safe='')}/cids/TXT")
+        if body is None: return None
+
+        first = body.decode().split()[:1]
+        return int(first[0]) if first and first[0].isdigit() else None
+
+    async def downloadSDFs(self, cids):
+        # One POST for the whole batch; PubChem puts the CID on the first line of each record.
+        # If the batch is rejected (e.g. one CID has no 3D conformer) fall back to one request per CID.
+        body = await self._get("compound/cid/SDF?record_type=3d", data={"cid": ",".join(map(str, cids))})
+
+        records = {}
+        if body is not None:
+            for record in body.decode().split("$$$$"):
+                record = record.strip("\n")
+                if not record: continue
+                title = record.split("\n", 1)[0].strip()
+                if title.isdigit():
+                    records[int(title)] = record + "\n$$$$\n"
+            return records
+
+        if len(cids) == 1:
+            return records
+
+        for cid, single in zip(cids, await asyncio.gather(*(self.downloadSDFs([cid]) for cid in cids))):
+            records.update(single)
+        return records
+
+    def _write(self, formula, sdf):
+        safe_name = re.sub(r'[^\w\-]', '_', formula)
+        filename = os.path.join(self.outDir, f"{safe_name}.sdf")
+        with open(filename, "w") as f:
+            f.write(sdf)
+        return filename
+
+    async def run(self, formulas, predicate=isSingleCenterCovalent):
+        # Fetches 3D SDFs for every formula that passes predicate; returns {status: count}
+        os.makedirs(self.outDir, exist_ok=True)
+
+        counts = {}
+        def record(formula, status, **fields):
+            self.journal.record(formula, status, **fields)
+            counts[status] = counts.get(status, 0) + 1
+
+        pending = []
+        for formula in dict.fromkeys(formulas):
+            if self.journal.finished(formula):
+                continue
+            try:
+                keep = predicate(Compound(formula))
+            except (ValueError, KeyError):
+                keep = False
+            if keep:
+                pending.append(formula)
+            else:
+                record(formula, "skipped")
+
+        # 1. name -> CID lookups, bounded by the semaphore and rate limiter
+        async def lookup(formula):
+            try:
+                return await self.lookupCID(formula)
+            except RuntimeError as e:
+                record(formula, "failed", error=str(e))
+                return False
+
+        cids = await asyncio.gather(*(lookup(formula) for formula in pending))
+
+        done = self.journal.downloadedCIDs()
+        toDownload = {}
+        for formula, cid in zip(pending, cids):
+            if cid is False:
+                continue
+            if cid is None:
+                record(formula, "notFound")
+            elif cid in done:
+                record(formula, "downloaded", cid=cid, file=None)  # same structure already fetched under another name
+            else:
+                toDownload.setdefault(cid, []).append(formula)
+
+        # 2. batched SDF downloads
+        async def download(batch):
+            try:
+                records = await self.downloadSDFs(batch)
+            except RuntimeError as e:
+                for cid in batch:
+                    for formula in toDownload[cid]:
+                        record(formula, "failed", cid=cid, error=str(e))
+                return
+
+            for cid in batch:
+                for formula in toDownload[cid]:
+                    if cid in records:
+                        record(formula, "downloaded", cid=cid, file=self._write(formula, records[cid]))
+                    else:
+                        record(formula, "notFound", cid=cid)
+
+        batches = list(toDownload)
+        await asyncio.gather(*(download(batches[i:i + self.batchSize]) for i in range(0, len(batches), self.batchSize)))
+
+        return counts
+
+def fetchFormulas(formulas, **options):
+    return asyncio.run(PubChemFetcher(**options).run(formulas))
+
+def addArguments(parser):
+    parser.add_argument("formulas", help="file with one formula per line, e.g. filtered_compounds.txt")
+    parser.add_argument("--out-dir", default="sdf_single_center")
+    parser.add_argument("--journal", default=None, help="resume journal (default: <out-dir>/journal.jsonl)")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=5, help="requests per second")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=10, help="CIDs per SDF request")
+
+def run(args):
+    with open(args.formulas, "r") as f:
+        formulas = [line.strip() for line in f if line.strip()]
+
+    counts = fetchFormulas(formulas, baseUrl=args.base_url, outDir=args.out_dir, journalPath=args.journal,
+                           concurrency=args.concurrency, requestsPerSecond=args.rate,
+                           retries=args.retries, batchSize=args.batch_size)
+    print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())) or "nothing to do")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download 3D SDFs from PubChem for a list of formulas")
+    addArguments(parser)
+    run(parser.parse_args())
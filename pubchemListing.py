@@ -0,0 +1,139 @@
+from Compound import Compound
+
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import argparse
+import os
+import re
+
+# One entry of a PubChem text listing such as testCompounds.txt:
+#
+#   12. Hydrogen peroxide; 7722-84-1 ...   (title after the index is optional)
+#   MW: 34.015 g/mol MF: H2O2
+#   IUPAC name: hydrogen peroxide      (optional)
+#   Create Date: 2004-09-16
+#   CID: 784
+ListingRecord = namedtuple("ListingRecord", ["index", "mw", "mf", "createDate", "cid", "iupacName", "title"], defaults=[None, None])
+
+RECORD_START = re.compile(r"^(\d+)\.(?:\s+(.*?))?\s*$")
+
+def readListing(path):
+    # Yields ListingRecords one at a time; memory use does not depend on the file size
+    with open(path, "r", encoding="utf-8") as file:
+        yield from parseListing(file)
+
+def parseListing(lines):
+    fields = None
+
+    for line in lines:
+        match = RECORD_START.match(line)
+        if match:
+            if fields is not None and fields["mf"] is not None:
+                yield ListingRecord(**fields)
+            fields = {"index": int(match.group(1)), "mw": None, "mf": None, "createDate": None, "cid": None, "title": match.group(2) or None}
+            continue
+
+        if fields is None:
+            continue
+
+        line = line.strip()
+        if "MF:" in line:
+            start = line.find("MF:")
+            fields["mf"] = line[start + len("MF:"):].strip()
+            if line.startswith("MW:"):
+                fields["mw"] = float(line[len("MW:"):start].split()[0])
+        elif line.startswith("Create Date:"):
+            fields["createDate"] = line[len("Create Date:"):].strip()
+        elif line.startswith("CID:"):
+            fields["cid"] = int(line[len("CID:"):].strip())
+        elif line.startswith("IUPAC name:"):
+            fields["iupacName"] = line[len("IUPAC name:"):].strip()
+
+    if fields is not None and fields["mf"] is not None:
+        yield ListingRecord(**fields)
+
+# Predicates take a Compound and return a bool. They live at module level so worker processes can unpickle them.
+def isSmallBinary(compound):
+    # the filter used to build filtered_compounds.txt
+    return 2 < compound.totalElements() < 5 and compound.numUniqueElements() < 3
+
+def isSingleCenter(compound):
+    return compound.numUniqueElements() >= 2 and bool(compound.getCentralAtom())
+
+def isSingleCenterCovalent(compound):
+    return isSingleCenter(compound) and compound.isCovalent()
+
+PREDICATES = {
+    "smallBinary": isSmallBinary,
+    "singleCenter": isSingleCenter,
+    "singleCenterCovalent": isSingleCenterCovalent
+}
+
+def _classifyChunk(predicate, formulas):
+    results = []
+    for formula in formulas:
+        try:
+            results.append(bool(predicate(Compound(formula))))
+        except (ValueError, KeyError):
+            results.append(False)  # unparseable formula or unknown element
+    return results
+
+def classifyRecords(records, predicate=isSingleCenterCovalent, processes=None, chunksize=1024):
+    # Yields the records whose formula passes predicate, in input order.
+    # Chunks are classified in a process pool with at most 2 * processes chunks in flight,
+    # so arbitrarily long record streams are filtered in bounded memory.
+    records = iter(records)
+    processes = processes or os.cpu_count() or 1
+
+    if processes == 1:
+        for chunk in iter(lambda: list(islice(records, chunksize)), []):
+            for record, keep in zip(chunk, _classifyChunk(predicate, [r.mf for r in chunk])):
+                if keep: yield record
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = deque()
+        chunks = iter(lambda: list(islice(records, chunksize)), [])
+
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(_classifyChunk, predicate, [r.mf for r in chunk])))
+
+            if len(pending) >= 2 * processes:
+                yield from _drain(pending.popleft())
+
+        while pending:
+            yield from _drain(pending.popleft())
+
+def _drain(entry):
+    chunk, future = entry
+    for record, keep in zip(chunk, future.result()):
+        if keep: yield record
+
+def writeFormulas(records, path):
+    # Writes one formula per line, like filtered_compounds.txt, and returns how many were written
+    count = 0
+    with open(path, "w") as file:
+        for record in records:
+            file.write(record.mf + "\n")
+            count += 1
+    return count
+
+def addArguments(parser):
+    parser.add_argument("listing", help="PubChem listing, e.g. testCompounds.txt")
+    parser.add_argument("output", help="file to write the matching formulas to")
+    parser.add_argument("--filter", choices=sorted(PREDICATES), default="singleCenterCovalent")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=1024)
+
+def run(args):
+    records = classifyRecords(readListing(args.listing), PREDICATES[args.filter], args.processes, args.chunksize)
+    print(f"{writeFormulas(records, args.output)} formulas written to {args.output}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Filter a PubChem text listing by formula")
+    addArguments(parser)
+    run(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    main()
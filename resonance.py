@@ -0,0 +1,199 @@
+from dataCollection import getElementTable
+
+from collections import namedtuple
+from itertools import combinations_with_replacement, islice
+from math import factorial, prod
+
+# Resonance structures of a single-center Lewis structure.
+#
+# Starting from the all-single-bond distribution (terminal octets filled, the rest on the
+# central atom), every resonance form moves u_k lone pairs of terminal k into its bond with
+# the central atom (order 1 + u_k, at most a triple bond). Each move raises the terminal's
+# formal charge by one and lowers the central atom's by one. Forms are ranked by
+#
+#   1. missing electrons in the central atom's octet (the octet rule comes first, except
+#      for electron-deficient centers of groups 2 and 13 such as BF3 or BeCl2, which keep
+#      their incomplete octet rather than take on formal charges),
+#   2. the sum of |formal charge|,
+#   3. electrons beyond the octet (only atoms past neon may expand it),
+#   4. sum(formal charge * electronegativity), i.e. negative charge on electronegative atoms,
+#
+# and every form with the best rank belongs to the resonance set.
+#
+# Terminals with the same element and lone pairs are interchangeable, so the search runs over
+# classes of them and gives each class a sorted tuple of upgrades. The tuples of all classes
+# are the canonical key of a form: equivalent forms (SO2's two S=O placements, sulfate's six
+# placements of two S=O) share one key and are searched once. A depth-first search over the
+# classes is pruned as soon as a lower bound on its rank (octet deficit with every remaining
+# lone pair used, formal charges so far plus the closest the central charge can still get)
+# is worse than the best complete form found, so many-ligand centers stay cheap.
+
+MAX_FORMS = 256   # concrete forms listed by expandForms; averages always cover the whole set
+
+ResonanceSet = namedtuple("ResonanceSet", [
+    "classes",        # tuple of bond index tuples, interchangeable terminals
+    "forms",          # canonical forms: one sorted upgrade tuple per class
+    "rank",           # (octet deficit, sum |formal charge|, expansion, electronegativity score)
+    "count",          # number of concrete resonance forms
+    "nodes"           # search nodes visited
+])
+
+def _octet(number):
+    return 2 if number <= 2 else 8
+
+def enumerateResonance(atoms, central, terminals, lonePairs, electronCount, unpaired=0):
+    # atoms: element symbols; terminals: the atom bonded to the central atom by each (single) bond.
+    # lonePairs, electronCount: per-atom counts of the single-bond distribution; unpaired: leftover
+    # electrons on the central atom. Returns the ResonanceSet of the best-ranked forms.
+    table = getElementTable()
+    index = table.index
+
+    def element(i):
+        # (atomic number, valence, electronegativity) of atom i
+        number = index[atoms[i]]
+        return number, int(table.valence[number]), float(table.electronegativity[number])
+
+    number, valence, centralEN = element(central)
+    centralCharge = valence - 2 * lonePairs[central] - unpaired - len(terminals)
+    centralElectrons = electronCount[central]
+    # transition metals carry valence 0 in the table, so only main-group centers are exempt
+    target = 0 if 0 < valence < 4 else _octet(number)
+    octetLimit = None if number > 10 else max(_octet(number), centralElectrons)
+
+    # classes of interchangeable terminals: (charge, capacity, electronegativity, bond indices)
+    groups = {}
+    for k, t in enumerate(terminals):
+        groups.setdefault((atoms[t], lonePairs[t]), []).append(k)
+    classes = []
+    for bonds in groups.values():
+        t = terminals[bonds[0]]
+        number, valence, en = element(t)
+        capacity = 0 if number <= 2 else max(0, min(lonePairs[t], 2))
+        classes.append((valence - 2 * lonePairs[t] - 1, capacity, en, tuple(bonds)))
+    classes.sort(key=lambda c: -c[1])  # upgradable classes first, so pruning starts early
+
+    remaining = [0] * (len(classes) + 1)  # upgrades still possible from class j on
+    for j in range(len(classes) - 1, -1, -1):
+        remaining[j] = remaining[j + 1] + classes[j][1] * len(classes[j][3])
+
+    def rank(upgrades, charges, score):
+        electrons = centralElectrons + 2 * upgrades
+        charge = centralCharge - upgrades
+        return (max(0, target - electrons), charges + abs(charge), max(0, electrons - 8),
+                round(score + charge * centralEN, 9))
+
+    if not remaining[0]:
+        # nothing to move (e.g. only hydrogens around the center): the single-bond form is the only one
+        key = rank(0, sum(abs(c[0]) * len(c[3]) for c in classes), sum(c[0] * c[2] * len(c[3]) for c in classes))
+        return ResonanceSet(tuple(c[3] for c in classes), (tuple((0,) * len(c[3]) for c in classes),), key, 1, 1)
+
+    best = [None]
+    forms = {}
+    nodes = 0
+
+    def search(j, upgrades, charges, score, chosen):
+        nonlocal nodes
+        nodes += 1
+        if octetLimit is not None and centralElectrons + 2 * upgrades > octetLimit:
+            return
+
+        if j == len(classes):
+            key = rank(upgrades, charges, score)
+            if best[0] is None or key < best[0]:
+                best[0] = key
+                forms.clear()
+            if key == best[0]:
+                forms[tuple(chosen)] = key
+            return
+
+        if best[0] is not None:
+            # lower bound: the most upgrades still possible, and the central charge as close to 0 as it can get
+            deficit = max(0, target - centralElectrons - 2 * (upgrades + remaining[j]))
+            low, high = centralCharge - upgrades - remaining[j], centralCharge - upgrades
+            bound = (deficit, charges + (0 if low <= 0 <= high else min(abs(low), abs(high))))
+            if bound > best[0][:2]:
+                return
+
+        charge, capacity, electronegativity, bonds = classes[j]
+        for combination in combinations_with_replacement(range(capacity, -1, -1), len(bonds)):
+            used = sum(combination)
+            search(j + 1, upgrades + used,
+                   charges + sum(abs(charge + u) for u in combination),
+                   score + electronegativity * (charge * len(bonds) + used),
+                   chosen + [combination])
+
+    search(0, 0, 0, 0.0, [])
+
+    canonical = sorted(forms)
+    count = sum(prod(map(_arrangements, form)) for form in canonical)
+    return ResonanceSet(tuple(c[3] for c in classes), tuple(canonical), best[0], count, nodes)
+
+def _arrangements(upgrades):
+    # distinct orderings of a multiset
+    counts = {}
+    for u in upgrades:
+        counts[u] = counts.get(u, 0) + 1
+    return factorial(len(upgrades)) // prod(factorial(c) for c in counts.values())
+
+def _orderings(upgrades):
+    # Distinct orderings of a multiset, lazily and in decreasing lexicographic order, so the
+    # first one has the largest upgrades on the earliest bonds
+    items = sorted(upgrades, reverse=True)
+    while True:
+        yield tuple(items)
+        i = len(items) - 2
+        while i >= 0 and items[i] <= items[i + 1]:
+            i -= 1
+        if i < 0:
+            return
+        j = len(items) - 1
+        while items[j] >= items[i]:
+            j -= 1
+        items[i], items[j] = items[j], items[i]
+        items[i + 1:] = reversed(items[i + 1:])
+
+def _arrangementsOf(form, j=0):
+    # every combination of orderings of the classes j, j+1, ... of a canonical form, lazily
+    if j == len(form):
+        yield ()
+        return
+    for ordering in _orderings(form[j]):
+        for rest in _arrangementsOf(form, j + 1):
+            yield (ordering,) + rest
+
+def expandForms(resonanceSet, n_bonds, limit=MAX_FORMS):
+    # Per-bond upgrades (tuple of n_bonds ints) of up to `limit` concrete resonance forms.
+    # The first one puts the upgrades of each class on its earliest bonds.
+    def concrete():
+        for form in resonanceSet.forms:
+            for arrangement in _arrangementsOf(form):
+                upgrades = [0] * n_bonds
+                for bonds, values in zip(resonanceSet.classes, arrangement):
+                    for k, u in zip(bonds, values):
+                        upgrades[k] = u
+                yield tuple(upgrades)
+
+    return list(islice(concrete(), limit))
+
+def averageUpgrades(resonanceSet, n_bonds):
+    # Mean upgrade of every bond over all concrete forms of the set, as a list of n_bonds floats
+    average = [0.0] * n_bonds
+    total = 0
+    for form in resonanceSet.forms:
+        weight = prod(_arrangements(upgrades) for upgrades in form) if len(resonanceSet.forms) > 1 else 1
+        total += weight
+        for bonds, upgrades in zip(resonanceSet.classes, form):
+            share = weight * sum(upgrades) / len(bonds)
+            for k in bonds:
+                average[k] += share
+    return [value / total for value in average]
+
+def formalCharges(atoms, central, bonds, lonePairs, unpaired=0):
+    # Formal charge valence - nonbonding electrons - bonds of every atom, for (a, b, order) bonds
+    table = getElementTable()
+    charges = [int(table.valence[table.index[symbol]]) - 2 * pairs for symbol, pairs in zip(atoms, lonePairs)]
+    for a, b, order in bonds:
+        charges[a] -= order
+        charges[b] -= order
+    charges[central] -= unpaired
+    return tuple(charges)
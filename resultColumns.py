@@ -0,0 +1,328 @@
+from batchVSEPR import generateVSEPRBatch
+from dataCollection import getElementTable
+from SimpleCompound import GEOMETRIES
+
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import argparse
+import json
+import os
+
+import numpy as np
+
+# Columnar storage of batch results, for scans over millions of structures without
+# rebuilding Python objects.
+#
+# A result set is a directory with one raw little-endian file per column plus schema.json
+# (dtype and shape of every column). Per-molecule columns have one row per formula; the
+# others are flat arrays over all molecules, sliced by an offsets column of N + 1 entries:
+#
+#   atomOffsets      atomicNumbers, atomLonePairs, formalCharges         (per atom)
+#   bondOffsets      bondAtoms (central, terminal), bondOrders, averageBondOrders,
+#                    bondDirections, bondLengths                         (per bond)
+#   lonePairOffsets  lonePairDirections                                  (per central lone pair)
+#   angleOffsets     angleBonds (bond i, bond j), bondAngles in degrees  (per bond pair, i < j)
+#   formulaOffsets   formulaBytes (UTF-8);  errorOffsets  errorBytes
+#
+# Atom and bond indices are local to their molecule. Columns are appended chunk by chunk,
+# so writing needs memory for one chunk only, and ResultColumns memory-maps every column:
+# results[i] returns read-only views into the files, and whole columns can be scanned
+# directly (e.g. results.bondLengths[results.bondOrders == 2]). toArrow() wraps the same
+# buffers in a pyarrow Table when pyarrow is installed.
+
+FORMAT_VERSION = 1
+SCHEMA_FILE = "schema.json"
+
+# column -> (dtype, offsets column or None for one row per molecule, trailing shape)
+COLUMNS = {
+    "valid": ("bool", None, ()),
+    "central": ("int32", None, ()),
+    "stericNumbers": ("int8", None, ()),
+    "resonanceCounts": ("int64", None, ()),
+    "formulaOffsets": ("int64", None, ()),
+    "formulaBytes": ("uint8", "formulaOffsets", ()),
+    "errorOffsets": ("int64", None, ()),
+    "errorBytes": ("uint8", "errorOffsets", ()),
+    "atomOffsets": ("int64", None, ()),
+    "atomicNumbers": ("uint8", "atomOffsets", ()),
+    "atomLonePairs": ("int8", "atomOffsets", ()),
+    "formalCharges": ("int8", "atomOffsets", ()),
+    "bondOffsets": ("int64", None, ()),
+    "bondAtoms": ("int32", "bondOffsets", (2,)),
+    "bondOrders": ("int8", "bondOffsets", ()),
+    "averageBondOrders": ("float64", "bondOffsets", ()),
+    "bondDirections": ("float64", "bondOffsets", (3,)),
+    "bondLengths": ("float64", "bondOffsets", ()),
+    "lonePairOffsets": ("int64", None, ()),
+    "lonePairDirections": ("float64", "lonePairOffsets", (3,)),
+    "angleOffsets": ("int64", None, ()),
+    "angleBonds": ("int32", "angleOffsets", (2,)),
+    "bondAngles": ("float64", "angleOffsets", ()),
+}
+
+OFFSETS = [name for name in COLUMNS if name.endswith("Offsets")]
+
+# One molecule of a result set; array fields are views into the column files
+StructureColumns = namedtuple("StructureColumns", [
+    "formula", "error", "central", "stericNumber", "resonanceCount",
+    "atomicNumbers", "atomLonePairs", "formalCharges",
+    "bondAtoms", "bondOrders", "averageBondOrders", "bondDirections", "bondLengths",
+    "lonePairDirections", "angleBonds", "bondAngles"
+])
+
+def _strings(values):
+    # (lengths, UTF-8 bytes) of a list of strings, None counting as empty
+    encoded = [(value or "").encode() for value in values]
+    return np.array([len(e) for e in encoded], dtype=np.int64), np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+def batchColumns(batch):
+    # (counts, columns) of a generateVSEPRBatch() result: counts maps each offsets column to the
+    # per-molecule row counts, columns maps every other column to its rows for this batch
+    table = getElementTable()
+    valid = batch["valid"]
+    D = batch["directions"].shape[1]
+    lonePairs = batch["lonePairs"]
+    steric = batch["stericNumbers"]
+    numBonds = np.where(valid, steric - lonePairs, 0)
+
+    slots = np.arange(D)
+    lonePairMask = batch["lonePairMask"] & valid[:, None]
+    bondMask = (slots[None, :] >= lonePairs[:, None]) & (slots[None, :] < steric[:, None]) & valid[:, None]
+
+    atoms = [symbols or [] for symbols in batch["atoms"]]
+    atomCounts = np.array([len(symbols) for symbols in atoms], dtype=np.int64)
+    flatten = lambda lists: [value for values in lists if values for value in values]
+
+    # every pair of bonds at the central atom, in combinations() order like getBondAngles
+    directions = batch["directions"]
+    cosines = np.einsum("nid,njd->nij", directions, directions)
+    pairMask = bondMask[:, :, None] & bondMask[:, None, :] & np.triu(np.ones((D, D), dtype=bool), 1)
+    molecule, first, second = np.nonzero(pairMask)
+
+    formulaLengths, formulaBytes = _strings(batch["formulas"])
+    errorLengths, errorBytes = _strings(batch["errors"])
+
+    counts = {
+        "formulaOffsets": formulaLengths,
+        "errorOffsets": errorLengths,
+        "atomOffsets": atomCounts,
+        "bondOffsets": numBonds,
+        "lonePairOffsets": np.where(valid, lonePairs, 0),
+        "angleOffsets": numBonds * (numBonds - 1) // 2,
+    }
+    columns = {
+        "valid": valid,
+        "central": batch["central"],
+        "stericNumbers": steric,
+        "resonanceCounts": batch["resonanceCounts"],
+        "formulaBytes": formulaBytes,
+        "errorBytes": errorBytes,
+        "atomicNumbers": table.indices(flatten(atoms)),
+        "atomLonePairs": np.array(flatten(batch["atomLonePairs"]), dtype=np.int64),
+        "formalCharges": np.array(flatten(batch["formalCharges"]), dtype=np.int64),
+        "bondAtoms": np.stack((np.repeat(batch["central"], numBonds), batch["bondAtoms"][bondMask]), axis=1),
+        "bondOrders": batch["bondOrders"][bondMask],
+        "averageBondOrders": batch["averageBondOrders"][bondMask],
+        "bondDirections": directions[bondMask],
+        "bondLengths": batch["bondLengths"][bondMask],
+        "lonePairDirections": directions[lonePairMask],
+        "angleBonds": np.stack((first - lonePairs[molecule], second - lonePairs[molecule]), axis=1),
+        "bondAngles": np.degrees(np.arccos(np.clip(cosines[molecule, first, second], -1.0, 1.0))),
+    }
+    return counts, columns
+
+def _chunkColumns(formulas, geometry):
+    return batchColumns(generateVSEPRBatch(formulas, geometry))
+
+class ResultWriter:
+    # Appends batchColumns() chunks to the column files of a result directory; close() writes
+    # schema.json, which is what makes the directory readable
+    def __init__(self, path, geometry="vsepr"):
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, SCHEMA_FILE)):
+            os.remove(os.path.join(path, SCHEMA_FILE))
+        self.path = path
+        self.geometry = geometry
+        self.count = 0
+        self.rows = dict.fromkeys(COLUMNS, 0)
+        self.files = {name: open(os.path.join(path, name), "wb") for name in COLUMNS}
+        for name in OFFSETS:
+            self._append(name, np.zeros(1))
+
+    def _append(self, name, values):
+        dtype, _, shape = COLUMNS[name]
+        values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<")).reshape((-1,) + shape)
+        self.files[name].write(values.tobytes())
+        self.rows[name] += len(values)
+
+    def write(self, counts, columns):
+        n = len(columns["valid"])
+        for name, rowCounts in counts.items():
+            # the last offset written so far is the rows of the columns this offsets column indexes
+            start = next(self.rows[column] for column, (_, offsets, _) in COLUMNS.items() if offsets == name)
+            self._append(name, start + np.cumsum(rowCounts))
+        for name, values in columns.items():
+            self._append(name, values)
+        self.count += n
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        schema = {
+            "version": FORMAT_VERSION,
+            "count": self.count,
+            "geometry": self.geometry,
+            "columns": {name: {"dtype": np.dtype(dtype).newbyteorder("<").str, "shape": [self.rows[name], *shape]}
+                        for name, (dtype, _, shape) in COLUMNS.items()}
+        }
+        with open(os.path.join(self.path, SCHEMA_FILE), "w") as file:
+            json.dump(schema, file, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            for file in self.files.values():
+                file.close()
+
+def writeResults(formulas, path, geometry="vsepr", processes=1, chunksize=4096):
+    # Runs generateVSEPRBatch over formulas chunk by chunk and writes the results to the
+    # directory path. Chunks go to a process pool (at most 2 * processes in flight) when
+    # processes > 1. Returns the number of molecules written.
+    if geometry not in GEOMETRIES:
+        raise ValueError(f"Unknown geometry {geometry!r}, expected one of {GEOMETRIES}")
+    formulas = iter(formulas)
+    chunks = iter(lambda: list(islice(formulas, chunksize)), [])
+    processes = processes or os.cpu_count() or 1
+
+    with ResultWriter(path, geometry) as writer:
+        if processes == 1:
+            for chunk in chunks:
+                writer.write(*_chunkColumns(chunk, geometry))
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(_chunkColumns, chunk, geometry))
+                    if len(pending) >= 2 * processes:
+                        writer.write(*pending.popleft().result())
+                while pending:
+                    writer.write(*pending.popleft().result())
+        return writer.count
+
+class ResultColumns:
+    # Memory-mapped, read-only view of a result directory: len(results), results[i] (a
+    # StructureColumns of views), iteration, and every column as an attribute
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, SCHEMA_FILE)) as file:
+            schema = json.load(file)
+        if schema["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported result format version {schema['version']}")
+        self.count = schema["count"]
+        self.geometry = schema["geometry"]
+        self.columns = {}
+        for name, column in schema["columns"].items():
+            dtype, shape = np.dtype(column["dtype"]), tuple(column["shape"])
+            if shape[0]:
+                self.columns[name] = np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=shape)
+            else:
+                self.columns[name] = np.empty(shape, dtype=dtype)  # an empty file cannot be mapped
+                self.columns[name].flags.writeable = False
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns", {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return self.count
+
+    def _rows(self, name, i):
+        # rows of molecule i in the columns indexed by the offsets column `name`
+        offsets = self.columns[name]
+        return slice(int(offsets[i]), int(offsets[i + 1]))
+
+    def formula(self, i):
+        return bytes(self.columns["formulaBytes"][self._rows("formulaOffsets", i)]).decode()
+
+    def error(self, i):
+        return bytes(self.columns["errorBytes"][self._rows("errorOffsets", i)]).decode() or None
+
+    def __getitem__(self, i):
+        if i < 0: i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(f"molecule {i} out of range for {self.count} molecules")
+
+        c = self.columns
+        atoms, bonds = self._rows("atomOffsets", i), self._rows("bondOffsets", i)
+        lonePairs, angles = self._rows("lonePairOffsets", i), self._rows("angleOffsets", i)
+        return StructureColumns(
+            self.formula(i), self.error(i), int(c["central"][i]), int(c["stericNumbers"][i]), int(c["resonanceCounts"][i]),
+            c["atomicNumbers"][atoms], c["atomLonePairs"][atoms], c["formalCharges"][atoms],
+            c["bondAtoms"][bonds], c["bondOrders"][bonds], c["averageBondOrders"][bonds],
+            c["bondDirections"][bonds], c["bondLengths"][bonds],
+            c["lonePairDirections"][lonePairs], c["angleBonds"][angles], c["bondAngles"][angles]
+        )
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def toArrow(self):
+        # pyarrow Table with one row per molecule; flat columns become list (or fixed-size list)
+        # columns over the mapped buffers. pyarrow is imported here and is not required otherwise.
+        import pyarrow as pa
+
+        def listArray(name):
+            values = np.asarray(self.columns[name])
+            _, offsets, shape = COLUMNS[name]
+            flat = pa.array(values.reshape(-1))
+            if shape:
+                flat = pa.FixedSizeListArray.from_arrays(flat, shape[0])
+            return pa.ListArray.from_arrays(pa.array(np.asarray(self.columns[offsets])), flat)
+
+        def strings(name):
+            offsets = pa.array(np.asarray(self.columns[name + "Offsets"]).astype(np.int32))
+            return pa.StringArray.from_buffers(self.count, offsets.buffers()[1], pa.py_buffer(np.asarray(self.columns[name + "Bytes"])))
+
+        arrays = {"formula": strings("formula"), "error": strings("error")}
+        for name, (_, offsets, _) in COLUMNS.items():
+            if name in OFFSETS or name in ("formulaBytes", "errorBytes"):
+                continue
+            arrays[name] = pa.array(np.asarray(self.columns[name])) if offsets is None else listArray(name)
+        return pa.table(arrays)
+
+    def writeParquet(self, path):
+        import pyarrow.parquet as pq
+        pq.write_table(self.toArrow(), path)
+
+def addArguments(parser):
+    parser.add_argument("formulas", help="file with one formula per line")
+    parser.add_argument("output", help="result directory to write")
+    parser.add_argument("--geometry", choices=GEOMETRIES, default="vsepr")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--chunksize", type=int, default=4096)
+    parser.add_argument("--parquet", default=None, help="also write a Parquet file (needs pyarrow)")
+
+def run(args):
+    from batchPipeline import readFormulas
+
+    with open(args.formulas, "r", encoding="utf-8") as file:
+        count = writeResults(readFormulas(file), args.output, args.geometry, args.processes, args.chunksize)
+
+    results = ResultColumns(args.output)
+    print(f"wrote {count} results ({int(count - results.valid.sum())} invalid) to {args.output}")
+    if args.parquet:
+        results.writeParquet(args.parquet)
+        print(f"wrote {args.parquet}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write batch results as memory-mappable columns")
+    addArguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,226 @@
+from Compound import Compound
+from SimpleCompound import GEOMETRIES, structureRecord
+
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+
+# Finished structure records keyed by canonical formula, shared by every caller in a process.
+#
+# Formulas are keyed by their Hill form with charge (Compound.canonicalFormula), so "CeH3" and
+# "H3Ce", or a formula listed twice, are computed once. The pipeline gives every spelling of a
+# formula the same molecule up to atom order (geometryTable places bonds by order and terminal
+# element, not by position), so the record of the Hill formula is relabeled into the atom order
+# of the formula that was asked for: record(f) == structureRecord(f) for any spelling.
+# Lookups go to an in-memory LRU first and then, when a path is given, to a SQLite
+# file in WAL mode that survives restarts and can be shared by any number of processes
+# (batch workers, several servers). Records are stored as JSON text, so they come back
+# exactly as computed. Error records are cached as well.
+#
+#   cache = StructureCache(path="structures.cache")
+#   cache.records(["H2O", "OH2", "SO4-2"])       # two pipeline runs, three records
+#
+# getCache() returns the process-wide instance; $LEWIS3D_CACHE gives it a disk tier.
+
+CACHE_SIZE = 65536     # records kept in memory per process
+CACHE_VERSION = 5      # bump when records change, so old disk entries are dropped
+QUERY_CHUNK = 500      # keys per SQLite lookup, below SQLite's variable limit
+
+DISK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (key TEXT PRIMARY KEY, record TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+def canonicalKey(formula):
+    # Hill formula with charge; formulas that do not parse are their own key
+    try:
+        return Compound(formula).canonicalFormula()
+    except Exception:
+        return formula
+
+def atomOrder(formula):
+    # Atom symbols in the order SimpleCompound lists them, or None when the formula does not parse
+    try:
+        return [symbol for symbol, count in Compound(formula).elements.items() for _ in range(count)]
+    except Exception:
+        return None
+
+def relabelRecord(record, formula, atoms):
+    # The record of another spelling of formula, with its atoms, bonds and per-atom and per-bond
+    # fields in the order of atoms (from atomOrder). Same-element atoms keep their relative order.
+    if "error" in record or atoms is None or atoms == record["atoms"]:
+        return dict(record, formula=formula)
+
+    positions = {}
+    for i, symbol in enumerate(record["atoms"]):
+        positions.setdefault(symbol, []).append(i)
+    source = [positions[symbol].pop(0) for symbol in atoms]   # new atom i is record atom source[i]
+    target = [0] * len(source)
+    for i, old in enumerate(source):
+        target[old] = i
+
+    central = target[record["central"]]
+    terminal = [target[b if a == record["central"] else a] for a, b, _ in record["bonds"]]
+    bonds = sorted(range(len(terminal)), key=terminal.__getitem__)   # bonds follow their terminal atom
+
+    relabeled = dict(record, formula=formula, atoms=list(atoms), central=central)
+    relabeled["bonds"] = [[central, terminal[k], record["bonds"][k][2]] for k in bonds]
+    for field in ("lonePairs", "formalCharges"):
+        relabeled[field] = [record[field][old] for old in source]
+    for field in ("averageBondOrders", "bondDirections", "bondLengths"):
+        relabeled[field] = [record[field][k] for k in bonds]
+    if "bondAngles" in record:
+        # angles come in combinations() order of the bonds
+        count = len(bonds)
+        pairs = [(i, j) for i in range(count) for j in range(i + 1, count)]
+        angle = {pair: entry[3] for pair, entry in zip(pairs, record["bondAngles"])}
+        relabeled["bondAngles"] = [
+            [atoms[terminal[bonds[i]]], atoms[central], atoms[terminal[bonds[j]]],
+             angle[min(bonds[i], bonds[j]), max(bonds[i], bonds[j])]]
+            for i, j in pairs
+        ]
+    return relabeled
+
+def _geometryTag(geometry):
+    # Learned records depend on the trained model, so its size and mtime are part of their key
+    if geometry != "learned":
+        return geometry
+    from bondPredictor import modelPath
+
+    try:
+        stat = os.stat(modelPath())
+        return f"learned@{stat.st_size}-{stat.st_mtime_ns}"
+    except OSError:
+        return geometry
+
+def computeRecords(formulas, geometry):
+    return [structureRecord(formula, geometry) for formula in formulas]
+
+class StructureCache:
+    # Thread-safe; the disk connection is opened lazily and again in forked children
+    def __init__(self, maxsize=CACHE_SIZE, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = self.diskHits = self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _disk(self):
+        if self.path is None:
+            return None
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                connection.executescript(DISK_SCHEMA)
+                version = connection.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+                if version is None or version[0] != str(CACHE_VERSION):
+                    connection.execute("DELETE FROM records")
+                    connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(CACHE_VERSION),))
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def _remember(self, key, record):
+        # caller holds the lock
+        self.entries[key] = record
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def getMany(self, keys):
+        # {key: record} for the keys found in memory or on disk
+        found = {}
+        with self._lock:
+            for key in keys:
+                record = self.entries.get(key)
+                if record is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = record
+            self.hits += len(found)
+
+            disk = self._disk()
+            missing = [key for key in keys if key not in found]
+            if disk is not None and missing:
+                for start in range(0, len(missing), QUERY_CHUNK):
+                    chunk = missing[start:start + QUERY_CHUNK]
+                    rows = disk.execute(f"SELECT key, record FROM records WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                    for key, text in rows:
+                        record = json.loads(text)
+                        self._remember(key, record)
+                        found[key] = record
+                        self.diskHits += 1
+            self.misses += len(keys) - len(found)
+        return found
+
+    def putMany(self, items):
+        # Stores (key, record) pairs in memory and on disk; the first record written for a key wins on disk
+        items = list(items)
+        with self._lock:
+            for key, record in items:
+                self._remember(key, record)
+            disk = self._disk()
+            if disk is not None and items:
+                with disk:
+                    disk.executemany("INSERT OR IGNORE INTO records VALUES (?, ?)",
+                                     [(key, json.dumps(record)) for key, record in items])
+
+    def records(self, formulas, geometry="vsepr", angles=True, compute=computeRecords):
+        # One record per formula, in order. compute(canonical formulas, geometry) returns the
+        # records of the distinct canonical formulas missing from both tiers.
+        # Records share their lists with the cache and must not be modified.
+        if geometry not in GEOMETRIES:
+            raise ValueError(f"Unknown geometry {geometry!r}, expected one of {GEOMETRIES}")
+        tag = _geometryTag(geometry)
+        canonical = [canonicalKey(formula) for formula in formulas]
+        keys = list(dict.fromkeys(f"{tag}:{formula}" for formula in canonical))
+        found = self.getMany(keys)
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            computed = compute([key.split(":", 1)[1] for key in missing], geometry)
+            self.putMany(zip(missing, computed))
+            found.update(zip(missing, computed))
+
+        output = []
+        for formula, key in zip(formulas, canonical):
+            record = relabelRecord(found[f"{tag}:{key}"], formula, atomOrder(formula))
+            if not angles:
+                record.pop("bondAngles", None)
+            output.append(record)
+        return output
+
+    def record(self, formula, geometry="vsepr", angles=True):
+        return self.records([formula], geometry, angles)[0]
+
+    def info(self):
+        info = {"hits": self.hits, "diskHits": self.diskHits, "misses": self.misses, "size": len(self.entries)}
+        if self.path is not None:
+            with self._lock:
+                info["diskSize"] = self._disk().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        return info
+
+_cache = None
+
+def getCache(path=None):
+    # The process-wide cache; its disk tier is path, else $LEWIS3D_CACHE, else none
+    global _cache
+    path = path or os.environ.get("LEWIS3D_CACHE")
+    if _cache is None or (path is not None and _cache.path != path):
+        if _cache is not None:
+            _cache.close()
+        _cache = StructureCache(path=path)
+    return _cache
+
+def cachedRecord(formula, geometry="vsepr", angles=True):
+    # structureRecord through the process-wide cache
+    return getCache().record(formula, geometry, angles)
@@ -0,0 +1,317 @@
+from SimpleCompound import SimpleCompound, GEOMETRIES
+from dataCollection import getElementTable
+from structureCache import StructureCache, CACHE_SIZE, computeRecords
+
+from concurrent.futures import ProcessPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import base64
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+# Long-running structure service: JSON over HTTP on a TCP port or a Unix socket.
+#
+# The element table, the imported modules and a structureCache of finished records (with an
+# optional disk tier shared with other processes, --cache) stay warm between requests, so a
+# small molecule costs a dictionary lookup or one pipeline run plus the HTTP round trip
+# instead of an interpreter start. Each connection gets its own thread;
+# connections are kept alive, so a client can pipeline several requests before reading the
+# responses. Cache misses of large batches and image rendering go to a process pool whose
+# workers are started (with matplotlib imported) when the server starts.
+#
+#   POST /structures  {"formula": "H2O"}                          -> one record
+#                     {"formulas": ["H2O", "SO4-2"], "angles": false,
+#                      "geometry": "vsepr", "image": "png"}        -> {"results": [records]}
+#   GET  /health                                                    -> uptime, request count, cache stats
+#
+# Records come from SimpleCompound.structureRecord: toRecord() dicts, or
+# {"formula": ..., "error": ...} for formulas the pipeline rejects. "image" adds a base64
+# PNG/SVG rendering of the requested geometry to every record.
+
+DEFAULT_PORT = 8765
+PARALLEL_THRESHOLD = 256  # uncached formulas per request before they are split across the pool
+CHUNK_SIZE = 64
+IMAGE_FORMATS = ("png", "svg")
+
+def _ready():
+    return True
+
+def renderImage(formula, format="png", geometry="vsepr", size=(4, 4), dpi=100):
+    # Image bytes of one formula's structure in the given geometry
+    from visualization import renderMolecule
+
+    buffer = io.BytesIO()
+    renderMolecule(SimpleCompound(formula).vseprSnapshot(geometry), buffer, size, dpi, format=format)
+    return buffer.getvalue()
+
+def _warmWorker():
+    # Pool initializer: load the element table and matplotlib once per worker
+    getElementTable()
+    try:
+        import visualization  # noqa: F401
+    except ImportError:
+        pass  # matplotlib is optional; image requests will report the error
+
+class StructureService:
+    # Request handling independent of the transport
+    def __init__(self, processes=0, cacheSize=CACHE_SIZE, cachePath=None):
+        getElementTable()
+        self.processes = processes
+        self.cache = StructureCache(cacheSize, cachePath)
+        self.pool = None
+        if processes:
+            self.pool = ProcessPoolExecutor(max_workers=processes, initializer=_warmWorker)
+            wait([self.pool.submit(_ready) for _ in range(processes)])  # start the workers now, not on the first request
+        self.started = time.time()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.cache.close()
+
+    def health(self):
+        return {"status": "ok", "uptime": time.time() - self.started, "requests": self.requests,
+                "processes": self.processes, "cache": self.cache.info()}
+
+    def handle(self, request):
+        # One request dict -> response dict; raises ValueError for malformed requests
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        batched = "formulas" in request
+        formulas = request["formulas"] if batched else [request.get("formula")]
+        if not isinstance(formulas, list) or not all(isinstance(formula, str) for formula in formulas):
+            raise ValueError("'formula' must be a string and 'formulas' a list of strings")
+
+        geometry = request.get("geometry", "vsepr")
+        if geometry not in GEOMETRIES:
+            raise ValueError(f"'geometry' must be one of {GEOMETRIES}")
+        angles = bool(request.get("angles", True))
+        image = request.get("image")
+        if image is not None and image not in IMAGE_FORMATS:
+            raise ValueError(f"'image' must be one of {IMAGE_FORMATS}")
+
+        with self._lock:
+            self.requests += 1
+
+        records = self.records(formulas, geometry, angles)
+        if image:
+            records = self.addImages(records, image, geometry)
+        return {"results": records} if batched else records[0]
+
+    def records(self, formulas, geometry, angles):
+        # Cached records; the cache's misses are computed here, or across the pool when there are many.
+        # Records share their lists with the cache and must not be modified.
+        return self.cache.records(formulas, geometry, angles, self._compute)
+
+    def _compute(self, formulas, geometry):
+        if self.pool is None or len(formulas) < PARALLEL_THRESHOLD:
+            return computeRecords(formulas, geometry)
+        chunks = [formulas[i:i + CHUNK_SIZE] for i in range(0, len(formulas), CHUNK_SIZE)]
+        futures = [self.pool.submit(computeRecords, chunk, geometry) for chunk in chunks]
+        return [record for future in futures for record in future.result()]
+
+    def addImages(self, records, format, geometry="vsepr"):
+        # Copies of the records with an "image" (base64) or "imageError" entry
+        valid = [record for record in records if "error" not in record]
+        if self.pool is None:
+            results = [self._tryRender(record["formula"], format, geometry) for record in valid]
+        else:
+            futures = [self.pool.submit(renderImage, record["formula"], format, geometry) for record in valid]
+            results = [self._tryResult(future) for future in futures]
+
+        rendered = dict(zip(map(id, valid), results))
+        output = []
+        for record in records:
+            if id(record) in rendered:
+                data, error = rendered[id(record)]
+                record = dict(record, **({"image": base64.b64encode(data).decode("ascii")} if error is None else {"imageError": error}))
+            output.append(record)
+        return output
+
+    def _tryRender(self, formula, format, geometry):
+        try:
+            return renderImage(formula, format, geometry), None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    def _tryResult(self, future):
+        try:
+            return future.result(), None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+class StructureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # persistent connections, so clients can pipeline requests
+    server_version = "lewis3d"
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, self.server.service.health())
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/structures":
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+
+        try:
+            response = self.server.service.handle(json.loads(body or b"{}"))
+        except ValueError as e:  # includes malformed JSON
+            self._send(400, {"error": str(e)})
+            return
+        self._send(200, response)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def setup(self):
+        self.disable_nagle_algorithm = isinstance(self.client_address, tuple)  # TCP only; responses go out without delay
+        super().setup()
+
+    def address_string(self):
+        # Unix socket clients have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def makeServer(service, host="127.0.0.1", port=DEFAULT_PORT, socketPath=None, verbose=False):
+    # HTTP server for the service on a Unix socket if socketPath is given, else on host:port
+    if socketPath:
+        if os.path.exists(socketPath):
+            os.remove(socketPath)  # stale socket from an earlier run
+        server = UnixHTTPServer(socketPath, StructureHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), StructureHandler)
+        server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+class StructureClient:
+    # Keep-alive client for a running server. address: "host:port" or a Unix socket path.
+    #   with StructureClient("/tmp/lewis3d.sock") as client:
+    #       client.structure("H2O")
+    #       client.pipeline([{"formula": "CO2"}, {"formulas": ["NH3", "CH4"]}])
+    def __init__(self, address=f"127.0.0.1:{DEFAULT_PORT}", timeout=60):
+        self.address = address
+        self.timeout = timeout
+        self.sock = None
+        self.file = None
+
+    def _connect(self):
+        if ":" in self.address and not os.path.exists(self.address):
+            host, port = self.address.rsplit(":", 1)
+            self.sock = socket.create_connection((host, int(port)), self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(self.address)
+        self.file = self.sock.makefile("rb")
+
+    def close(self):
+        if self.sock is not None:
+            self.file.close()
+            self.sock.close()
+            self.sock = self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _readResponse(self):
+        status = self.file.readline().split(None, 2)
+        if len(status) < 2:
+            raise ConnectionError("connection closed by the server")
+        length = 0
+        while True:
+            line = self.file.readline().strip()
+            if not line:
+                break
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                length = int(value)
+        payload = json.loads(self.file.read(length))
+        if int(status[1]) != 200:
+            raise ValueError(f"server error {int(status[1])}: {payload.get('error')}")
+        return payload
+
+    def pipeline(self, requests):
+        # Sends every request before reading any response; responses come back in order
+        if self.sock is None:
+            self._connect()
+        messages = []
+        for request in requests:
+            body = json.dumps(request).encode()
+            messages.append(b"POST /structures HTTP/1.1\r\nHost: lewis3d\r\nContent-Type: application/json\r\n"
+                            b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+        try:
+            self.sock.sendall(b"".join(messages))
+            return [self._readResponse() for _ in messages]
+        except (OSError, ValueError):
+            self.close()  # the connection state is unknown after a failure
+            raise
+
+    def request(self, request):
+        return self.pipeline([request])[0]
+
+    def structure(self, formula, **options):
+        return self.request(dict(options, formula=formula))
+
+    def structures(self, formulas, **options):
+        return self.request(dict(options, formulas=list(formulas)))["results"]
+
+def addArguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", default=None, help="listen on this Unix socket instead of host:port")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="worker processes for large batches and images (0 = handle everything in the server process)")
+    parser.add_argument("--cache", default=os.environ.get("LEWIS3D_CACHE"),
+                        help="SQLite file keeping records across restarts and processes (default: $LEWIS3D_CACHE)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def run(args):
+    signal.signal(signal.SIGTERM, _interrupt)  # clean up the socket and pool on kill as on Ctrl-C
+    service = StructureService(args.processes, cachePath=args.cache)
+    server = makeServer(service, args.host, args.port, args.socket, args.verbose)
+    print(f"listening on {args.socket or f'http://{args.host}:{server.server_address[1]}'}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve structures over HTTP")
+    addArguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,205 @@
+from Compound import hillFormula
+from bondPerception import perceiveBonds
+from dataCollection import getElementTable
+from xyzReader import readFirstFrame
+
+from collections import Counter, namedtuple
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+
+# Reference structures (e.g. PubChem 3D SDFs from pubchemFetcher) in one SQLite file.
+# Coordinates and bond tables are stored as packed little-endian arrays and come back
+# as read-only NumPy views over the row's bytes, without parsing or copying.
+#
+# A structure is identified by its PubChem CID, or, without one (XYZ files, SDF records
+# whose title is not a CID), by its source file and its record index in that file. Adding
+# a structure that is already stored replaces it, so importing a file again is harmless.
+
+COORD_DTYPE = np.dtype("<f8")         # (n_atoms, 3) angstroms
+NUMBER_DTYPE = np.dtype("u1")         # (n_atoms,) atomic numbers
+BOND_DTYPE = np.dtype("<i4")          # (n_bonds, 3) rows of (atom a, atom b, order), 0-based
+
+StoredStructure = namedtuple("StoredStructure", ["id", "cid", "formula", "atomicNumbers", "coords", "bonds", "name", "source"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS structures (
+    id INTEGER PRIMARY KEY,
+    cid INTEGER UNIQUE,
+    formula TEXT NOT NULL,
+    name TEXT,
+    source TEXT,
+    n_atoms INTEGER NOT NULL,
+    atomic_numbers BLOB NOT NULL,
+    coords BLOB NOT NULL,
+    bonds BLOB NOT NULL,
+    frame INTEGER
+);
+CREATE INDEX IF NOT EXISTS structures_formula ON structures (formula);
+-- (source, frame) is the key of structures without a CID
+CREATE UNIQUE INDEX IF NOT EXISTS structures_source_frame ON structures (source, frame) WHERE cid IS NULL;
+"""
+
+INSERT = ("INSERT OR REPLACE INTO structures (cid, formula, name, source, n_atoms, atomic_numbers, coords, bonds, frame) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+COLUMNS = "id, cid, formula, atomic_numbers, coords, bonds, name, source"
+
+def readSDF(path):
+    # Yields (cid, name, symbols, coords, bonds, charge) for each V2000 record in an SDF file
+    with open(path, "r") as file:
+        lines = file.read().split("\n")
+
+    i = 0
+    while i + 3 < len(lines):
+        title = lines[i].strip()
+        counts = lines[i + 3]
+        if "V3000" in counts:
+            raise ValueError(f"V3000 records are not supported: {path}")
+
+        n_atoms, n_bonds = int(counts[0:3]), int(counts[3:6])
+        atomLines = lines[i + 4:i + 4 + n_atoms]
+        bondLines = lines[i + 4 + n_atoms:i + 4 + n_atoms + n_bonds]
+
+        coords = np.array([(float(l[0:10]), float(l[10:20]), float(l[20:30])) for l in atomLines], dtype=COORD_DTYPE).reshape(-1, 3)
+        symbols = [l[31:34].strip() for l in atomLines]
+        bonds = np.array([(int(l[0:3]) - 1, int(l[3:6]) - 1, int(l[6:9])) for l in bondLines], dtype=BOND_DTYPE).reshape(-1, 3)
+
+        # properties block, up to the $$$$ record separator
+        j = i + 4 + n_atoms + n_bonds
+        cid, charge = int(title) if title.isdigit() else None, 0
+        while j < len(lines) and lines[j].strip() != "$$$$":
+            line = lines[j]
+            if line.startswith("M  CHG"):
+                fields = line.split()[3:]
+                charge += sum(int(value) for value in fields[1::2])
+            elif line.startswith("> ") and "PUBCHEM_COMPOUND_CID" in line:
+                cid = int(lines[j + 1].strip())
+            j += 1
+
+        yield cid, title, symbols, coords, bonds, charge
+        i = j + 1
+
+def readXYZFile(path):
+    # First frame of an XYZ file as (symbols, coords)
+    frame = readFirstFrame(path)
+    return [str(symbol) for symbol in getElementTable().symbols[frame.numbers]], frame.coords
+
+class StructureStore:
+    def __init__(self, path="structures.db"):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM structures").fetchone()[0]
+
+    def __contains__(self, cid):
+        return self.connection.execute("SELECT 1 FROM structures WHERE cid = ?", (cid,)).fetchone() is not None
+
+    def _row(self, symbols, coords, bonds=None, cid=None, name=None, source=None, charge=0, frame=None):
+        table = getElementTable()
+        numbers = table.indices(symbols).astype(NUMBER_DTYPE)
+        coords = np.ascontiguousarray(coords, dtype=COORD_DTYPE).reshape(-1, 3)
+        bonds = np.ascontiguousarray(bonds if bonds is not None else np.empty((0, 3)), dtype=BOND_DTYPE).reshape(-1, 3)
+
+        if len(coords) != len(numbers):
+            raise ValueError(f"{len(symbols)} symbols but {len(coords)} coordinates")
+
+        formula = hillFormula(Counter(symbols), charge)
+        return (cid, formula, name, source, len(numbers), numbers.tobytes(), coords.tobytes(), bonds.tobytes(), frame)
+
+    def add(self, symbols, coords, bonds=None, cid=None, name=None, source=None, charge=0, frame=None):
+        # Inserts one structure and returns its row id. It replaces the stored structure with the
+        # same CID, or without a CID, the one with the same source and frame (both given).
+        with self.connection:
+            cursor = self.connection.execute(INSERT, self._row(symbols, coords, bonds, cid, name, source, charge, frame))
+        return cursor.lastrowid
+
+    def importFiles(self, paths):
+        # Bulk import of .sdf and .xyz files (directories are scanned) in one transaction; returns the count.
+        # XYZ files carry no connectivity, so their bonds are perceived from the coordinates.
+        # Sources are stored as absolute paths, so a file imported again replaces its own rows.
+        def rows():
+            for path in _expand(paths):
+                source = os.path.abspath(path)
+                if path.lower().endswith(".sdf"):
+                    for frame, (cid, name, symbols, coords, bonds, charge) in enumerate(readSDF(path)):
+                        yield self._row(symbols, coords, bonds, cid, name, source, charge, frame)
+                elif path.lower().endswith(".xyz"):
+                    symbols, coords = readXYZFile(path)
+                    yield self._row(symbols, coords, perceiveBonds(symbols, coords), None, os.path.splitext(os.path.basename(path))[0], source, 0, 0)
+
+        with self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(INSERT, rows())
+            return self.connection.total_changes - before
+
+    def _structure(self, row):
+        if row is None: return None
+        id, cid, formula, numbers, coords, bonds, name, source = row
+        return StoredStructure(
+            id, cid, formula,
+            np.frombuffer(numbers, dtype=NUMBER_DTYPE),
+            np.frombuffer(coords, dtype=COORD_DTYPE).reshape(-1, 3),
+            np.frombuffer(bonds, dtype=BOND_DTYPE).reshape(-1, 3),
+            name, source
+        )
+
+    def get(self, cid):
+        return self._structure(self.connection.execute(f"SELECT {COLUMNS} FROM structures WHERE cid = ?", (cid,)).fetchone())
+
+    def getById(self, id):
+        return self._structure(self.connection.execute(f"SELECT {COLUMNS} FROM structures WHERE id = ?", (id,)).fetchone())
+
+    def byFormula(self, formula):
+        # formula can be written in any order ("H3Ce", "CeH3"); it is matched by its Hill form
+        from Compound import Compound
+
+        canonical = Compound(formula).canonicalFormula()
+        rows = self.connection.execute(f"SELECT {COLUMNS} FROM structures WHERE formula = ? ORDER BY id", (canonical,))
+        return [self._structure(row) for row in rows]
+
+    def __iter__(self):
+        for row in self.connection.execute(f"SELECT {COLUMNS} FROM structures ORDER BY id"):
+            yield self._structure(row)
+
+def _expand(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                yield os.path.join(path, name)
+        else:
+            yield path
+
+def addArguments(parser):
+    parser.add_argument("database", help="SQLite structure store, created if missing")
+    parser.add_argument("paths", nargs="*", help=".sdf/.xyz files or directories to import")
+    parser.add_argument("--formula", action="append", default=[], help="print the stored structures for a formula")
+
+def run(args):
+    with StructureStore(args.database) as store:
+        if args.paths:
+            print(f"imported {store.importFiles(args.paths)} structures")
+
+        for formula in args.formula:
+            for structure in store.byFormula(formula):
+                print(f"{structure.formula}  cid={structure.cid}  atoms={len(structure.atomicNumbers)}  bonds={len(structure.bonds)}  {structure.source}")
+
+        print(f"{len(store)} structures in {args.database}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import and query reference structures")
+    addArguments(parser)
+    run(parser.parse_args())
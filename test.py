@@ -1,10 +1,8 @@
-import requests
-import re
-import os
-import Compound
+from Compound import Compound
+from pubchemFetcher import fetchFormulas
 
 def is_valid(compound: Compound):
-    central_atom = compound.find_central_atom()
+    central_atom = compound.getCentralAtom()
     if not central_atom:
         return False
     # Check the compound has more than one unique element (central + ligands)
@@ -13,39 +11,20 @@ def is_valid(compound: Compound):
 
     return compound.isCovalent()
 
-def get_cid(query):
-    url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{query}/cids/TXT"
-    r = requests.get(url)
-    if r.ok and r.text.strip().isdigit():
-        return r.text.strip()
-    return None
-
-def download_sdf(cid, name, out_dir="sdf_single_center"):
-    os.makedirs(out_dir, exist_ok=True)
-    url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/SDF?record_type=3d"
-    r = requests.get(url)
-    if r.ok:
-        filename = os.path.join(out_dir, f"{name}.sdf")
-        with open(filename, "wb") as f:
-            f.write(r.content)
-        print(f"[✓] Downloaded: {filename}")
-    else:
-        print(f"[!] Failed to download SDF for CID {cid}")
-
-def process_file(filename):
+def process_file(filename, **options):
+    # Downloads 3D SDFs for every single-center covalent formula in the file.
+    # See pubchemFetcher.PubChemFetcher for the options (base URL, rate limit, resume journal, ...).
     with open(filename, "r") as f:
         formulas = [line.strip() for line in f if line.strip()]
+
+    valid = []
     for formula in formulas:
-        cmpd = Compound(formula)
-        if is_valid(cmpd):
-            cid = get_cid(formula)
-            if cid:
-                safe_name = re.sub(r'[^\w\-]', '_', formula)
-                download_sdf(cid, safe_name)
-            else:
-                print(f"[!] CID not found for: {formula}")
+        if is_valid(Compound(formula)):
+            valid.append(formula)
         else:
             print(f"[x] Skipped (not single-center covalent): {formula}")
 
+    return fetchFormulas(valid, **options)
+
 # Example call:
-# process_file("your_compounds.txt")
\ No newline at end of file
+# process_file("your_compounds.txt")
@@ -1,17 +1,14 @@
-# from ase.io import read, write
-
-# cif_files = ["1008071.cif"]
-
-# for cif_file in cif_files:
-#     atoms = read(cif_file)
-
-#     xyz_file = cif_file.replace(".cif", ".xyz")
-
-#     write(xyz_file, atoms, format="xyz")
-
+# 1008071.xyz is the expanded unit cell of 1008071.cif: lewis3d cif 1008071.cif -o 1008071.xyz
 
 import matplotlib.pyplot as plt
+from matplotlib.lines import Line2D
 from mpl_toolkits.mplot3d import Axes3D
+import numpy as np
+
+from bondPerception import perceiveBonds
+from dataCollection import getElementTable
+from visualization import bondSegments, drawBonds
+from xyzReader import readFirstFrame
 
 # Atom color mapping (extend as needed)
 atom_colors = {
@@ -28,38 +25,39 @@ atom_colors = {
 }
 
 def read_xyz(filename):
-    atoms = []
-    with open(filename, 'r') as file:
-        lines = file.readlines()[2:]  # Skip first 2 lines
-        for line in lines:
-            parts = line.split()
-            if len(parts) >= 4:
-                symbol = parts[0]
-                x, y, z = map(float, parts[1:4])
-                atoms.append((symbol, x, y, z))
-    return atoms
+    # First frame as (symbol, x, y, z) tuples; see xyzReader for whole trajectories
+    frame = readFirstFrame(filename)
+    symbols = getElementTable().symbols[frame.numbers]
+    return [(str(symbol), x, y, z) for symbol, (x, y, z) in zip(symbols, frame.coords.tolist())]
 
 def plot_xyz(atoms):
     fig = plt.figure()
     ax = fig.add_subplot(111, projection='3d')
 
-    for atom in atoms:
-        symbol, x, y, z = atom
-        color = atom_colors.get(symbol, 'gray')
-        ax.scatter(x, y, z, color=color, s=200, edgecolors='k', label=symbol)
+    symbols = [atom[0] for atom in atoms]
+    coords = np.array([atom[1:] for atom in atoms], dtype=float).reshape(-1, 3)
+
+    # every bond line in one collection, every atom in one scatter call
+    bonds = perceiveBonds(symbols, coords)
+    segments, widths = bondSegments(coords[bonds[:, 0]], coords[bonds[:, 1]], bonds[:, 2])
+    drawBonds(ax, segments, widths)
+
+    colors = [atom_colors.get(symbol, 'gray') for symbol in symbols]
+    ax.scatter(coords[:, 0], coords[:, 1], coords[:, 2], c=colors, s=200, edgecolors='k')
 
     ax.set_xlabel('X (Å)')
     ax.set_ylabel('Y (Å)')
     ax.set_zlabel('Z (Å)')
     ax.set_title('Molecule from .xyz file')
 
-    # Avoid duplicate labels in legend
-    handles, labels = plt.gca().get_legend_handles_labels()
-    by_label = dict(zip(labels, handles))
-    ax.legend(by_label.values(), by_label.keys())
+    # One legend entry per element
+    handles = [Line2D([], [], linestyle='', marker='o', markersize=10, markerfacecolor=atom_colors.get(symbol, 'gray'), markeredgecolor='k', label=symbol)
+               for symbol in dict.fromkeys(symbols)]
+    ax.legend(handles=handles)
 
     plt.show()
 
 # === Usage ===
-atoms = read_xyz('1008071.xyz')  # replace with your actual file
-plot_xyz(atoms)
+if __name__ == "__main__":
+    atoms = read_xyz('1008071.xyz')  # replace with your actual file
+    plot_xyz(atoms)
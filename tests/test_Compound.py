@@ -0,0 +1,50 @@
+from Compound import parseFormula
+
+import pytest
+
+# Known answers for parseFormula. BASELINE holds what the old recursive parser
+# (Compound.parseElements before the single-pass tokenizer) returned, with its charge written
+# as the "e-" entry; the tokenizer must agree on all of them. EXTENDED covers formulas the old
+# parser got wrong or crashed on: nested groups, brackets, hydrates and grouped charges.
+
+BASELINE = [
+    ("H2O", {"H": 2, "O": 1}),
+    ("CH4", {"C": 1, "H": 4}),
+    ("XeF4", {"Xe": 1, "F": 4}),
+    ("Ca(OH)2", {"Ca": 1, "O": 2, "H": 2}),
+    ("Mg(OH)2", {"Mg": 1, "O": 2, "H": 2}),
+    ("Ca3(PO4)2", {"Ca": 3, "P": 2, "O": 8}),
+    ("Al2(SO4)3", {"Al": 2, "S": 3, "O": 12}),
+    ("(CH3)2", {"C": 2, "H": 6}),
+    ("C(CH3)4", {"C": 5, "H": 12}),
+    ("H2O_", {"H": 2, "O": 1}),
+    ("NH4+", {"N": 1, "H": 4, "e-": -1}),
+    ("NO3-", {"N": 1, "O": 3, "e-": 1}),
+    ("Cl-", {"Cl": 1, "e-": 1}),
+    ("Fe+3", {"Fe": 1, "e-": -3}),
+    ("SO4-2", {"S": 1, "O": 4, "e-": 2}),
+    ("PO4-3", {"P": 1, "O": 4, "e-": 3}),
+]
+
+EXTENDED = [
+    ("(NH4)2SO4", {"N": 2, "H": 8, "S": 1, "O": 4}),
+    ("((CH3)3C)2O", {"C": 8, "H": 18, "O": 1}),
+    ("K4[Fe(CN)6]", {"K": 4, "Fe": 1, "C": 6, "N": 6}),
+    ("Cu(NH3)4+2", {"Cu": 1, "N": 4, "H": 12, "e-": -2}),
+    ("CuSO4·5H2O", {"Cu": 1, "S": 1, "O": 9, "H": 10}),
+    ("CuSO4.5H2O", {"Cu": 1, "S": 1, "O": 9, "H": 10}),
+    ("Na2CO3·10H2O", {"Na": 2, "C": 1, "O": 13, "H": 20}),
+]
+
+MALFORMED = ["H2(O", "H2O)", "(NH4]2", "Fe[(CN)6", "H2O!", "h2o"]
+
+@pytest.mark.parametrize("formula, expected", BASELINE + EXTENDED)
+def test_knownAnswers(formula, expected):
+    counts = parseFormula(formula)
+    assert counts == expected
+    assert list(counts) == list(expected)  # elements keep their order of first appearance
+
+@pytest.mark.parametrize("formula", MALFORMED)
+def test_malformed(formula):
+    with pytest.raises(ValueError):
+        parseFormula(formula)
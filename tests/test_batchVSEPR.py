@@ -0,0 +1,60 @@
+from SimpleCompound import SimpleCompound
+from batchVSEPR import generateVSEPRBatch
+from geometryTable import MAX_STERIC_NUMBER
+
+import numpy as np
+import pytest
+
+# generateVSEPRBatch must give every molecule of a mixed batch the same geometry as the
+# single-molecule pipeline, in the padded slot layout (lone pairs first, then bonds).
+
+FORMULAS = ["H2O", "(NH4)2SO4", "CH4", "XeF4", "F4OXe", "SO4-2", "IF7", "BF3", "Xe", "NO3-", "ClF3", "CO2"]
+
+@pytest.fixture(scope="module")
+def batch():
+    return generateVSEPRBatch(FORMULAS)
+
+def test_shapes(batch):
+    n, D = len(FORMULAS), MAX_STERIC_NUMBER
+    assert batch["directions"].shape == (n, D, 3)
+    for key in ("domainMask", "lonePairMask", "bondOrders", "averageBondOrders", "bondLengths", "bondAtoms"):
+        assert batch[key].shape == (n, D)
+
+def test_rejectedFormulas(batch):
+    for i, formula in enumerate(FORMULAS):
+        try:
+            SimpleCompound(formula).vseprSnapshot()
+        except Exception:
+            assert not batch["valid"][i]
+            assert batch["errors"][i]
+            assert not batch["domainMask"][i].any()
+            assert not batch["directions"][i].any()
+            assert batch["stericNumbers"][i] == 0
+            continue
+        assert batch["valid"][i] and batch["errors"][i] is None
+    assert not batch["valid"][FORMULAS.index("(NH4)2SO4")]
+
+@pytest.mark.parametrize("index", range(len(FORMULAS)))
+def test_matchesSnapshot(batch, index):
+    if not batch["valid"][index]:
+        pytest.skip(f"{FORMULAS[index]} is rejected")
+    snapshot = SimpleCompound(FORMULAS[index]).vseprSnapshot()
+    c, steric = snapshot["central"], snapshot["stericNumber"]
+    lp = snapshot["lonePairs"][c]
+    bonds = slice(lp, steric)
+
+    assert batch["stericNumbers"][index] == steric
+    assert batch["lonePairs"][index] == lp
+    assert batch["lonePairMask"][index].tolist() == [k < lp for k in range(MAX_STERIC_NUMBER)]
+    assert batch["domainMask"][index].tolist() == [k < steric for k in range(MAX_STERIC_NUMBER)]
+    assert batch["bondOrders"][index, bonds].tolist() == [order for _, _, order in snapshot["bonds"]]
+    assert batch["averageBondOrders"][index, bonds] == pytest.approx(snapshot["averageBondOrders"])
+    assert batch["bondAtoms"][index, bonds].tolist() == [b if a == c else a for a, b, _ in snapshot["bonds"]]
+    assert np.allclose(batch["directions"][index, :lp], snapshot["lonePairDirections"])
+    assert np.allclose(batch["directions"][index, bonds], snapshot["bondDirections"])
+    assert batch["bondLengths"][index, bonds] == pytest.approx(snapshot["bondLengths"])
+
+    # padding stays zero
+    assert not batch["directions"][index, steric:].any()
+    assert not batch["bondLengths"][index, steric:].any()
+    assert not batch["bondLengths"][index, :lp].any()
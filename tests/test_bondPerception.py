@@ -0,0 +1,17 @@
+from bondPerception import perceiveBonds
+
+import numpy as np
+
+# Acrylonitrile, H2C=CH-C#N, drawn planar with experimental bond lengths: perception must
+# find every bond once and tell the single, double and triple bonds apart.
+
+SYMBOLS = ["C", "C", "C", "N", "H", "H", "H"]
+COORDS = [
+    [0.000, 0.000, 0.0], [1.339, 0.000, 0.0], [2.052, -1.235, 0.0], [2.630, -2.237, 0.0],
+    [-0.540, 0.935, 0.0], [-0.540, -0.935, 0.0], [1.879, 0.935, 0.0],
+]
+
+def test_acrylonitrile():
+    bonds = perceiveBonds(SYMBOLS, np.array(COORDS))
+    assert bonds.tolist() == [[0, 1, 2], [0, 4, 1], [0, 5, 1], [1, 2, 1], [1, 6, 1], [2, 3, 3]]
+    assert perceiveBonds(SYMBOLS, np.array(COORDS), orders=False)[:, 2].tolist() == [1] * 6
@@ -0,0 +1,102 @@
+from SimpleCompound import SimpleCompound, structureRecord
+from batchVSEPR import generateVSEPRBatch
+from bondPredictor import BondPredictor, getPredictor, storeTrainingData, train
+from geometryEvaluation import METRICS, evaluateStore
+from structureStore import StructureStore
+
+import numpy as np
+import os
+import pytest
+
+# A predictor trained on a dozen gas-phase structures (experimental bond lengths and angles)
+# must survive save/load, give the same geometry through both engines, and fit that data at
+# least as well as the VSEPR rules it corrects.
+
+REFERENCES = [  # central, terminal, count, length (A), angle (degrees, None for tetrahedral)
+    ("O", "H", 2, 0.958, 104.5), ("S", "H", 2, 1.336, 92.1), ("O", "F", 2, 1.405, 103.1),
+    ("N", "H", 3, 1.012, 106.7), ("P", "H", 3, 1.420, 93.3), ("N", "F", 3, 1.365, 102.4),
+    ("P", "Cl", 3, 2.043, 100.3), ("B", "F", 3, 1.313, 120.0),
+    ("C", "H", 4, 1.087, None), ("Si", "H", 4, 1.480, None), ("C", "F", 4, 1.319, None), ("C", "Cl", 4, 1.767, None),
+]
+
+FORMULAS = ["H2O", "H2S", "OF2", "NH3", "PH3", "NF3", "PCl3", "BF3", "CH4", "SiH4", "CF4", "CCl4", "XeF4", "NO3-"]
+
+def referenceCoords(count, length, angle):
+    # Central atom at the origin, then `count` terminals with equal bond lengths and angles
+    if angle is None:
+        vectors = np.array([[1, 1, 1], [1, -1, -1], [-1, 1, -1], [-1, -1, 1]]) / np.sqrt(3)
+    elif count == 2:
+        half = np.radians(angle) / 2
+        vectors = np.array([[np.sin(half), 0, np.cos(half)], [-np.sin(half), 0, np.cos(half)]])
+    else:
+        s = np.sqrt(2 * (1 - np.cos(np.radians(angle))) / 3)  # sine of the angle to the threefold axis
+        phi = 2 * np.pi * np.arange(3) / 3
+        vectors = np.stack([s * np.cos(phi), s * np.sin(phi), np.full(3, np.sqrt(1 - s * s))], axis=1)
+    return np.vstack([np.zeros(3), length * vectors])
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("store") / "structures.db")
+    with StructureStore(path) as store:
+        for central, terminal, count, length, angle in REFERENCES:
+            store.add([central] + [terminal] * count, referenceCoords(count, length, angle))
+    return path
+
+@pytest.fixture(scope="module")
+def modelFile(database, tmp_path_factory):
+    predictor, report = train(storeTrainingData(database), validation=0)
+    assert report["molecules"] == len(REFERENCES)
+    path = str(tmp_path_factory.mktemp("model") / "bondModel.npz")
+    predictor.save(path)
+    return path
+
+@pytest.fixture
+def learned(modelFile, monkeypatch):
+    monkeypatch.setenv("LEWIS3D_MODEL", modelFile)
+    return getPredictor()
+
+def test_saveLoadRoundTrip(learned, modelFile):
+    loaded = BondPredictor.load(modelFile)
+    for saved, restored in ((learned.lengthModel, loaded.lengthModel), (learned.angleModel, loaded.angleModel)):
+        for name in saved._fields:
+            assert np.array_equal(getattr(saved, name), getattr(restored, name))
+
+    batch = generateVSEPRBatch(FORMULAS)
+    for a, b in zip(learned.predict(batch), loaded.predict(batch)):
+        assert np.array_equal(a, b)
+
+def test_enginesAgree(learned):
+    batch = generateVSEPRBatch(FORMULAS, "learned")
+    rules = generateVSEPRBatch(FORMULAS)
+    assert not np.allclose(batch["bondLengths"], rules["bondLengths"])
+
+    for index, formula in enumerate(FORMULAS):
+        snapshot = SimpleCompound(formula).vseprSnapshot("learned")
+        lp = snapshot["lonePairs"][snapshot["central"]]
+        bonds = slice(lp, snapshot["stericNumber"])
+        assert np.allclose(batch["directions"][index, bonds], snapshot["bondDirections"])
+        assert batch["bondLengths"][index, bonds] == pytest.approx(snapshot["bondLengths"])
+        assert structureRecord(formula, "learned")["bondLengths"] == pytest.approx(snapshot["bondLengths"])
+
+def test_noWorseThanRules(learned, database):
+    with StructureStore(database) as store:
+        rules = evaluateStore(store)
+        model = evaluateStore(store, geometry="learned")
+    assert rules["valid"].all() and model["valid"].all()
+    for name in METRICS:
+        assert np.mean(model[name]) <= np.mean(rules[name])
+
+def test_retrainedModelIsReloaded(database, tmp_path, monkeypatch):
+    path = str(tmp_path / "bondModel.npz")
+    monkeypatch.setenv("LEWIS3D_MODEL", path)
+    data = storeTrainingData(database)
+    train(data, validation=0)[0].save(path)
+    first = getPredictor()
+    assert getPredictor() is first
+
+    train(data, alpha=100.0, validation=0)[0].save(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))  # coarse clocks may not move between saves
+    second = getPredictor()
+    assert second is not first
+    assert not np.array_equal(second.lengthModel.weights, first.lengthModel.weights)
@@ -0,0 +1,38 @@
+from cifReader import readCrystal, cartesian, crystalFormula
+from xyzReader import readFirstFrame
+
+import os
+
+import numpy as np
+import pytest
+
+# Symmetry expansion of the bundled CIF files against their expanded unit cells (the .xyz files).
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.mark.parametrize("name, keepDummies, atoms", [
+    ("1000118", True, 40),
+    ("1008071", False, 20),
+])
+def test_expansionMatchesReference(name, keepDummies, atoms):
+    crystal = readCrystal(os.path.join(ROOT, f"{name}.cif"), keepDummies=keepDummies)
+    reference = readFirstFrame(os.path.join(ROOT, f"{name}.xyz"))
+    assert len(crystal.numbers) == len(reference.numbers) == atoms
+    assert sorted(crystal.numbers.tolist()) == sorted(reference.numbers.tolist())
+
+    # every reference atom sits on one expanded site of the same element, up to a lattice vector
+    fractional = reference.coords @ np.linalg.inv(crystal.lattice)
+    delta = fractional[:, None] - crystal.fractional[None]
+    delta -= np.rint(delta)
+    distance = np.linalg.norm(delta @ crystal.lattice, axis=-1)
+    distance = np.where(reference.numbers[:, None] == crystal.numbers[None], distance, np.inf)
+    assert distance.min(axis=1).max() < 1e-3
+    assert len(set(distance.argmin(axis=1).tolist())) == atoms
+
+def test_cartesianAndSupercell():
+    crystal = readCrystal(os.path.join(ROOT, "1008071.cif"))
+    big = readCrystal(os.path.join(ROOT, "1008071.cif"), repeats=(2, 1, 3))
+    assert len(big.numbers) == 6 * len(crystal.numbers)
+    assert np.allclose(big.lattice, crystal.lattice * np.array([2, 1, 3])[:, None])
+    assert (crystalFormula(crystal), crystalFormula(big)) == ("I16U4", "I96U24")
+    assert np.allclose(cartesian(crystal), crystal.fractional @ crystal.lattice)
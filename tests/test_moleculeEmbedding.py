@@ -0,0 +1,50 @@
+from moleculeEmbedding import embedMolecule
+
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+# Embedded geometries of small molecules from their connectivity alone.
+
+def angle(coords, a, center, b):
+    u, v = coords[a] - coords[center], coords[b] - coords[center]
+    return np.degrees(np.arccos(np.clip(u @ v / np.linalg.norm(u) / np.linalg.norm(v), -1, 1)))
+
+def dihedral(coords, a, b, c, d):
+    b0, b1, b2 = coords[a] - coords[b], coords[c] - coords[b], coords[d] - coords[c]
+    b1 = b1 / np.linalg.norm(b1)
+    v, w = b0 - (b0 @ b1) * b1, b2 - (b2 @ b1) * b1
+    return np.degrees(np.arctan2(np.cross(b1, v) @ w, v @ w))
+
+def tetrahedral(coords, bonds):
+    neighbors = {}
+    for a, b, _ in bonds:
+        neighbors.setdefault(a, []).append(b)
+        neighbors.setdefault(b, []).append(a)
+    return [angle(coords, i, center, j) for center, others in neighbors.items() if len(others) == 4
+            for i, j in combinations(others, 2)]
+
+def test_ethane():
+    symbols = ["C", "C"] + ["H"] * 6
+    bonds = [(0, 1, 1), (0, 2, 1), (0, 3, 1), (0, 4, 1), (1, 5, 1), (1, 6, 1), (1, 7, 1)]
+    embedding = embedMolecule(symbols, bonds)
+    coords = embedding.coords
+    assert embedding.rmsBondError < 1e-3
+    assert tetrahedral(coords, bonds) == pytest.approx([109.47] * 12, abs=0.5)
+    # staggered: every H-C-C-H dihedral is 60 or 180 degrees
+    for h in (2, 3, 4):
+        for k in (5, 6, 7):
+            assert min(abs(abs(dihedral(coords, h, 0, 1, k)) - target) for target in (60, 180)) < 1.0
+
+def test_cyclohexaneChair():
+    symbols = ["C"] * 6 + ["H"] * 12
+    bonds = [(i, (i + 1) % 6, 1) for i in range(6)] + [(i, 6 + 2 * i + k, 1) for i in range(6) for k in range(2)]
+    embedding = embedMolecule(symbols, bonds)
+    coords = embedding.coords
+    assert embedding.rmsBondError < 1e-3
+    assert tetrahedral(coords, bonds) == pytest.approx([109.47] * 36, abs=1.5)
+    # chair: ring dihedrals alternate in sign at about 55-60 degrees
+    ring = [dihedral(coords, i, (i + 1) % 6, (i + 2) % 6, (i + 3) % 6) for i in range(6)]
+    assert all(50 < abs(value) < 65 for value in ring)
+    assert all(ring[i] * ring[(i + 1) % 6] < 0 for i in range(6))
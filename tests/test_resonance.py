@@ -0,0 +1,38 @@
+from SimpleCompound import SimpleCompound, structureRecord
+
+import pytest
+
+# Known resonance sets: octet first, then the lowest formal charges, with incomplete octets
+# kept by electron-deficient centers.
+
+@pytest.mark.parametrize("formula", ["BF3", "BCl3", "AlCl3", "BeCl2"])
+def test_electronDeficientCenters(formula):
+    record = structureRecord(formula)
+    assert record["resonanceCount"] == 1
+    assert all(order == 1 for _, _, order in record["bonds"])
+    assert not any(record["formalCharges"])
+
+def test_sulfate():
+    # two S=O and two S-O-, six arrangements, four equal bonds of order 1.5
+    record = structureRecord("SO4-2")
+    assert record["resonanceCount"] == 6
+    assert record["averageBondOrders"] == [1.5] * 4
+    assert sorted(record["formalCharges"]) == [-1, -1, 0, 0, 0]
+    assert sorted(order for _, _, order in record["bonds"]) == [1, 1, 2, 2]
+    assert len(set(record["bondLengths"])) == 1
+
+def test_sulfateForms():
+    forms = SimpleCompound("SO4-2").resonanceStructures()
+    assert len(forms) == 6
+    assert len({tuple(order for _, _, order in form["bonds"]) for form in forms}) == 6
+    assert all(sum(form["formalCharges"]) == -2 for form in forms)
+
+@pytest.mark.parametrize("formula, charges", [
+    ("NO3-", [1, 0, -1, -1]),
+    ("CO3-2", [0, 0, -1, -1]),
+])
+def test_trigonalAnions(formula, charges):
+    record = structureRecord(formula)
+    assert record["resonanceCount"] == 3
+    assert record["formalCharges"] == charges
+    assert record["averageBondOrders"] == pytest.approx([4 / 3] * 3)
@@ -0,0 +1,43 @@
+from SimpleCompound import structureRecord
+from dataCollection import getElementTable
+from lewis3d import main
+from resultColumns import ResultColumns
+
+import numpy as np
+import pytest
+
+# `lewis3d export` followed by ResultColumns must give back every field of structureRecord,
+# and mark the formulas structureRecord rejects as errors.
+
+FORMULAS = ["H2O", "SO4-2", "(NH4)2SO4", "XeF4", "NO3-", "IF7", "Xe", "CO2"]
+
+def test_exportRoundTrip(tmp_path):
+    source, output = tmp_path / "formulas.txt", tmp_path / "results"
+    source.write_text("\n".join(FORMULAS) + "\n")
+    main(["export", str(source), str(output), "--chunksize", "3"])
+    results = ResultColumns(str(output))
+    assert len(results) == len(FORMULAS)
+
+    symbols = getElementTable().symbols
+    for i, (formula, columns) in enumerate(zip(FORMULAS, results)):
+        record = structureRecord(formula)
+        assert columns.formula == formula
+        assert bool(results.valid[i]) == ("error" not in record)
+        if "error" in record:
+            assert columns.error
+            assert len(columns.atomicNumbers) == len(columns.bondLengths) == len(columns.bondAngles) == 0
+            continue
+
+        c = record["central"]
+        assert columns.error is None
+        assert (columns.central, columns.stericNumber, columns.resonanceCount) == (c, record["stericNumber"], record["resonanceCount"])
+        assert [str(symbols[z]) for z in columns.atomicNumbers] == record["atoms"]
+        assert columns.atomLonePairs.tolist() == record["lonePairs"]
+        assert columns.formalCharges.tolist() == record["formalCharges"]
+        assert columns.bondAtoms.tolist() == [[c, b if a == c else a] for a, b, _ in record["bonds"]]
+        assert columns.bondOrders.tolist() == [order for _, _, order in record["bonds"]]
+        assert columns.averageBondOrders.tolist() == pytest.approx(record["averageBondOrders"])
+        assert np.allclose(columns.bondDirections, np.reshape(record["bondDirections"], (-1, 3)))
+        assert columns.bondLengths.tolist() == pytest.approx(record["bondLengths"])
+        assert np.allclose(columns.lonePairDirections, np.reshape(record["lonePairDirections"], (-1, 3)))
+        assert columns.bondAngles.tolist() == pytest.approx([angle for *_, angle in record["bondAngles"]])
@@ -0,0 +1,44 @@
+from SimpleCompound import structureRecord
+from structureCache import StructureCache, canonicalKey
+
+import pytest
+
+# Spellings of one formula share a cache entry, and each gets the record it would get on its own.
+
+ALIASES = [
+    ("XeOF4", "F4OXe", "OXeF4"),
+    ("H2O", "OH2"),
+    ("NO3-", "O3N-"),
+    ("SOF4", "F4SO"),
+    ("CHBrClF", "FClBrCH", "BrCHFCl"),
+    ("POCl3", "Cl3PO"),
+    ("CH2O", "OCH2"),
+    ("SO4-2", "O4S-2"),
+]
+
+@pytest.mark.parametrize("formulas", ALIASES)
+def test_aliasMatchesDirectCall(formulas):
+    cache = StructureCache()
+    records = cache.records(list(formulas))
+    assert len({canonicalKey(formula) for formula in formulas}) == 1
+    assert cache.misses == 1
+    for formula, record in zip(formulas, records):
+        assert record == structureRecord(formula)
+
+def test_aliasWithoutAngles():
+    cache = StructureCache()
+    cache.record("XeOF4")
+    record = cache.record("F4OXe", angles=False)
+    assert record == structureRecord("F4OXe", angles=False)
+
+def test_errorRecordsKeepTheirFormula():
+    cache = StructureCache()
+    record = cache.record("(NH4)2SO4")
+    assert record["formula"] == "(NH4)2SO4" and "error" in record
+
+def test_diskTier(tmp_path):
+    path = str(tmp_path / "structures.cache")
+    StructureCache(path=path).records(["XeOF4"])
+    cache = StructureCache(path=path)
+    assert cache.record("F4OXe") == structureRecord("F4OXe")
+    assert cache.diskHits == 1 and cache.misses == 0
@@ -0,0 +1,33 @@
+from structureStore import StructureStore
+
+import os
+import shutil
+
+# Importing the same files again replaces their structures instead of adding copies.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+WATER = """{title}
+  test
+
+  3  2  0  0  0  0  0  0  0  0999 V2000
+    0.0000    0.0000    0.0000 O   0  0  0  0  0  0  0  0  0  0  0  0
+    0.9570    0.0000    0.0000 H   0  0  0  0  0  0  0  0  0  0  0  0
+   -0.2400    0.9270    0.0000 H   0  0  0  0  0  0  0  0  0  0  0  0
+  1  2  1  0  0  0  0
+  1  3  1  0  0  0  0
+M  END
+$$$$
+"""
+
+def test_reimportKeepsOneCopy(tmp_path):
+    shutil.copy(os.path.join(ROOT, "1008071.xyz"), tmp_path)
+    (tmp_path / "water.sdf").write_text(WATER.format(title="water") + WATER.format(title="962") + WATER.format(title="ice"))
+    with StructureStore(str(tmp_path / "structures.db")) as store:
+        assert store.importFiles([str(tmp_path)]) == 4
+        store.importFiles([str(tmp_path)])
+        store.importFiles([str(tmp_path / "water.sdf")])
+        assert len(store) == 4
+        assert 962 in store
+        assert [structure.name for structure in store.byFormula("H2O")] == ["water", "962", "ice"]
@@ -0,0 +1,69 @@
+from SimpleCompound import structureRecord
+from geometryTable import relaxedDomains
+
+import numpy as np
+import pytest
+
+# Known-answer checks for the VSEPR domain model: lone pairs must close the angles between
+# bonds below their ideal polyhedron values, towards the experimental ones.
+
+def bondAngles(formula):
+    record = structureRecord(formula)
+    assert "error" not in record, record.get("error")
+    return sorted(angle for _, _, _, angle in record["bondAngles"])
+
+@pytest.mark.parametrize("formula", ["SF4", "TeCl4"])
+def test_seeSaw(formula):
+    # experiment: SF4 101.6 equatorial, 173.1 axial
+    angles = bondAngles(formula)
+    assert 105 < angles[4] < 118
+    assert 170 < angles[5] < 178
+
+def test_tShape():
+    # ClF3: 87.5
+    angles = bondAngles("ClF3")
+    assert 85 < angles[0] < 89.5
+    assert angles[-1] < 179
+
+@pytest.mark.parametrize("formula, low, high", [
+    ("H2O", 102, 106),     # 104.5
+    ("NH3", 104, 108),     # 107.0
+    ("SO2", 114, 120),     # 119.3
+])
+def test_bentAndPyramidal(formula, low, high):
+    angles = bondAngles(formula)
+    assert low < angles[0] and angles[-1] < high
+
+def test_squarePyramidal():
+    # BrF5: 84.8 between the apical and basal bonds
+    angles = bondAngles("BrF5")
+    assert 85 < angles[0] < 89.5
+
+@pytest.mark.parametrize("formula, expected", [
+    ("CH4", [109.47] * 6),
+    ("XeF2", [180.0]),
+    ("XeF4", [90.0] * 4 + [180.0] * 2),
+    ("PCl5", [90.0] * 6 + [120.0] * 3 + [180.0]),
+    ("SF6", [90.0] * 12 + [180.0] * 3),
+])
+def test_idealShapes(formula, expected):
+    assert bondAngles(formula) == pytest.approx(expected, abs=0.1)
+
+@pytest.mark.parametrize("formulas", [("XeOF4", "F4OXe"), ("SOF4", "F4OS")])
+def test_bondOrderSpelling(formulas):
+    # the geometry must not depend on where the multiple bond is written
+    assert bondAngles(formulas[0]) == pytest.approx(bondAngles(formulas[1]), abs=1e-6)
+
+def test_multipleBondSites():
+    # Xe=O opposite the lone pair, S=O equatorial, whichever slot the double bond is given
+    for position in range(5):
+        orders = [1.0] * 5
+        orders[position] = 2.0
+        directions = relaxedDomains(6, 1, orders)
+        assert directions[0] @ directions[1 + position] == pytest.approx(-1.0, abs=1e-6)
+    for position in range(5):
+        orders = [1.0] * 5
+        orders[position] = 2.0
+        directions = relaxedDomains(5, 0, orders)
+        # an axial S=O would have a bond opposite it
+        assert min(np.delete(directions, position, axis=0) @ directions[position]) > -0.9
@@ -0,0 +1,46 @@
+from xyzReader import INDEX_SUFFIX, XYZTrajectory, readFrames
+
+import numpy as np
+import os
+
+# A two-frame water trajectory read both ways; the saved index holds the file's size and
+# mtime followed by the frame offsets, and is reused on the next open.
+
+TRAJECTORY = """3
+frame 0
+O 0.000 0.000 0.000
+H 0.957 0.000 0.000
+H -0.240 0.927 0.000
+3
+frame 1 energy=-76.4
+O 0.010 0.000 0.000
+H 0.960 0.010 0.000
+H -0.250 0.930 0.020
+"""
+
+FRAMES = [
+    [[0.000, 0.000, 0.000], [0.957, 0.000, 0.000], [-0.240, 0.927, 0.000]],
+    [[0.010, 0.000, 0.000], [0.960, 0.010, 0.000], [-0.250, 0.930, 0.020]],
+]
+
+def test_twoFrames(tmp_path):
+    path = str(tmp_path / "water.xyz")
+    with open(path, "w") as file:
+        file.write(TRAJECTORY)
+
+    streamed = list(readFrames(path))
+    with XYZTrajectory(path, saveIndex=True) as trajectory:
+        assert len(trajectory) == 2
+        frames = list(trajectory)
+    for frame, other, coords, comment in zip(frames, streamed, FRAMES, ["frame 0", "frame 1 energy=-76.4"]):
+        assert frame.numbers.tolist() == other.numbers.tolist() == [8, 1, 1]
+        assert np.allclose(frame.coords, coords) and np.allclose(other.coords, coords)
+        assert frame.comment == other.comment == comment
+
+    stat = os.stat(path)
+    index = np.load(path + INDEX_SUFFIX)
+    assert index.tolist() == [stat.st_size, stat.st_mtime_ns, 0, TRAJECTORY.index("3\nframe 1"), len(TRAJECTORY)]
+
+    with XYZTrajectory(path, saveIndex=True) as trajectory:
+        assert isinstance(trajectory.offsets, np.memmap)  # loaded from the index, not rebuilt
+        assert np.allclose(trajectory[-1].coords, FRAMES[1])
@@ -0,0 +1,199 @@
+# Plotting backend. Nothing in the core modules imports this file at module level,
+# so matplotlib is only loaded when a molecule is actually drawn.
+#
+# Each molecule is drawn with one Line3DCollection for all bond lines and one scatter call
+# for all atoms. renderMolecule/exportImages draw onto plain Agg figures, without pyplot
+# or a window, so they work headless and in worker processes.
+from dataCollection import getElementTable, element_color_map
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import argparse
+import os
+import re
+
+import numpy as np
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+BOND_SPACING = 0.05   # angstroms between the parallel lines of a multiple bond
+BOND_COLOR = "gray"
+ATOM_SCALE = 500      # marker size per angstrom of atomic radius
+
+def get_perpendicular_vector(v):
+    # Return a normalized vector perpendicular to v
+    return perpendicularVectors(np.asarray(v, dtype=float)[None])[0]
+
+def perpendicularVectors(directions):
+    # (n, 3) unit vectors perpendicular to each row of directions
+    other = np.where(np.isclose(np.abs(directions[:, 2:3]), 1), [1.0, 0.0, 0.0], [0.0, 0.0, 1.0])
+    perp = np.cross(directions, other)
+    return perp / np.linalg.norm(perp, axis=1, keepdims=True)
+
+def bondSegments(starts, ends, orders):
+    # Line segments (k, 2, 3) and line widths (k,) for bonds drawn as 1-3 parallel lines
+    starts, ends = np.asarray(starts, dtype=float).reshape(-1, 3), np.asarray(ends, dtype=float).reshape(-1, 3)
+    orders = np.asarray(orders, dtype=np.int64).reshape(-1)
+    if not len(orders):
+        return np.empty((0, 2, 3)), np.empty(0)
+
+    direction = ends - starts
+    perp = perpendicularVectors(direction / np.maximum(np.linalg.norm(direction, axis=1, keepdims=True), 1e-12))
+
+    # line k of a bond of order n sits at -spacing + 2 * spacing * k / (n - 1), i.e. np.linspace(-s, s, n)
+    bond = np.repeat(np.arange(len(orders)), orders)
+    k = np.arange(len(bond)) - np.repeat(np.cumsum(orders) - orders, orders)
+    shift = np.where(orders[bond] > 1, BOND_SPACING * (2 * k / np.maximum(orders[bond] - 1, 1) - 1), 0.0)
+
+    offset = shift[:, None] * perp[bond]
+    segments = np.stack((starts[bond] + offset, ends[bond] + offset), axis=1)
+    widths = np.where(orders[bond] > 1, 1.0, 1.5)
+    return segments, widths
+
+def moleculeGeometry(LewisStructure):
+    # Atom positions (n_atoms, 3) with the central atom at the origin, and a mask of the atoms
+    # that were placed (every atom bonded to the central atom, plus the central atom itself)
+    atoms = LewisStructure["atoms"]
+    central = LewisStructure["central"]
+
+    positions = np.zeros((len(atoms), 3))
+    placed = np.zeros(len(atoms), dtype=bool)
+    placed[central] = True
+
+    for (a, b, order), direction, length in zip(LewisStructure["bonds"], LewisStructure["bondDirections"], LewisStructure["bondLengths"]):
+        if a == central:
+            positions[b], placed[b] = direction * length, True
+        elif b == central:
+            positions[a], placed[a] = -direction * length, True
+
+    return positions, placed
+
+def drawAtoms(ax, symbols, positions, labels=True):
+    # One scatter call for every atom, colored and sized per element
+    table = getElementTable()
+    colors = [element_color_map.get(symbol, element_color_map["default"]) for symbol in symbols]
+    sizes = [(table.radius[table.index[symbol]] if symbol in table else 0.5) * ATOM_SCALE for symbol in symbols]  # fallback = 0.5 A
+
+    ax.scatter(positions[:, 0], positions[:, 1], positions[:, 2], s=sizes, c=colors, alpha=1, depthshade=False)
+    if labels:
+        for (x, y, z), symbol in zip(positions, symbols):
+            ax.text(x, y, z, symbol, fontsize=10, ha='center', color='black')
+
+def drawBonds(ax, segments, widths):
+    if len(segments):
+        ax.add_collection3d(Line3DCollection(segments, colors=BOND_COLOR, linewidths=widths))
+
+def drawMoleculeOn(ax, LewisStructure):
+    # Draws a SimpleCompound.vseprSnapshot() with the central atom at the origin onto a 3D axes
+    positions, placed = moleculeGeometry(LewisStructure)
+    central = LewisStructure["central"]
+
+    bonded = [(a, b, order) for a, b, order in LewisStructure["bonds"] if central in (a, b)]
+    ends = [positions[b if a == central else a] for a, b, _ in bonded]
+    segments, widths = bondSegments(np.zeros((len(bonded), 3)), ends, [order for _, _, order in bonded])
+    drawBonds(ax, segments, widths)
+
+    symbols = [symbol for symbol, keep in zip(LewisStructure["atoms"], placed) if keep]
+    drawAtoms(ax, symbols, positions[placed])
+
+    # Formatting
+    ax.set_box_aspect([1, 1, 1])
+    ax.set_xlim(-2, 2)
+    ax.set_ylim(-2, 2)
+    ax.set_zlim(-2, 2)
+    ax.axis('off')
+
+def drawMolecule(LewisStructure, show=True):
+    # Interactive figure through pyplot; returns (fig, ax)
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    drawMoleculeOn(ax, LewisStructure)
+
+    plt.tight_layout()
+    if show:
+        plt.show()
+
+    return fig, ax
+
+def renderMolecule(LewisStructure, path, size=(4, 4), dpi=100, format=None):
+    # Writes the molecule to an image file without a display. The format comes from the
+    # extension (e.g. .png or .svg) unless given, which file objects such as BytesIO need.
+    fig = Figure(figsize=size, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection='3d')
+    fig.subplots_adjust(0, 0, 1, 1)   # the axes are hidden; a fixed layout avoids tight_layout's extra draw
+    drawMoleculeOn(ax, LewisStructure)
+    fig.savefig(path, format=format)
+    return path
+
+def imagePath(outDir, formula, format):
+    safe_name = re.sub(r'[^\w\-]', '_', formula)
+    return os.path.join(outDir, f"{safe_name}.{format}")
+
+def _renderChunk(formulas, outDir, format, size, dpi):
+    from SimpleCompound import SimpleCompound
+
+    results = []
+    for formula in formulas:
+        try:
+            path = renderMolecule(SimpleCompound(formula).vseprSnapshot(), imagePath(outDir, formula, format), size, dpi)
+            results.append((formula, path, None))
+        except Exception as e:
+            results.append((formula, None, f"{type(e).__name__}: {e}"))
+    return results
+
+def exportImages(formulas, outDir, format="png", processes=None, chunksize=32, size=(4, 4), dpi=100):
+    # Renders one image per formula into outDir across a process pool.
+    # Yields (formula, path, error) in input order; path is None and error set when a formula fails.
+    os.makedirs(outDir, exist_ok=True)
+    formulas = iter(formulas)
+    chunks = iter(lambda: list(islice(formulas, chunksize)), [])
+    processes = processes or os.cpu_count() or 1
+
+    if processes == 1:
+        for chunk in chunks:
+            yield from _renderChunk(chunk, outDir, format, size, dpi)
+        return
+
+    # at most 2 * processes chunks in flight, as in pubchemListing.classifyRecords
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_renderChunk, chunk, outDir, format, size, dpi))
+            if len(pending) >= 2 * processes:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+
+def addArguments(parser):
+    parser.add_argument("formulas", help="file with one formula per line, e.g. filtered_compounds.txt")
+    parser.add_argument("--out-dir", default="images")
+    parser.add_argument("--format", choices=["png", "svg"], default="png")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--size", type=float, default=4, help="image size in inches")
+    parser.add_argument("--dpi", type=int, default=100)
+
+def run(args):
+    with open(args.formulas, "r") as f:
+        formulas = [line.strip() for line in f if line.strip()]
+
+    written = failed = 0
+    for formula, path, error in exportImages(formulas, args.out_dir, args.format, args.processes,
+                                             size=(args.size, args.size), dpi=args.dpi):
+        if error is None:
+            written += 1
+        else:
+            failed += 1
+            print(f"{formula}: {error}")
+    print(f"{written} images written to {args.out_dir}, {failed} failed")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render images for a list of formulas")
+    addArguments(parser)
+    run(parser.parse_args())
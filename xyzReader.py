@@ -0,0 +1,160 @@
+from dataCollection import getElementTable
+
+from collections import namedtuple
+from itertools import islice
+import mmap
+import os
+
+import numpy as np
+
+# Multi-frame XYZ files: every frame is an atom count line, a comment line and one
+# "symbol x y z [extra columns]" line per atom.
+#
+# readFrames streams a trajectory one frame at a time. XYZTrajectory memory-maps the file
+# and builds a byte-offset index of the frames for random access; the index can be saved
+# next to the file and is itself loaded memory-mapped. Either way each frame's atom block
+# is parsed in bulk rather than line by line.
+
+XYZFrame = namedtuple("XYZFrame", ["numbers", "coords", "comment"])  # (n,) atomic numbers, (n, 3) angstroms
+
+INDEX_SUFFIX = ".idx.npy"
+
+def parseAtomBlock(block, n_atoms):
+    # block: bytes holding exactly n_atoms atom lines. Returns (numbers, coords)
+    tokens = block.split()
+    if len(tokens) == 4 * n_atoms:
+        symbols = tokens[0::4]
+        del tokens[0::4]
+        coords = np.array(tokens, dtype=float).reshape(n_atoms, 3)
+    else:
+        # extra columns (charges, forces, ...): keep the first four of every line
+        rows = [line.split()[:4] for line in block.splitlines() if line.strip()]
+        if len(rows) != n_atoms or any(len(row) < 4 for row in rows):
+            raise ValueError(f"expected {n_atoms} atom lines")
+        symbols = [row[0] for row in rows]
+        coords = np.array([row[1:] for row in rows], dtype=float).reshape(n_atoms, 3)
+
+    return symbolNumbers(symbols), coords
+
+_symbolLookup = None
+
+def symbolNumbers(symbols):
+    # Atomic numbers for a list of element symbols (bytes or str); numeric symbols are taken as atomic numbers
+    global _symbolLookup
+    if _symbolLookup is None:
+        index = getElementTable().index
+        _symbolLookup = {**index, **{symbol.encode(): number for symbol, number in index.items()}}
+
+    try:
+        return np.fromiter(map(_symbolLookup.__getitem__, symbols), dtype=np.int64, count=len(symbols))
+    except KeyError:
+        pass
+
+    numbers = []
+    for symbol in symbols:
+        text = symbol.decode() if isinstance(symbol, bytes) else symbol
+        if text.isdigit():
+            numbers.append(int(text))
+        elif text in _symbolLookup:
+            numbers.append(_symbolLookup[text])
+        else:
+            raise KeyError(f"unknown element {text!r}")
+    return np.array(numbers, dtype=np.int64)
+
+def readFrames(path):
+    # Yields XYZFrames one at a time; only the current frame is held in memory
+    with open(path, "rb") as file:
+        while True:
+            header = file.readline()
+            if not header.strip():
+                return  # end of file (or trailing blank lines)
+
+            n_atoms = int(header.split()[0])
+            comment = file.readline().decode().rstrip("\r\n")
+            block = b"".join(islice(file, n_atoms))
+            numbers, coords = parseAtomBlock(block, n_atoms)
+            yield XYZFrame(numbers, coords, comment)
+
+def readFirstFrame(path):
+    return next(readFrames(path))
+
+def frameOffsets(buffer):
+    # Byte offset of every frame in an XYZ buffer, plus the buffer length as a final sentinel
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    lineStarts = np.concatenate(([0], np.flatnonzero(data == ord("\n")) + 1))
+
+    offsets = []
+    line = 0
+    while line < len(lineStarts) - 1:
+        start = lineStarts[line]
+        header = bytes(buffer[start:lineStarts[line + 1]]).strip()
+        if not header:
+            break
+        offsets.append(start)
+        line += int(header.split()[0]) + 2
+
+    offsets.append(len(data))
+    return np.array(offsets, dtype=np.int64)
+
+class XYZTrajectory:
+    # Random access to the frames of an XYZ file: len(trajectory), trajectory[i], iteration.
+    # With saveIndex the offsets are kept in <path>.idx.npy and reused while the file is unchanged.
+    def __init__(self, path, saveIndex=False):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.offsets = self._loadIndex(saveIndex)
+
+    def _fingerprint(self):
+        stat = os.stat(self.path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def _loadIndex(self, saveIndex):
+        # stored layout: [size, mtime_ns, offset_0, ..., offset_n, len]
+        indexPath = self.path + INDEX_SUFFIX
+        fingerprint = self._fingerprint()
+
+        if saveIndex and os.path.exists(indexPath):
+            try:
+                stored = np.load(indexPath, mmap_mode="r")
+                if np.array_equal(stored[:2], fingerprint):
+                    return stored[2:]
+            except (OSError, ValueError):
+                pass  # unreadable index, rebuild below
+
+        offsets = frameOffsets(self.buffer)
+        if saveIndex:
+            try:
+                np.save(indexPath, np.concatenate((fingerprint, offsets)))
+            except OSError:
+                pass  # read-only directory, keep the in-memory index
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"frame {i} out of range for {len(self)} frames")
+
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        header, comment, block = self.buffer[start:end].split(b"\n", 2)
+        numbers, coords = parseAtomBlock(block, int(header.split()[0]))
+        return XYZFrame(numbers, coords, comment.decode().rstrip("\r"))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()